@@ -3,6 +3,8 @@ Django settings for backend project.
 """
 import os
 from pathlib import Path
+
+import django
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -48,6 +50,8 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    "equipment.middleware.MetricsMiddleware", # First, so it times the whole stack
+    "equipment.middleware.RequestSizeLimitMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware", # Add whitenoise middleware
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -86,8 +90,16 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Keep connections open between requests (WAL and the other pragmas are set per connection)
+        "CONN_MAX_AGE": int(os.getenv('EQUIPMENT_DB_CONN_MAX_AGE', '600')),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
     }
 }
+if django.VERSION >= (5, 1):
+    # Take the write lock when a transaction starts, so the busy timeout applies instead of a
+    # "database is locked" error when a reading transaction later tries to write
+    DATABASES["default"]["OPTIONS"]["transaction_mode"] = "IMMEDIATE"
 
 # Vercel / Serverless Hack: Use /tmp for SQLite if generic Read-Only error occurs
 if os.environ.get('VERCEL'):
@@ -103,6 +115,19 @@ if os.environ.get('VERCEL'):
             print(f"DEBUG: Template DB not found at {template_db}")
             
     DATABASES['default']['NAME'] = db_path
+    # No background processes on serverless: run async upload jobs in the request
+    os.environ.setdefault('EQUIPMENT_JOB_WORKERS', '0')
+    os.environ.setdefault('EQUIPMENT_JOB_SPOOL_DIR', '/tmp/spool')
+    os.environ.setdefault('EQUIPMENT_BATCH_WORKERS', '0')
+    os.environ.setdefault('EQUIPMENT_CACHE_DIR', '/tmp/cache')
+
+# Shared by every server worker and job process, so invalidating the cached history reaches all of them
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.getenv('EQUIPMENT_CACHE_DIR', str(BASE_DIR / 'cache')),
+    }
+}
 
 
 # Password validation
@@ -150,3 +175,63 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
+
+# Equipment upload ingestion
+# --------------------------
+# Uploads larger than this many bytes are parsed in chunks instead of in one go
+EQUIPMENT_STREAM_THRESHOLD = int(os.getenv('EQUIPMENT_STREAM_THRESHOLD', str(32 * 1024 * 1024)))
+# Rows per chunk when streaming
+EQUIPMENT_INGEST_CHUNK_ROWS = int(os.getenv('EQUIPMENT_INGEST_CHUNK_ROWS', '100000'))
+# Raw rows are stored in EquipmentReading using INSERT batches of this size
+EQUIPMENT_READING_BATCH_SIZE = int(os.getenv('EQUIPMENT_READING_BATCH_SIZE', '10000'))
+# Answer re-uploads of identical files (same SHA-256) from the stored summary.
+# Set to False to always parse and store a fresh upload.
+EQUIPMENT_UPLOAD_DEDUP = os.getenv('EQUIPMENT_UPLOAD_DEDUP', 'True') == 'True'
+# Worker processes for ?mode=async uploads (0 runs jobs inside the request)
+EQUIPMENT_JOB_WORKERS = int(os.getenv('EQUIPMENT_JOB_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+# Where async uploads are spooled until a worker picks them up
+EQUIPMENT_JOB_SPOOL_DIR = os.getenv('EQUIPMENT_JOB_SPOOL_DIR', str(BASE_DIR / 'spool'))
+# Seconds a job event stream stays open (holding a server thread); clients then reconnect
+EQUIPMENT_EVENTS_MAX_SECONDS = int(os.getenv('EQUIPMENT_EVENTS_MAX_SECONDS', '120'))
+# Upper bound on rendered PDF reports kept in memory per process
+EQUIPMENT_REPORT_CACHE_BYTES = int(os.getenv('EQUIPMENT_REPORT_CACHE_BYTES', str(16 * 1024 * 1024)))
+# Accuracy/size trade-off of the stored quantile sketches (rank error ~1/k)
+EQUIPMENT_SKETCH_K = int(os.getenv('EQUIPMENT_SKETCH_K', '128'))
+# Largest point budget a client may request from /api/series/
+EQUIPMENT_SERIES_MAX_POINTS = int(os.getenv('EQUIPMENT_SERIES_MAX_POINTS', '10000'))
+# Most anomalies stored per upload (the strongest are kept; the total is always exact)
+EQUIPMENT_ANOMALY_LIMIT = int(os.getenv('EQUIPMENT_ANOMALY_LIMIT', '500'))
+# Send per-phase timings to clients in a Server-Timing response header
+EQUIPMENT_SERVER_TIMING = os.getenv('EQUIPMENT_SERVER_TIMING', 'False') == 'True'
+# Bearer token required by /api/metrics; empty leaves it open (e.g. behind a private network)
+EQUIPMENT_METRICS_TOKEN = os.getenv('EQUIPMENT_METRICS_TOKEN', '')
+# Processes parsing the files of one batch upload (0: parse them in the request thread)
+EQUIPMENT_BATCH_WORKERS = int(os.getenv('EQUIPMENT_BATCH_WORKERS', str(os.cpu_count() or 1)))
+# Most files accepted in one batch upload (zip members included)
+EQUIPMENT_BATCH_MAX_FILES = int(os.getenv('EQUIPMENT_BATCH_MAX_FILES', '100'))
+# Seconds an SQLite connection waits for another writer before giving up
+EQUIPMENT_SQLITE_BUSY_TIMEOUT = float(os.getenv('EQUIPMENT_SQLITE_BUSY_TIMEOUT', '30'))
+# SQLite page cache, in MiB, of the connection holding the write lock (inserts maintain several indexes)
+EQUIPMENT_SQLITE_WRITE_CACHE_MB = int(os.getenv('EQUIPMENT_SQLITE_WRITE_CACHE_MB', '128'))
+# Largest request body accepted, in bytes (0: no limit); larger uploads get 413
+EQUIPMENT_MAX_UPLOAD_BYTES = int(os.getenv('EQUIPMENT_MAX_UPLOAD_BYTES', str(1024 * 1024 * 1024)))
+
+# Upload retention (see equipment.retention); a limit of 0 turns that policy off
+# ------------------------------------------------------------------------------
+# Keep only the newest N uploads
+EQUIPMENT_RETENTION_KEEP_LAST = int(os.getenv('EQUIPMENT_RETENTION_KEEP_LAST', '5'))
+# Delete uploads older than this many days
+EQUIPMENT_RETENTION_MAX_AGE_DAYS = float(os.getenv('EQUIPMENT_RETENTION_MAX_AGE_DAYS', '0'))
+# Keep at most this many stored readings across all uploads
+EQUIPMENT_RETENTION_MAX_ROWS = int(os.getenv('EQUIPMENT_RETENTION_MAX_ROWS', '0'))
+# Keep at most about this many bytes of stored readings (estimated, see below)
+EQUIPMENT_RETENTION_MAX_BYTES = int(os.getenv('EQUIPMENT_RETENTION_MAX_BYTES', '0'))
+# Estimated database bytes per stored reading, indexes included (measured ~107 in SQLite)
+EQUIPMENT_RETENTION_ROW_BYTES = int(os.getenv('EQUIPMENT_RETENTION_ROW_BYTES', '110'))
+# Readings deleted per transaction, so uploads are never blocked behind one huge delete
+EQUIPMENT_RETENTION_BATCH_SIZE = int(os.getenv('EQUIPMENT_RETENTION_BATCH_SIZE', '20000'))
+# Seconds between background retention sweeps in server processes (0: only `manage.py prune_uploads`)
+EQUIPMENT_RETENTION_SWEEP_SECONDS = float(os.getenv('EQUIPMENT_RETENTION_SWEEP_SECONDS', '300'))
+
+# Rows fetched from the database per step of an /api/export/ stream (also the Parquet row group size)
+EQUIPMENT_EXPORT_CHUNK_ROWS = int(os.getenv('EQUIPMENT_EXPORT_CHUNK_ROWS', '50000'))
@@ -0,0 +1,12 @@
+"""
+Benchmarks for the equipment backend.
+
+Run from the backend/ directory, e.g. ``python -m benchmarks.bench_statistics``.
+"""
+import os
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
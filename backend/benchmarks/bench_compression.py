@@ -0,0 +1,75 @@
+"""
+Bytes sent and wall time of a compressed upload, per codec.
+
+For each codec, the generated CSV is compressed on the "client", sent over
+a simulated link of --link-mbps, and parsed on the "server" through the
+streaming decompressor (equipment.ingest.iter_chunks, chunked like the
+upload endpoint would). Wall time = compress + transfer + parse. zstd is
+skipped when zstandard is not installed.
+"""
+import argparse
+import bz2
+import gzip
+import io
+import lzma
+import sys
+import time
+
+from . import setup_django
+from .data import equipment_frame
+
+
+def codecs():
+    from equipment.compression import zstandard
+
+    available = {
+        'none': lambda data: data,
+        'gzip': lambda data: gzip.compress(data, compresslevel=6),
+        'bz2': bz2.compress,
+        'xz': lambda data: lzma.compress(data, preset=1),
+    }
+    if zstandard is not None:
+        available['zstd'] = zstandard.ZstdCompressor(level=3).compress
+    return available
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--link-mbps', type=float, default=10.0, help='simulated upload bandwidth')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from equipment.ingest import chunk_rows_for, iter_chunks
+
+    content = equipment_frame(args.rows).to_csv(index=False).encode()
+
+    def parse(payload):
+        file_obj = SimpleUploadedFile('equipment.csv', payload)
+        rows = 0
+        for chunk in iter_chunks(file_obj, chunk_rows_for(file_obj)):
+            rows += len(chunk)
+        return rows
+
+    print(f"rows={args.rows} csv={len(content) / 2**20:.1f}MiB link={args.link_mbps:g}Mbit/s")
+    for name, compress in codecs().items():
+        payload, compress_time = timed(lambda: compress(content))
+        transfer_time = len(payload) * 8 / (args.link_mbps * 1e6)
+        rows, parse_time = timed(lambda: parse(payload))
+        assert rows == args.rows
+        wall = compress_time + transfer_time + parse_time
+        print(f"codec={name:5} sent={len(payload) / 2**20:6.1f}MiB ratio={len(content) / len(payload):4.1f}x "
+              f"compress={compress_time:5.2f}s transfer={transfer_time:6.2f}s parse={parse_time:5.2f}s "
+              f"wall={wall:6.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Benchmark the upload, history and report endpoints end to end.
+
+Requests go through Django's test client against a throwaway SQLite
+database, so the numbers include multipart parsing, ingest, the database
+writes and response rendering. For every file size this measures:
+
+- upload: POST /api/upload/ with a generated CSV (dedup off, so every
+  repeat is a real ingest)
+- history: GET /api/history/ (answered from the history cache after the
+  first run, as an unchanged poll is)
+- report: GET /api/report/?id=... with the report cache cleared, i.e. a
+  cold render
+
+Each case records the best wall time of --repeat runs, plus the peak
+Python memory (tracemalloc) and the number of SQL queries of one extra
+traced run. --save writes the results to a JSON baseline; later runs
+compare against it and exit non-zero when a case is slower or uses more
+memory than the baseline by more than the thresholds, or runs more
+queries. Timings are only comparable on the same machine.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+from . import setup_django
+from .data import write_equipment_csv
+
+DEFAULT_BASELINE = Path(__file__).parent / 'baselines' / 'endpoints.json'
+TIME_THRESHOLD = 0.25
+MEMORY_THRESHOLD = 0.25
+# Slowdowns smaller than this are timer noise on millisecond-scale cases
+TIME_SLACK = 0.01
+SUFFIXES = {'k': 1_000, 'm': 1_000_000}
+
+
+def parse_rows(value):
+    """'1k' -> 1000, '10M' -> 10000000."""
+    multiplier = SUFFIXES.get(value[-1:].lower(), 1)
+    digits = value[:-1] if multiplier > 1 else value
+    return int(float(digits) * multiplier)
+
+
+def measure(fn, repeat):
+    """Best wall time of `repeat` runs, then peak memory and query count of one traced run."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': round(min(times), 4), 'peak_mib': round(peak / 2**20, 2), 'queries': len(queries)}
+
+
+def compare(results, baseline, time_threshold, memory_threshold):
+    """Regression messages for cases present in both runs."""
+    failures = []
+    for case, current in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        if current['seconds'] > base['seconds'] * (1 + time_threshold) + TIME_SLACK:
+            failures.append(f"{case}: {current['seconds']:.3f}s vs {base['seconds']:.3f}s")
+        if current['peak_mib'] > base['peak_mib'] * (1 + memory_threshold):
+            failures.append(f"{case}: peak {current['peak_mib']:.1f}MiB vs {base['peak_mib']:.1f}MiB")
+        if current['queries'] > base['queries']:
+            failures.append(f"{case}: {current['queries']} queries vs {base['queries']}")
+    return failures
+
+
+def run(args):
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import override_settings
+    from equipment.reports import report_cache
+
+    client = Client()
+    results = {}
+    private_cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    with tempfile.TemporaryDirectory() as tmp, override_settings(EQUIPMENT_UPLOAD_DEDUP=False, CACHES=private_cache):
+        # A file, not the in-memory default, so writes cost what they do in production
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            client.force_login(get_user_model().objects.create_user('bench', password='bench'))
+            for rows in args.rows:
+                path = write_equipment_csv(os.path.join(tmp, f'{rows}.csv'), rows, type_count=args.types,
+                                           bad_share=args.bad_share, seed=args.seed)
+                latest = {}
+
+                def upload():
+                    with open(path, 'rb') as f:
+                        response = client.post('/api/upload/', {'file': f})
+                    if response.status_code != 201:
+                        raise RuntimeError(f'upload failed: {response.status_code} {response.content[:200]!r}')
+                    latest['id'] = response.json()['id']
+
+                def history():
+                    response = client.get('/api/history/')
+                    assert response.status_code == 200, response.status_code
+
+                def report():
+                    report_cache.clear()
+                    response = client.get('/api/report/', {'id': latest['id']})
+                    assert response.status_code == 200, response.status_code
+
+                for name, fn in (('upload', upload), ('history', history), ('report', report)):
+                    case = f'{name}/{rows}'
+                    results[case] = measure(fn, args.repeat)
+                    r = results[case]
+                    print(f"{case:<20} {r['seconds'] * 1000:10.1f}ms {r['peak_mib']:9.1f}MiB {r['queries']:6} queries")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=parse_rows, nargs='+', default=[1_000, 100_000, 1_000_000],
+                        help='file sizes in rows, e.g. 1k 100k 1M 10M')
+    parser.add_argument('--types', type=int, default=5, help='number of distinct Types')
+    parser.add_argument('--bad-share', type=float, default=0.01, help='share of spoilt numeric cells')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--time-threshold', type=float, default=TIME_THRESHOLD)
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD)
+    args = parser.parse_args()
+
+    setup_django()
+    results = run(args)
+
+    if args.save:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps({
+            'created': datetime.now(timezone.utc).isoformat(),
+            'machine': platform.platform(),
+            'python': platform.python_version(),
+            'params': {'types': args.types, 'bad_share': args.bad_share, 'seed': args.seed},
+            'results': results,
+        }, indent=2) + '\n')
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save to create one")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    params = {'types': args.types, 'bad_share': args.bad_share, 'seed': args.seed}
+    if baseline.get('params') != params:
+        print(f"FAIL: baseline was recorded with {baseline.get('params')}, this run used {params}")
+        return 1
+    failures = compare(results, baseline['results'], args.time_threshold, args.memory_threshold)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
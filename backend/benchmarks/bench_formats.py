@@ -0,0 +1,70 @@
+"""
+Compare ingest of the same data uploaded as CSV, Parquet, Feather and Arrow IPC.
+
+Times the format-dependent part of an upload: parse, validate and
+aggregate (equipment.ingest.iter_chunks plus the running summary and
+sketches), chunked like the upload endpoint would chunk a file that size.
+The database insert is the same for every format and is left out. Needs
+pyarrow. Exits non-zero when a columnar format is not faster than CSV.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from . import setup_django
+from .bench_statistics import best_of
+from .data import equipment_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.files import File
+    from equipment.ingest import RunningSummary, chunk_rows_for, iter_chunks
+    from equipment.readers import HAS_PYARROW
+    from equipment.sketches import UploadSketch
+
+    if not HAS_PYARROW:
+        print("SKIP: pyarrow is not installed")
+        return 0
+
+    writers = {
+        'csv': lambda df, path: df.to_csv(path, index=False),
+        'parquet': lambda df, path: df.to_parquet(path),
+        'feather': lambda df, path: df.to_feather(path),
+    }
+
+    def ingest(path):
+        with open(path, 'rb') as f:
+            file_obj = File(f)
+            summary, sketch = RunningSummary(), UploadSketch()
+            for chunk in iter_chunks(file_obj, chunk_rows_for(file_obj)):
+                summary.update(chunk)
+                sketch.update(chunk)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            df = equipment_frame(rows)
+            timings = {}
+            for fmt, write in writers.items():
+                path = os.path.join(tmp, f'{rows}.{fmt}')
+                write(df, path)
+                timings[fmt] = best_of(args.repeat, lambda: ingest(path))
+                print(f"rows={rows} format={fmt} size={os.path.getsize(path) / 2**20:.1f}MiB "
+                      f"ingest={timings[fmt] * 1000:.0f}ms speedup={timings['csv'] / timings[fmt]:.1f}x")
+                os.unlink(path)
+            slower = [fmt for fmt in writers if fmt != 'csv' and timings[fmt] >= timings['csv']]
+            if slower:
+                print(f"FAIL: {', '.join(slower)} not faster than CSV at {rows} rows")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
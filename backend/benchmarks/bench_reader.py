@@ -0,0 +1,59 @@
+"""
+Compare the upload CSV reader with the plain read it replaced, on a wide export.
+
+The baseline parses every column with type inference and then converts the
+numeric columns with pd.to_numeric. The tuned reader (equipment.ingest.
+iter_chunks) loads only the used columns with declared dtypes. Exits
+non-zero when the speedup is below MIN_SPEEDUP.
+"""
+import argparse
+import io
+import sys
+
+import pandas as pd
+
+from . import setup_django
+from .bench_statistics import best_of
+from .data import wide_csv
+
+MIN_SPEEDUP = 2.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--columns', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--chunk-rows', type=int, default=None, help='read in chunks, as for streamed uploads')
+    args = parser.parse_args()
+
+    setup_django()
+    from equipment.ingest import iter_chunks
+    from equipment.models import NUMERIC_COLUMNS
+    from equipment.readers import engine_for
+
+    content = wide_csv(args.rows, args.columns)
+
+    def baseline():
+        df = pd.read_csv(io.BytesIO(content))
+        for col in NUMERIC_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='raise')
+
+    def tuned():
+        for _ in iter_chunks(io.BytesIO(content), args.chunk_rows):
+            pass
+
+    before = best_of(args.repeat, baseline)
+    after = best_of(args.repeat, tuned)
+    speedup = before / after
+    print(f"rows={args.rows} columns={args.columns} size={len(content) / 2**20:.1f}MiB "
+          f"engine={engine_for(args.chunk_rows)} baseline={before * 1000:.0f}ms "
+          f"reader={after * 1000:.0f}ms speedup={speedup:.1f}x")
+    if speedup < MIN_SPEEDUP:
+        print(f"FAIL: reader is less than {MIN_SPEEDUP}x faster than the baseline")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Compare equipment.statistics.describe with the means-only summary it extends.
+
+Exits non-zero when describe() costs more than MAX_FACTOR times the
+baseline (three column means plus Type value_counts) on the same frame.
+"""
+import argparse
+import sys
+import time
+
+from . import setup_django
+from .data import equipment_frame
+
+MAX_FACTOR = 6.0
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from equipment.models import NUMERIC_COLUMNS
+    from equipment.statistics import describe
+
+    df = equipment_frame(args.rows)
+    # The readers load Type as a categorical (see equipment.readers.column_dtypes)
+    df['Type'] = df['Type'].astype('category')
+
+    def means_only():
+        for col in NUMERIC_COLUMNS:
+            df[col].mean()
+        df['Type'].value_counts()
+
+    baseline = best_of(args.repeat, means_only)
+    full = best_of(args.repeat, lambda: describe(df))
+    factor = full / baseline
+    print(f"rows={args.rows} means-only={baseline * 1000:.1f}ms describe={full * 1000:.1f}ms factor={factor:.2f}x")
+    if factor > MAX_FACTOR:
+        print(f"FAIL: describe() is more than {MAX_FACTOR}x the means-only cost")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
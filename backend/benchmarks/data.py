@@ -0,0 +1,70 @@
+"""Deterministic synthetic equipment data for benchmarks."""
+import numpy as np
+import pandas as pd
+
+DEFAULT_TYPES = ['Pump', 'Valve', 'Reactor', 'Compressor', 'Heat Exchanger']
+
+
+def equipment_frame(rows, types=DEFAULT_TYPES, seed=0):
+    """A validated-looking upload frame with `rows` rows."""
+    rng = np.random.default_rng(seed)
+    type_index = rng.integers(0, len(types), rows)
+    return pd.DataFrame({
+        'Equipment Name': [f'EQ-{i}' for i in range(rows)],
+        'Type': np.asarray(types, dtype=object)[type_index],
+        'Flowrate': rng.normal(120, 30, rows).round(2),
+        'Pressure': rng.normal(15, 4, rows).round(2),
+        'Temperature': rng.normal(80, 20, rows).round(2),
+    })
+
+
+def wide_csv(rows, columns=100, seed=0):
+    """CSV bytes of a plant export: the required columns among `columns` in total."""
+    rng = np.random.default_rng(seed)
+    df = equipment_frame(rows, seed=seed)
+    extra = columns - len(df.columns)
+    for i in range(extra):
+        # Mostly numeric sensor channels, with a few text columns mixed in
+        if i % 10 == 0:
+            df.insert(i % len(df.columns), f'Tag {i}', rng.choice(['ok', 'alarm', 'maint'], rows))
+        else:
+            df[f'Sensor {i}'] = rng.normal(0, 1, rows).round(3)
+    return df.to_csv(index=False).encode()
+
+
+def type_names(count):
+    """`count` distinct Type names: the usual five first, then numbered ones."""
+    if count <= len(DEFAULT_TYPES):
+        return DEFAULT_TYPES[:count]
+    return DEFAULT_TYPES + [f'Type {i}' for i in range(len(DEFAULT_TYPES), count)]
+
+
+def write_equipment_csv(path, rows, type_count=5, bad_share=0.0, seed=0, chunk_rows=1_000_000):
+    """
+    Write an equipment CSV with `rows` rows to `path`, `chunk_rows` at a time.
+
+    A `bad_share` fraction of the numeric cells is spoilt the way real
+    exports are: left blank, written as "N/A", or a reading off by a factor
+    of 100. All of these are accepted by the upload endpoint (blanks are
+    skipped, outliers end up as anomalies). The output depends only on the
+    arguments, so runs on different machines see the same bytes.
+    """
+    types = type_names(type_count)
+    columns = ['Flowrate', 'Pressure', 'Temperature']
+    with open(path, 'w', newline='') as f:
+        for start in range(0, rows, chunk_rows):
+            n = min(chunk_rows, rows - start)
+            rng = np.random.default_rng([seed, start])
+            df = equipment_frame(n, types=types, seed=[seed, start])
+            df['Equipment Name'] = [f'EQ-{i}' for i in range(start, start + n)]
+            if bad_share:
+                for col in columns:
+                    values = df[col].astype(object)
+                    bad = np.flatnonzero(rng.random(n) < bad_share)
+                    kind = rng.integers(0, 3, len(bad))
+                    values.iloc[bad[kind == 0]] = ''
+                    values.iloc[bad[kind == 1]] = 'N/A'
+                    values.iloc[bad[kind == 2]] = (df[col].iloc[bad[kind == 2]] * 100).round(2)
+                    df[col] = values
+            df.to_csv(f, index=False, header=start == 0)
+    return path
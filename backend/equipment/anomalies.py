@@ -0,0 +1,155 @@
+"""
+Out-of-family detection for uploaded readings.
+
+A value is flagged when, within its equipment Type, its robust z-score
+0.6745 * (x - median) / MAD exceeds ROBUST_Z_THRESHOLD or it lies outside
+the Tukey fences [Q1 - IQR_FACTOR * IQR, Q3 + IQR_FACTOR * IQR]. Everything
+is computed with groupby aggregations broadcast back to the rows by Type
+code, so no Python code runs per row.
+
+For whole-file uploads the per-Type references are exact. Streamed uploads
+take median and quartiles from the upload's quantile sketches and estimate
+MAD as IQR / 2 (exact for symmetric distributions), then flag a second read
+of the file chunk by chunk.
+
+Stored on UploadSummary.anomalies as::
+
+    {
+        "method": {"robust_z_threshold": 3.5, "iqr_factor": 1.5, "approximate": false},
+        "total": 12,
+        "items": [{"equipment_name": "Pump-7", "type": "Pump", "column": "Pressure",
+                   "value": 95.0, "median": 15.5, "robust_z": 42.1,
+                   "lower_fence": 12.0, "upper_fence": 19.0, "rules": ["robust_z", "iqr"]}, ...],
+    }
+
+Items are ordered by |robust_z|, largest first, and capped at
+EQUIPMENT_ANOMALY_LIMIT; "total" counts every flagged value.
+"""
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .models import NUMERIC_COLUMNS
+
+ROBUST_Z_THRESHOLD = 3.5
+IQR_FACTOR = 1.5
+REFERENCE_STATS = ['median', 'mad', 'q1', 'q3']
+
+
+def exact_reference(df):
+    """Per-Type median, MAD and quartiles of a whole frame, indexed by Type."""
+    # Factorize once; every aggregate below then groups on small integer codes
+    codes, types = pd.factorize(df['Type'])
+    # A blank Type gets code -1: those rows have no family to compare against
+    known = codes >= 0
+    values = df.loc[known, NUMERIC_COLUMNS]
+    codes = codes[known]
+    grouped = values.groupby(codes, sort=True)
+    median = grouped.median()
+    deviation = (values - median.to_numpy()[codes]).abs()
+    mad = deviation.groupby(codes, sort=True).median()
+    quartiles = grouped.quantile([0.25, 0.75])
+    reference = pd.concat({
+        'median': median,
+        'mad': mad,
+        'q1': quartiles.xs(0.25, level=1),
+        'q3': quartiles.xs(0.75, level=1),
+    }, axis=1)
+    reference.index = pd.Index(types.astype(str)[reference.index])
+    return reference
+
+
+def sketch_reference(sketch):
+    """The same reference frame, estimated from an UploadSketch."""
+    rows = {}
+    for type_name, columns in sketch.by_type.items():
+        row = {}
+        for col in NUMERIC_COLUMNS:
+            q1, median, q3 = columns[col].kll.quantiles([0.25, 0.5, 0.75])
+            row.update({('median', col): median, ('mad', col): (q3 - q1) / 2, ('q1', col): q1, ('q3', col): q3})
+        rows[type_name] = row
+    reference = pd.DataFrame.from_dict(rows, orient='index')
+    if reference.empty:
+        return reference
+    return reference.reindex(columns=pd.MultiIndex.from_product([REFERENCE_STATS, NUMERIC_COLUMNS]))
+
+
+class AnomalyCollector:
+    """Flags chunks against a reference and keeps the strongest items."""
+
+    def __init__(self, reference, approximate=False, limit=None):
+        self.reference = reference
+        self.approximate = approximate
+        self.limit = limit if limit is not None else settings.EQUIPMENT_ANOMALY_LIMIT
+        self.total = 0
+        self._items = []
+
+    def update(self, df):
+        if self.reference.empty or df.empty:
+            return
+        # Reference rows broadcast to every reading; unseen and blank Types get the NaN row (-1)
+        positions = self.reference.index.get_indexer(df['Type'])
+        median, mad, q1, q3 = (
+            np.vstack([self.reference[stat].to_numpy(dtype=float), np.full(len(NUMERIC_COLUMNS), np.nan)])[positions]
+            for stat in REFERENCE_STATS
+        )
+        values = df[NUMERIC_COLUMNS].to_numpy(dtype=float)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            robust_z = 0.6745 * (values - median) / mad
+        # MAD of 0 (over half the Type identical) leaves only the IQR rule
+        robust_z[~np.isfinite(robust_z)] = np.nan
+        iqr = q3 - q1
+        lower = q1 - IQR_FACTOR * iqr
+        upper = q3 + IQR_FACTOR * iqr
+        z_flag = np.abs(robust_z) > ROBUST_Z_THRESHOLD
+        iqr_flag = (values < lower) | (values > upper)
+        flagged = z_flag | iqr_flag
+
+        rows, cols = np.nonzero(flagged)
+        if not len(rows):
+            return
+        self.total += len(rows)
+        score = np.nan_to_num(np.abs(robust_z[rows, cols]), nan=0.0)
+        # Only the strongest `limit` of this chunk can make the final list
+        order = np.argsort(-score, kind='stable')[:self.limit]
+        rows, cols = rows[order], cols[order]
+
+        names = df['Equipment Name'].iloc[rows].to_numpy()
+        types = df['Type'].iloc[rows].to_numpy()
+        for position, (row, col) in enumerate(zip(rows.tolist(), cols.tolist())):
+            z = robust_z[row, col]
+            name = names[position]
+            self._items.append({
+                'equipment_name': None if pd.isna(name) else str(name),
+                'type': str(types[position]),
+                'column': NUMERIC_COLUMNS[col],
+                'value': float(values[row, col]),
+                'median': float(median[row, col]),
+                'robust_z': None if np.isnan(z) else round(float(z), 3),
+                'lower_fence': float(lower[row, col]),
+                'upper_fence': float(upper[row, col]),
+                'rules': [rule for rule, hit in (('robust_z', z_flag[row, col]), ('iqr', iqr_flag[row, col])) if hit],
+            })
+        self._items.sort(key=lambda item: -abs(item['robust_z'] or 0.0))
+        del self._items[self.limit:]
+
+    def result(self):
+        return {
+            'method': {
+                'robust_z_threshold': ROBUST_Z_THRESHOLD,
+                'iqr_factor': IQR_FACTOR,
+                'approximate': self.approximate,
+            },
+            'total': self.total,
+            'items': list(self._items),
+        }
+
+
+def detect_anomalies(df):
+    """Exact anomaly detection over a whole upload frame."""
+    if df.empty:
+        return AnomalyCollector(pd.DataFrame()).result()
+    collector = AnomalyCollector(exact_reference(df))
+    collector.update(df)
+    return collector.result()
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class EquipmentConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
     name = "equipment"
+
+    def ready(self):
+        from .db import configure_connection
+        from .history import database_migrated, summary_changed
+        from .models import UploadSummary
+        connection_created.connect(configure_connection, dispatch_uid='equipment.configure_connection')
+        # bulk_create() sends no signals; batch uploads invalidate the history themselves
+        post_save.connect(summary_changed, sender=UploadSummary, dispatch_uid='equipment.history.saved')
+        post_delete.connect(summary_changed, sender=UploadSummary, dispatch_uid='equipment.history.deleted')
+        post_migrate.connect(database_migrated, sender=self, dispatch_uid='equipment.history.migrated')
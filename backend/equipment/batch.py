@@ -0,0 +1,204 @@
+"""
+Batch uploads: many equipment files (or a zip of them) in one request.
+
+The files are spooled to a temporary directory and parsed in parallel by a
+process pool started for the batch (EQUIPMENT_BATCH_WORKERS processes, at
+most one per file), each running the normal summarize() on one file and
+spooling its validated rows to disk next to it. Workers hand back only the
+summary values; the parent then stores every summary and, one file at a
+time and one chunk at a time from the spools, their rows in a single
+transaction. A file that fails validation is reported with its error and
+does not affect the others.
+
+Small batches are parsed in the request thread: starting the worker
+processes (each imports Django and pandas) costs more than parsing a few
+megabytes.
+"""
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from . import history, workers
+from .db import serialized_writes
+from .ingest import IngestError, find_duplicate, spooled_chunks
+from .metrics import timed
+from .models import NUMERIC_COLUMNS, EquipmentReading, UploadSummary
+
+# Below this many bytes in total a batch is parsed without worker processes
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+class BatchFile:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.content_sha256 = _sha256(path)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_zip(file_obj):
+    file_obj.seek(0)
+    magic = file_obj.read(len(ZIP_MAGIC))
+    file_obj.seek(0)
+    return magic == ZIP_MAGIC
+
+
+def spool(uploaded_files, directory):
+    """
+    Write the uploaded files to `directory` (expanding zip archives) and
+    return them as BatchFiles, in upload order.
+    """
+    files = []
+    for uploaded in uploaded_files:
+        if _is_zip(uploaded):
+            files.extend(_extract_zip(uploaded, directory, len(files)))
+            continue
+        path = os.path.join(directory, f'{len(files)}.upload')
+        with open(path, 'wb') as f:
+            for chunk in uploaded.chunks():
+                f.write(chunk)
+        files.append(BatchFile(uploaded.name, path))
+    if len(files) > settings.EQUIPMENT_BATCH_MAX_FILES:
+        raise IngestError(f'A batch may contain at most {settings.EQUIPMENT_BATCH_MAX_FILES} files')
+    return files
+
+
+def _extract_zip(uploaded, directory, offset):
+    try:
+        archive = zipfile.ZipFile(uploaded)
+    except zipfile.BadZipFile as e:
+        raise IngestError(f'Invalid zip file {uploaded.name}: {str(e)}')
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith('__MACOSX/')
+            and not os.path.basename(info.filename).startswith('.')
+        ]
+        if offset + len(members) > settings.EQUIPMENT_BATCH_MAX_FILES:
+            raise IngestError(f'A batch may contain at most {settings.EQUIPMENT_BATCH_MAX_FILES} files')
+        # The declared sizes are checked before anything is extracted
+        limit = settings.EQUIPMENT_MAX_UPLOAD_BYTES
+        if limit and sum(info.file_size for info in members) > limit:
+            raise IngestError(f'Zip file {uploaded.name} expands to more than {limit} bytes')
+        files = []
+        for info in members:
+            path = os.path.join(directory, f'{offset + len(files)}.upload')
+            with archive.open(info) as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            files.append(BatchFile(os.path.basename(info.filename), path))
+    return files
+
+
+def parse_all(files):
+    """summarize_file() results for `files`, in order; in worker processes if worthwhile."""
+    jobs = [(f.path, f.name) for f in files]
+    max_workers = min(settings.EQUIPMENT_BATCH_WORKERS, len(jobs))
+    if max_workers < 2 or sum(f.size for f in files) < PARALLEL_MIN_BYTES:
+        return [workers.summarize_file(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=workers.setup) as executor:
+        futures = [executor.submit(workers.summarize_file, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+
+def ingest_batch(uploaded_files):
+    """
+    Ingest a batch and return (results, summaries): one result dict per file
+    (the upload payload, or file_name and error) and the UploadSummaries
+    stored or found as duplicates.
+    """
+    with tempfile.TemporaryDirectory(prefix='equipment-batch-') as directory:
+        files = spool(uploaded_files, directory)
+        if not files:
+            raise IngestError('No files provided')
+
+        results = [None] * len(files)
+        summaries = [None] * len(files)
+        to_parse = []
+        # Repeats of a file earlier in the batch, by index of that first copy
+        first_seen = {}
+        repeats = []
+        for index, f in enumerate(files):
+            dedup = settings.EQUIPMENT_UPLOAD_DEDUP and f.content_sha256
+            cached = find_duplicate(f.content_sha256) if dedup else None
+            if cached:
+                summaries[index] = cached
+                results[index] = {**cached.as_payload(), 'file_name': f.name, 'cached': True}
+            elif dedup and f.content_sha256 in first_seen:
+                repeats.append((index, first_seen[f.content_sha256]))
+            else:
+                if dedup:
+                    first_seen[f.content_sha256] = index
+                to_parse.append(index)
+
+        with timed('parse'):
+            parsed = parse_all([files[index] for index in to_parse])
+
+        stored = []
+        for index, outcome in zip(to_parse, parsed):
+            if 'error' in outcome:
+                results[index] = {'file_name': files[index].name, 'error': outcome['error']}
+            else:
+                upload = UploadSummary(file_name=files[index].name, content_sha256=files[index].content_sha256,
+                                       **outcome['fields'])
+                stored.append((index, upload, outcome['rows_path']))
+
+        if stored:
+            with serialized_writes(), transaction.atomic():
+                UploadSummary.objects.bulk_create([upload for _, upload, _ in stored])
+                history.invalidate_on_commit()
+                with timed('insert'):
+                    for _, upload, rows_path in stored:
+                        for chunk in spooled_chunks(rows_path):
+                            EquipmentReading.objects.bulk_insert_frame(upload, chunk)
+            for index, upload, _ in stored:
+                summaries[index] = upload
+                results[index] = {**upload.as_payload(), 'file_name': upload.file_name, 'cached': False}
+        for index, first in repeats:
+            if summaries[first] is None:
+                results[index] = {**results[first], 'file_name': files[index].name}
+            else:
+                summaries[index] = summaries[first]
+                results[index] = {**summaries[first].as_payload(), 'file_name': files[index].name, 'cached': True}
+
+    return results, [summary for summary in summaries if summary is not None]
+
+
+def combine(summaries):
+    """Totals across `summaries`: row count, column means weighted by their non-blank counts, Type counts."""
+    combined = {"total_count": sum(int(s.total_equipment) for s in summaries)}
+    for col in NUMERIC_COLUMNS:
+        count = total = 0
+        for s in summaries:
+            if s.statistics:
+                stats = s.statistics['overall'][col]
+                n, mean = stats['count'], stats['mean']
+            else:
+                # Stored before statistics were kept: blanks cannot be told apart
+                n, mean = s.total_equipment, getattr(s, f'avg_{col.lower()}')
+            if n and mean is not None:
+                count += n
+                total += n * mean
+        combined[f"avg_{col.lower()}"] = round(total / count, 2) if count else None
+    type_counts = {}
+    for s in summaries:
+        for type_name, count in s.type_distribution.items():
+            type_counts[type_name] = type_counts.get(type_name, 0) + count
+    combined["type_distribution"] = dict(sorted(type_counts.items(), key=lambda item: -item[1]))
+    return combined
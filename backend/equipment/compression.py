@@ -0,0 +1,142 @@
+"""
+Transparent decompression of uploads.
+
+gzip, bz2, xz and zstd files are recognised by their magic bytes (the file
+name is not trusted) and read through a streaming decompressor, so the
+parser sees plain CSV, Parquet or Arrow bytes without the decompressed file
+ever being held in memory or written out. zstd needs the optional
+`zstandard` package.
+
+A decompressed stream cannot seek, but the readers rewind the upload to
+sniff its format and header; seek(0) therefore restarts decompression
+from the start of the compressed file, which is cheap for the few bytes
+read before the actual parse.
+
+A few kilobytes of compressed data can expand to gigabytes, so the
+decompressed bytes are counted as they are read and reading fails with
+DecompressionLimitExceeded past the given limit (for uploads,
+EQUIPMENT_MAX_UPLOAD_BYTES, the same limit as for plain request bodies).
+"""
+import bz2
+import gzip
+import io
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+BZ2 = 'bz2'
+XZ = 'xz'
+ZSTD = 'zstd'
+MAGIC_BYTES = [
+    (b'\x1f\x8b', GZIP),
+    (b'BZh', BZ2),
+    (b'\xfd7zXZ\x00', XZ),
+    (b'\x28\xb5\x2f\xfd', ZSTD),
+]
+
+
+class UnsupportedCompression(Exception):
+    """The upload is compressed with a codec this server cannot read."""
+
+
+class DecompressionLimitExceeded(Exception):
+    """A compressed upload expands to more bytes than allowed."""
+
+
+def detect_compression(file_obj):
+    """The codec `file_obj` is compressed with, or None; the file is rewound."""
+    file_obj.seek(0)
+    head = file_obj.read(6)
+    file_obj.seek(0)
+    for magic, codec in MAGIC_BYTES:
+        if head.startswith(magic):
+            return codec
+    return None
+
+
+def _open_stream(raw, codec):
+    if codec == GZIP:
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if codec == BZ2:
+        return bz2.BZ2File(raw, mode='rb')
+    if codec == XZ:
+        return lzma.LZMAFile(raw, mode='rb')
+    if zstandard is None:
+        raise UnsupportedCompression('zstd uploads need the zstandard package on the server')
+    reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=False)
+    return io.BufferedReader(reader)
+
+
+class DecompressedFile:
+    """
+    Read-only view of the decompressed bytes of `raw`; only rewinding is
+    supported. Reading more than `limit` bytes (if given) raises
+    DecompressionLimitExceeded.
+    """
+
+    def __init__(self, raw, codec, limit=None):
+        self.raw = raw
+        self.codec = codec
+        self.limit = limit
+        self.name = getattr(raw, 'name', None)
+        # Unknown until the whole stream has been read
+        self.size = None
+        self._open()
+
+    def _open(self):
+        self.raw.seek(0)
+        self._stream = _open_stream(self.raw, self.codec)
+        self._position = 0
+
+    def _bounded(self, size):
+        # One byte past the limit is enough to tell that it is exceeded
+        if self.limit and (size is None or size < 0 or size > self.limit - self._position):
+            return self.limit - self._position + 1
+        return size
+
+    def _advance(self, data):
+        self._position += len(data)
+        if self.limit and self._position > self.limit:
+            raise DecompressionLimitExceeded(f'Upload expands to more than {self.limit} bytes when decompressed')
+        return data
+
+    def read(self, size=-1):
+        return self._advance(self._stream.read(self._bounded(size)))
+
+    def readline(self, size=-1):
+        return self._advance(self._stream.readline(self._bounded(size)))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('compressed uploads can only be rewound')
+        self._open()
+        return 0
+
+    @property
+    def closed(self):
+        return self._stream.closed
+
+    def close(self):
+        # The upload itself belongs to the caller
+        self._stream.close()
+
+
+def open_upload(file_obj, limit=None):
+    """`file_obj`, or a DecompressedFile over it (reading at most `limit` bytes) when it is compressed."""
+    codec = detect_compression(file_obj)
+    if codec is None:
+        return file_obj
+    return DecompressedFile(file_obj, codec, limit)
@@ -0,0 +1,113 @@
+"""
+SQLite setup for concurrent use.
+
+Every new SQLite connection is switched to WAL, so readers (history,
+reports, job status) never wait for an upload in progress, with
+synchronous=NORMAL (safe in WAL mode; commits no longer fsync the main
+database file) and a busy timeout, so a writer waits for the lock instead
+of failing with "database is locked".
+
+SQLite allows one writer at a time. Instead of letting concurrent uploads
+contend for that lock (and time out behind a long ingest), writers queue
+in serialized_writes(): a lock shared by the threads of a process and, for
+a database file, an advisory file lock shared by all processes (server
+workers and the async job pool). Every write of the app goes through it:
+uploads and batches (only to store rows that are already parsed, see
+equipment.ingest), retention deletes and job status updates. The few
+writes Django makes on its own (sessions, admin) rely on the busy timeout,
+which must stay above the longest single insert.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single waitress process, so the thread lock is enough
+    fcntl = None
+
+_thread_lock = threading.RLock()
+_held = threading.local()
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created handler applying the pragmas above to SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(settings.EQUIPMENT_SQLITE_BUSY_TIMEOUT * 1000)}')
+
+
+@contextmanager
+def serialized_writes(using=DEFAULT_DB_ALIAS):
+    """Run the block as the only writer to the database; waits for the current writer. Reentrant."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or getattr(_held, 'depth', 0):
+        _held.depth = getattr(_held, 'depth', 0) + 1
+        try:
+            yield
+        finally:
+            _held.depth -= 1
+        return
+
+    with _thread_lock:
+        _held.depth = 1
+        try:
+            if fcntl is None or connection.is_in_memory_db():
+                with _writer_cache(connection):
+                    yield
+            else:
+                with open(f"{connection.settings_dict['NAME']}.write-lock", 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    try:
+                        with _writer_cache(connection):
+                            yield
+                    finally:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            _held.depth = 0
+
+
+@contextmanager
+def _writer_cache(connection):
+    # Bulk inserts update every index of the readings table at scattered pages; a
+    # larger page cache keeps them in memory. Only the single writer gets one.
+    size = settings.EQUIPMENT_SQLITE_WRITE_CACHE_MB
+    if not size:
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA cache_size')
+        previous = cursor.fetchone()[0]
+        cursor.execute(f'PRAGMA cache_size={-int(size * 1024)}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA cache_size={int(previous)}')
+
+
+@contextmanager
+def exclusive_task(name, using=DEFAULT_DB_ALIAS):
+    """
+    Yield True if this process may run the periodic task `name` now, False if
+    another process (sharing the database file) is already running it.
+    """
+    connection = connections[using]
+    if fcntl is None or connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        yield True
+        return
+    with open(f"{connection.settings_dict['NAME']}.{name}-lock", 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
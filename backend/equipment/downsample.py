@@ -0,0 +1,47 @@
+"""
+Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013).
+
+Reduces a long series to a fixed number of points while keeping its visual
+shape: the first and last points are kept, the rest is split into equal
+buckets and from each bucket the point forming the largest triangle with
+the previously kept point and the next bucket's average is chosen.
+"""
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """
+    Return the indices of the points LTTB keeps from `x`, `y`.
+
+    Bucket boundaries and bucket averages are computed for all buckets at
+    once; the remaining loop runs once per output point and each step is a
+    vectorized area computation over one bucket.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold - 2 buckets over the interior points [1, n - 1)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+    # The last bucket looks ahead to the final point
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((x[a] - next_x[i]) * (bucket_y - y[a]) - (x[a] - bucket_x) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
@@ -0,0 +1,98 @@
+"""
+Server-Sent Events for async upload jobs.
+
+GET /api/jobs/<id>/events/ answers with a text/event-stream that follows
+the job until it finishes:
+
+    event: progress   {job_id, state, phase, rows_processed, bytes_processed,
+                       bytes_total, running: {total_count, avg_*, type_distribution}}
+    event: done       the job status plus "summary", the upload payload
+    event: failed     the job status plus "error"
+
+A progress event is sent whenever the job's progress snapshot changes
+(the worker writes one per chunk), polled every POLL_INTERVAL seconds.
+While nothing changes, a comment line goes out every HEARTBEAT_SECONDS so
+proxies do not drop the connection as idle.
+
+A stream holds a server thread while it is open, so it ends after
+EQUIPMENT_EVENTS_MAX_SECONDS even if the job is still running; clients
+reconnect with the Last-Event-ID header, the new stream carries on the
+event ids from there and starts with the current progress. A progress
+event is a snapshot, so nothing sent in between needs replaying.
+"""
+import json
+import time
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+from .jobs import job_progress
+from .models import UploadJob
+
+POLL_INTERVAL = 0.5
+HEARTBEAT_SECONDS = 15
+# Client reconnection delay, in milliseconds
+RETRY_MS = 2000
+
+
+def sse(event, data, event_id=None):
+    """One event in the text/event-stream format."""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients ask for text/event-stream; an error response goes out as one 'error' event."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse('error', data).encode(self.charset)
+
+
+def parse_last_event_id(value):
+    """The event id in a Last-Event-ID header, or 0 when there is none (or it is not ours)."""
+    if value and value.isascii() and value.isdigit():
+        return int(value)
+    return 0
+
+
+def job_events(job_id, poll_interval=POLL_INTERVAL, heartbeat=HEARTBEAT_SECONDS, max_seconds=None,
+               last_event_id=0):
+    """
+    Yield the SSE stream for UploadJob `job_id` (which must exist), for at
+    most `max_seconds` (default EQUIPMENT_EVENTS_MAX_SECONDS), numbering
+    events after `last_event_id`.
+    """
+    if max_seconds is None:
+        max_seconds = settings.EQUIPMENT_EVENTS_MAX_SECONDS
+    yield f'retry: {RETRY_MS}\n\n'
+    start = last_sent = time.monotonic()
+    previous = None
+    event_id = last_event_id
+    while True:
+        job = UploadJob.objects.get(pk=job_id)
+        progress = job_progress(job)
+        if job.is_finished:
+            event_id += 1
+            if job.state == UploadJob.SUCCEEDED:
+                yield sse('done', {**progress, "summary": job.result}, event_id)
+            else:
+                yield sse('failed', {**progress, "error": job.error}, event_id)
+            return
+        now = time.monotonic()
+        if progress != previous:
+            event_id += 1
+            yield sse('progress', progress, event_id)
+            previous = progress
+            last_sent = now
+        elif now - last_sent >= heartbeat:
+            yield ': keep-alive\n\n'
+            last_sent = now
+        if now - start >= max_seconds:
+            return
+        time.sleep(poll_interval)
@@ -0,0 +1,240 @@
+"""
+Bulk export of stored uploads (/api/export/) for downstream systems.
+
+Two datasets: 'summaries' (one row per retained upload) and 'readings'
+(the stored rows of the uploads). Either one can be written as NDJSON, CSV,
+Parquet or an Arrow IPC stream; the columnar formats need pyarrow.
+
+Rows come from the database through QuerySet.iterator(), which fetches
+EQUIPMENT_EXPORT_CHUNK_ROWS rows at a time instead of the whole result,
+and each chunk is encoded and handed to the response before the next is
+fetched, so a worker's memory stays flat however many rows are exported.
+Parquet gets one row group per chunk and Arrow one record batch.
+
+JSON-valued summary columns (type_distribution, statistics, anomalies)
+are nested objects in NDJSON and JSON text in the other formats.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.conf import settings
+
+from .models import EquipmentReading, UploadSummary
+from .readers import HAS_PYARROW
+
+NDJSON = 'ndjson'
+CSV = 'csv'
+PARQUET = 'parquet'
+ARROW = 'arrow'
+FORMATS = {
+    NDJSON: ('application/x-ndjson', 'ndjson'),
+    CSV: ('text/csv', 'csv'),
+    PARQUET: ('application/vnd.apache.parquet', 'parquet'),
+    ARROW: ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# Exported columns per dataset, in default order, with their Arrow types
+DATASETS = {
+    'summaries': {
+        'model': UploadSummary,
+        'order_by': ('uploaded_at', 'id'),
+        'columns': {
+            'id': 'int64',
+            'file_name': 'string',
+            'uploaded_at': 'timestamp',
+            'total_equipment': 'int64',
+            'avg_flowrate': 'float64',
+            'avg_pressure': 'float64',
+            'avg_temperature': 'float64',
+            'type_distribution': 'json',
+            'content_sha256': 'string',
+            'statistics': 'json',
+            'anomalies': 'json',
+        },
+        # Large JSON documents are only exported when asked for
+        'default': ['id', 'file_name', 'uploaded_at', 'total_equipment', 'avg_flowrate', 'avg_pressure',
+                    'avg_temperature', 'type_distribution', 'content_sha256'],
+        'upload_field': 'id',
+    },
+    'readings': {
+        'model': EquipmentReading,
+        'order_by': ('upload_id', 'id'),
+        'columns': {
+            'upload_id': 'int64',
+            'equipment_name': 'string',
+            'equipment_type': 'string',
+            'flowrate': 'float64',
+            'pressure': 'float64',
+            'temperature': 'float64',
+            'timestamp': 'timestamp',
+        },
+        'default': ['upload_id', 'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature',
+                    'timestamp'],
+        'upload_field': 'upload_id',
+    },
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def parse_request(dataset, fmt, columns=None, uploads=None):
+    """
+    Validate export parameters (query string values, or None) and return
+    (dataset, format, column list, upload ids or None). Raises ExportError.
+    """
+    dataset = dataset or 'readings'
+    if dataset not in DATASETS:
+        raise ExportError(f"dataset must be one of: {', '.join(DATASETS)}")
+    fmt = fmt or NDJSON
+    if fmt not in FORMATS:
+        raise ExportError(f"format must be one of: {', '.join(FORMATS)}")
+    if fmt in (PARQUET, ARROW) and not HAS_PYARROW:
+        raise ExportError(f'{fmt} export is not supported on this server (pyarrow is not installed)')
+
+    spec = DATASETS[dataset]
+    if columns:
+        columns = list(dict.fromkeys(name.strip() for name in columns.split(',') if name.strip()))
+        unknown = [name for name in columns if name not in spec['columns']]
+        if unknown:
+            raise ExportError(f"Unknown columns for {dataset}: {', '.join(unknown)}")
+        if not columns:
+            raise ExportError('columns must name at least one column')
+    else:
+        columns = list(spec['default'])
+
+    if uploads:
+        try:
+            uploads = [int(value) for value in uploads.split(',')]
+        except ValueError:
+            raise ExportError('upload must be a comma-separated list of integers')
+    return dataset, fmt, columns, uploads or None
+
+
+def iter_chunks(dataset, columns, uploads=None, chunk_rows=None):
+    """Lists of row tuples (in `columns` order), EQUIPMENT_EXPORT_CHUNK_ROWS at a time."""
+    chunk_rows = chunk_rows or settings.EQUIPMENT_EXPORT_CHUNK_ROWS
+    spec = DATASETS[dataset]
+    rows = spec['model'].objects.order_by(*spec['order_by'])
+    if uploads:
+        rows = rows.filter(**{f"{spec['upload_field']}__in": uploads})
+    rows = rows.values_list(*columns).iterator(chunk_size=chunk_rows)
+    while True:
+        chunk = list(islice(rows, chunk_rows))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream(dataset, fmt, columns, uploads=None, chunk_rows=None):
+    """Yield the encoded export, one piece per chunk of rows."""
+    chunks = iter_chunks(dataset, columns, uploads, chunk_rows)
+    types = [DATASETS[dataset]['columns'][name] for name in columns]
+    if fmt == NDJSON:
+        return _ndjson(chunks, columns)
+    if fmt == CSV:
+        return _csv(chunks, columns, types)
+    return _arrow(chunks, columns, types, fmt)
+
+
+def _json_default(value):
+    # Datetimes are the only non-JSON values in the exported columns
+    return value.isoformat()
+
+
+# json.dumps() builds a new encoder per call when given default=
+_json_encoder = json.JSONEncoder(default=_json_default)
+
+
+def _ndjson(chunks, columns):
+    encode = _json_encoder.encode
+    for chunk in chunks:
+        yield ''.join([encode(dict(zip(columns, row))) + '\n' for row in chunk])
+
+
+def _csv(chunks, columns, types):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    json_columns = [i for i, kind in enumerate(types) if kind == 'json']
+    for chunk in chunks:
+        for row in chunk:
+            if json_columns:
+                row = list(row)
+                for i in json_columns:
+                    row[i] = json.dumps(row[i])
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _Sink:
+    """Write-only file for pyarrow writers; the bytes written so far are taken with drain()."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_schema(columns, types):
+    import pyarrow as pa
+
+    arrow_types = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'string': pa.string(),
+        'json': pa.string(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+    }
+    return pa.schema([pa.field(name, arrow_types[kind]) for name, kind in zip(columns, types)])
+
+
+def _arrow(chunks, columns, types, fmt):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(columns, types)
+    sink = _Sink()
+    if fmt == PARQUET:
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for chunk in chunks:
+            arrays = []
+            for values, kind, field in zip(zip(*chunk), types, schema):
+                if kind == 'json':
+                    values = [None if value is None else json.dumps(value) for value in values]
+                arrays.append(pa.array(values, type=field.type))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
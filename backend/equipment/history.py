@@ -0,0 +1,108 @@
+"""
+The upload history list (/api/history/), cached.
+
+Pages are in keyset order, newest first: a page's cursor encodes the
+(uploaded_at, id) of its last row and the next page starts after it, so a
+page costs the same however far back it is, and rows added meanwhile do not
+shift it.
+
+The history only changes when an upload is stored or deleted. Each such
+change (on commit) replaces a version token kept in Django's cache; a page
+is cached under the token and its parameters, and its ETag is derived from
+the same key, so an unchanged poll is answered with 304 or the cached JSON
+without querying the upload tables. The cache must be shared by all server
+and job processes for this (see CACHES in settings).
+"""
+import base64
+import hashlib
+import uuid
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from rest_framework.renderers import JSONRenderer
+
+from .models import UploadSummary
+
+HISTORY_FIELDS = ('id', 'file_name', 'uploaded_at', 'total_equipment', 'avg_flowrate', 'avg_pressure',
+                  'avg_temperature')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+VERSION_KEY = 'equipment:history:version'
+# Pages of replaced versions are never read again and expire on their own
+PAGE_TIMEOUT = 24 * 60 * 60
+
+
+def version():
+    """The current history version token."""
+    token = cache.get(VERSION_KEY)
+    if token is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        token = cache.get(VERSION_KEY)
+    return token
+
+
+def invalidate():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def invalidate_on_commit(using=DEFAULT_DB_ALIAS):
+    """Invalidate once the current transaction commits, so no reader caches the old rows after it."""
+    transaction.on_commit(invalidate, using=using)
+
+
+def summary_changed(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """post_save/post_delete handler for UploadSummary."""
+    invalidate_on_commit(using)
+
+
+def database_migrated(sender, **kwargs):
+    """post_migrate handler: a new or reset database must not be served pages cached for the old one."""
+    invalidate()
+
+
+def encode_cursor(row):
+    raw = f"{row['uploaded_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(uploaded_at, id) from a cursor; ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        uploaded_at, pk = raw.split('|')
+        return datetime.fromisoformat(uploaded_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def page_key(cursor, limit):
+    """Cache key of a page (also the base of its ETag) at the current version."""
+    return f"equipment:history:page:{version()}:{cursor or ''}:{limit}"
+
+
+def etag_for(key):
+    return f'"history-{hashlib.sha256(key.encode()).hexdigest()[:20]}"'
+
+
+def query_page(cursor, limit):
+    """(rows, next cursor or None) for the page after `cursor`."""
+    rows = UploadSummary.objects.order_by('-uploaded_at', '-id')
+    if cursor:
+        uploaded_at, pk = decode_cursor(cursor)
+        rows = rows.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk))
+    # One extra row tells whether there is a next page
+    rows = list(rows.values(*HISTORY_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def get_page(key, cursor, limit):
+    """(JSON bytes, next cursor) of a page, from the cache or the database."""
+    page = cache.get(key)
+    if page is None:
+        rows, next_cursor = query_page(cursor, limit)
+        page = (JSONRenderer().render(rows), next_cursor)
+        cache.set(key, page, timeout=PAGE_TIMEOUT)
+    return page
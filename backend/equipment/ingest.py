@@ -0,0 +1,393 @@
+"""
+Upload ingestion: parse an equipment file (CSV, Parquet, Feather or Arrow
+IPC) and reduce it to the values stored on UploadSummary.
+
+Uploads up to EQUIPMENT_STREAM_THRESHOLD bytes are parsed in one go.
+Anything larger, and every compressed upload (its decompressed size is
+unknown until it has been read), is read in chunks of EQUIPMENT_INGEST_CHUNK_ROWS rows, each chunk is
+validated on its own and folded into running aggregates, so peak memory
+depends on the chunk size rather than on the file size.
+
+Every upload is stored as one UploadSummary plus its raw rows as
+EquipmentReading, written in a single transaction. Anomaly detection needs
+per-Type references before it can flag anything, so streamed uploads are
+read a second time once their quantile sketches are complete.
+
+Parsing and aggregating take no database lock: validated chunks are set
+aside in a RowSpool file while the upload is read, and the transaction
+only covers inserting the finished summary and the spooled rows.
+"""
+import os
+import pickle
+import tempfile
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from .anomalies import AnomalyCollector, detect_anomalies, sketch_reference
+from .compression import DecompressionLimitExceeded, UnsupportedCompression, detect_compression, open_upload
+from .db import serialized_writes
+from .metrics import timed
+from .models import NUMERIC_COLUMNS, TIMESTAMP_COLUMN, EquipmentReading, UploadSummary
+from .readers import (CSV, HAS_PYARROW, columnar_columns, detect_format, local_path, missing_columns,
+                      non_numeric_column, read_columnar, read_csv, read_header)
+from .sketches import UploadSketch
+from .statistics import RunningStatistics, describe, fill_percentiles
+
+
+class IngestError(Exception):
+    """Raised when an upload cannot be ingested; the message is shown to the client."""
+
+
+def chunk_rows_for(file_obj):
+    """Return the chunk size to stream `file_obj` with, or None to read it whole."""
+    size = file_obj.size
+    if detect_compression(file_obj) or (size is not None and size > settings.EQUIPMENT_STREAM_THRESHOLD):
+        return settings.EQUIPMENT_INGEST_CHUNK_ROWS
+    return None
+
+
+def iter_chunks(file_obj, chunk_rows=None):
+    """
+    Yield validated DataFrames from an upload (CSV, Parquet, Feather or Arrow
+    IPC, optionally gzip/bz2/xz/zstd compressed).
+
+    With `chunk_rows=None` the whole file is yielded as a single frame. Only
+    the used columns are loaded (see equipment.readers); the numeric columns
+    (and the optional Timestamp column, as UTC) of every yielded frame have
+    already been converted. Compressed uploads may expand to at most
+    EQUIPMENT_MAX_UPLOAD_BYTES.
+    """
+    try:
+        source = open_upload(file_obj, settings.EQUIPMENT_MAX_UPLOAD_BYTES)
+    except UnsupportedCompression as e:
+        raise IngestError(str(e))
+    try:
+        try:
+            fmt = detect_format(source)
+        except DecompressionLimitExceeded as e:
+            raise IngestError(str(e))
+        except Exception as e:
+            # e.g. a truncated or corrupt compressed stream
+            raise IngestError(f'Could not read upload: {str(e)}')
+        if fmt == CSV:
+            chunks = _csv_chunks(source, chunk_rows)
+        else:
+            chunks = _columnar_chunks(source, fmt, chunk_rows)
+        try:
+            for chunk in chunks:
+                with timed('validate'):
+                    validate_numeric(chunk)
+                    if TIMESTAMP_COLUMN in chunk.columns:
+                        validate_timestamps(chunk)
+                yield chunk
+        except DecompressionLimitExceeded as e:
+            # e.g. while a columnar upload is decompressed to disk
+            raise IngestError(str(e))
+    finally:
+        if source is not file_obj:
+            source.close()
+
+
+def _check_columns(columns):
+    # Validate Columns from the header/schema alone, before parsing any data
+    missing = missing_columns(columns)
+    if missing:
+        raise IngestError(f'Missing columns: {", ".join(missing)}')
+
+
+def _csv_chunks(file_obj, chunk_rows):
+    try:
+        columns = read_header(file_obj)
+    except DecompressionLimitExceeded as e:
+        raise IngestError(str(e))
+    except Exception as e:
+        raise IngestError(f'Invalid CSV file: {str(e)}')
+    if not columns:
+        raise IngestError('Invalid CSV file: No columns to parse from file')
+    _check_columns(columns)
+
+    reader = read_csv(file_obj, columns, chunk_rows)
+    while True:
+        try:
+            with timed('read'):
+                chunk = next(reader)
+        except StopIteration:
+            break
+        except DecompressionLimitExceeded as e:
+            raise IngestError(str(e))
+        except pd.errors.ParserError as e:
+            raise IngestError(f'Invalid CSV file: {str(e)}')
+        except ValueError as e:
+            # Numeric columns are parsed as float64, so a bad value fails the read itself
+            col = non_numeric_column(file_obj)
+            if col:
+                raise IngestError(f'Column {col} must be numeric')
+            raise IngestError(f'Invalid CSV file: {str(e)}')
+        except Exception as e:
+            raise IngestError(f'Invalid CSV file: {str(e)}')
+        yield chunk
+
+
+def _columnar_chunks(file_obj, fmt, chunk_rows):
+    if not HAS_PYARROW:
+        raise IngestError(f'{fmt} uploads are not supported on this server (pyarrow is not installed)')
+    with local_path(file_obj) as path:
+        try:
+            columns = columnar_columns(path, fmt)
+        except Exception as e:
+            raise IngestError(f'Invalid {fmt} file: {str(e)}')
+        _check_columns(columns)
+
+        reader = read_columnar(path, fmt, columns, chunk_rows)
+        while True:
+            try:
+                with timed('read'):
+                    chunk = next(reader)
+            except StopIteration:
+                break
+            except Exception as e:
+                raise IngestError(f'Invalid {fmt} file: {str(e)}')
+            yield chunk
+
+
+def validate_numeric(df):
+    """Convert the numeric columns in place, raising IngestError on bad values."""
+    for col in NUMERIC_COLUMNS:
+        if df[col].dtype.kind == 'f':
+            # Already parsed as float by the reader
+            continue
+        try:
+            df[col] = pd.to_numeric(df[col], errors='raise')
+        except ValueError:
+            raise IngestError(f'Column {col} must be numeric')
+        except Exception as e:
+            raise IngestError(f'Error processing column {col}: {str(e)}')
+    return df
+
+
+def validate_timestamps(df):
+    """Parse the optional Timestamp column in place (naive times are taken as UTC)."""
+    try:
+        df[TIMESTAMP_COLUMN] = pd.to_datetime(df[TIMESTAMP_COLUMN], utc=True, errors='raise')
+    except (ValueError, TypeError):
+        raise IngestError(f'Column {TIMESTAMP_COLUMN} must contain valid dates/times')
+    return df
+
+
+class RunningSummary:
+    """Count, column means and type counts folded in one chunk at a time."""
+
+    def __init__(self):
+        self.total_count = 0
+        self._sums = dict.fromkeys(NUMERIC_COLUMNS, 0.0)
+        self._counts = dict.fromkeys(NUMERIC_COLUMNS, 0)
+        self._type_counts = {}
+
+    def update(self, chunk):
+        self.total_count += len(chunk)
+        for col in NUMERIC_COLUMNS:
+            # NaNs are skipped, matching Series.mean()
+            self._sums[col] += chunk[col].sum()
+            self._counts[col] += int(chunk[col].count())
+        # groupby keeps order of appearance for the categorical Type, value_counts would not
+        for type_name, count in chunk.groupby('Type', sort=False, observed=True).size().items():
+            self._type_counts[type_name] = self._type_counts.get(type_name, 0) + int(count)
+
+    def mean(self, col):
+        if not self._counts[col]:
+            return float('nan')
+        return float(self._sums[col] / self._counts[col])
+
+    @property
+    def type_distribution(self):
+        # Same ordering as value_counts(): by count, ties in order of appearance
+        return dict(sorted(self._type_counts.items(), key=lambda item: -item[1]))
+
+    def snapshot(self):
+        """The aggregates so far, rounded like the upload payload (None for a mean with no values yet)."""
+        means = {f'avg_{col.lower()}': self.mean(col) for col in NUMERIC_COLUMNS}
+        return {
+            'total_count': self.total_count,
+            **{key: None if pd.isna(value) else round(value, 2) for key, value in means.items()},
+            'type_distribution': {str(name): count for name, count in self.type_distribution.items()},
+        }
+
+
+class RowSpool:
+    """
+    Validated chunks of an upload, kept on disk until they are stored.
+
+    Chunks are appended to the file at `path` (default: a new temporary
+    file) as pickled frames, so dtypes come back exactly as validated, and
+    chunks() reads them back one at a time in the same order. The file
+    stays open until close(), so reading back does not depend on the path
+    still existing.
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='equipment-rows-', suffix='.rows')
+            self._file = os.fdopen(fd, 'w+b')
+        else:
+            self._file = open(path, 'w+b')
+        self.path = path
+        self.rows = 0
+
+    def append(self, chunk):
+        pickle.dump(chunk, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.rows += len(chunk)
+
+    def chunks(self):
+        self._file.flush()
+        self._file.seek(0)
+        return _load_chunks(self._file)
+
+    def close(self):
+        self._file.close()
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def spooled_chunks(path):
+    """The chunks of a closed RowSpool file, e.g. one written by another process."""
+    with open(path, 'rb') as f:
+        yield from _load_chunks(f)
+
+
+def _load_chunks(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+
+def _bytes_processed(file_obj):
+    # Position in the spooled upload (compressed bytes for a compressed one); pandas
+    # reads ahead a little, so this is approximate
+    try:
+        position = file_obj.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+    return min(position, file_obj.size) if file_obj.size is not None else position
+
+
+def summarize(file_obj, chunk_rows=None, on_chunk=None, on_progress=None):
+    """
+    Parse and validate `file_obj` and return the values it stores on
+    UploadSummary, as a dict of field names to values.
+
+    `on_chunk`, if given, is called with every validated chunk once it has
+    been aggregated (e.g. to store its rows). `on_progress`, if given, is
+    called after every chunk and when the phase changes, with a dict of
+    the phase ('parsing', then 'anomalies' for streamed uploads), rows
+    processed, bytes of the upload parsed so far, its size and the running
+    aggregates. Touches no database.
+    """
+    result = RunningSummary()
+    statistics = None if chunk_rows is None else RunningStatistics()
+    sketch = UploadSketch()
+    fields = {}
+
+    def report(phase):
+        if on_progress:
+            on_progress({
+                'phase': phase,
+                'rows_processed': result.total_count,
+                'bytes_processed': _bytes_processed(file_obj),
+                'bytes_total': file_obj.size,
+                'running': result.snapshot(),
+            })
+
+    report('parsing')
+    for chunk in iter_chunks(file_obj, chunk_rows):
+        with timed('aggregate'):
+            result.update(chunk)
+            sketch.update(chunk)
+            if statistics is None:
+                # Whole file in one frame: exact statistics, percentiles included
+                fields['statistics'] = describe(chunk)
+            else:
+                statistics.update(chunk)
+        if statistics is None:
+            with timed('anomalies'):
+                fields['anomalies'] = detect_anomalies(chunk)
+        if on_chunk:
+            on_chunk(chunk)
+        report('parsing')
+
+    if not result.total_count:
+        raise IngestError('File is empty')
+
+    fields.update(
+        total_equipment=result.total_count,
+        avg_flowrate=result.mean('Flowrate'),
+        avg_pressure=result.mean('Pressure'),
+        avg_temperature=result.mean('Temperature'),
+        type_distribution=result.type_distribution,
+    )
+    if statistics is not None:
+        # Percentiles of a streamed upload come from its quantile sketches
+        fields['statistics'] = fill_percentiles(statistics.result(), sketch.statistics())
+        # Second pass over the file; its reads are also counted under 'read' and 'validate'
+        report('anomalies')
+        with timed('anomalies'):
+            fields['anomalies'] = stream_anomalies(file_obj, chunk_rows, sketch)
+    fields['sketches'] = sketch.to_dict()
+    return fields
+
+
+def ingest_upload(file_obj, chunk_rows=None, content_sha256='', on_progress=None, spool_path=None):
+    """
+    Parse `file_obj`, store its summary and raw rows, and return the UploadSummary.
+
+    The validated rows are spooled to `spool_path` (default: a temporary
+    file) while the upload is parsed, then inserted with the summary in one
+    transaction; any IngestError leaves nothing behind. `on_progress` is
+    passed on to summarize(), plus a last call in phase 'saving'. Concurrent
+    ingests wait for each other only while storing (see
+    equipment.db.serialized_writes).
+    """
+    rows = RowSpool(spool_path)
+    try:
+        last = {}
+
+        def progress(snapshot):
+            last.update(snapshot)
+            if on_progress:
+                on_progress(snapshot)
+
+        fields = summarize(file_obj, chunk_rows, on_chunk=rows.append, on_progress=progress)
+        if on_progress:
+            on_progress({**last, 'phase': 'saving'})
+        with serialized_writes(), transaction.atomic():
+            upload = UploadSummary.objects.create(file_name=file_obj.name, content_sha256=content_sha256, **fields)
+            with timed('insert'):
+                for chunk in rows.chunks():
+                    EquipmentReading.objects.bulk_insert_frame(upload, chunk)
+    finally:
+        rows.remove()
+    return upload
+
+
+def stream_anomalies(file_obj, chunk_rows, sketch):
+    """Flag a streamed upload against references estimated from its sketches."""
+    collector = AnomalyCollector(sketch_reference(sketch), approximate=True)
+    file_obj.seek(0)
+    for chunk in iter_chunks(file_obj, chunk_rows):
+        collector.update(chunk)
+    return collector.result()
+
+
+def find_duplicate(content_sha256):
+    """Return the newest retained UploadSummary with this content hash, if any."""
+    if not content_sha256:
+        return None
+    return UploadSummary.objects.filter(content_sha256=content_sha256).order_by('-uploaded_at').first()
@@ -0,0 +1,243 @@
+"""
+Background processing for uploads accepted with ?mode=async.
+
+The upload is spooled to EQUIPMENT_JOB_SPOOL_DIR and an UploadJob row is
+created; a local process pool then runs the normal ingest on the spooled
+file, so the pandas work neither holds a server thread nor competes for its
+GIL. No broker is involved: the job row is the queue entry and the status.
+
+Nothing of a running job is in the database until its rows are stored, so
+its progress (phase, rows, bytes parsed and the running aggregates) is
+published through a small JSON file next to the spooled upload and merged
+into the job status until the final counts are committed. Job rows are
+written through equipment.db.serialized_writes, so a status update waits
+for an ingest that is storing rather than failing on the locked database. /api/jobs/<id>/events/
+streams the same snapshots (see equipment.events).
+"""
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single waitress process, which owns every job
+    fcntl = None
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from . import workers
+from .db import serialized_writes
+from .ingest import IngestError, chunk_rows_for, ingest_upload
+from .models import UploadJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_owner_locks = {}
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.EQUIPMENT_JOB_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=workers.setup,
+            )
+        return _executor
+
+
+def shutdown(wait=True):
+    """Stop the process pool, by default after the jobs already submitted have finished."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def progress_path(job):
+    return f"{job.file_path}.progress"
+
+
+def read_progress(job):
+    """The worker's last progress snapshot (see ingest.summarize), or None."""
+    try:
+        with open(progress_path(job)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def job_progress(job):
+    """Where `job` stands, as reported to clients: state, phase, rows, bytes and running aggregates."""
+    progress = (read_progress(job) if job.state == UploadJob.RUNNING else None) or {}
+    if job.state == UploadJob.QUEUED:
+        phase = 'queued'
+    elif job.is_finished:
+        phase = job.state
+    else:
+        phase = progress.get('phase', 'parsing')
+    return {
+        "job_id": str(job.pk),
+        "state": job.state,
+        "phase": phase,
+        "rows_processed": progress.get('rows_processed', job.rows_processed),
+        "bytes_processed": progress.get('bytes_processed'),
+        "bytes_total": progress.get('bytes_total'),
+        "running": progress.get('running'),
+    }
+
+
+def _write_progress(path, progress):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+
+def create_job(file_obj, content_sha256=''):
+    """Spool `file_obj` to disk and record a queued UploadJob for it."""
+    spool_dir = settings.EQUIPMENT_JOB_SPOOL_DIR
+    os.makedirs(spool_dir, exist_ok=True)
+    job = UploadJob(file_name=file_obj.name, content_sha256=content_sha256)
+    job.file_path = os.path.join(spool_dir, f"{job.id}.upload")
+    with open(job.file_path, 'wb') as f:
+        for chunk in file_obj.chunks():
+            f.write(chunk)
+    with serialized_writes():
+        job.save()
+    return job
+
+
+def _claim_jobs(spool_dir):
+    """
+    Take a shared lock on the spool directory's jobs.lock, held for the life
+    of this process and inherited by the workers it forks, the processes
+    that run jobs. Returns True if no other server held it: then no live
+    process owns an unfinished job.
+    """
+    if fcntl is None:
+        return True
+    lock_file = _owner_locks.get(spool_dir)
+    if lock_file is None:
+        lock_file = _owner_locks[spool_dir] = open(os.path.join(spool_dir, 'jobs.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        orphaned = True
+    except BlockingIOError:
+        orphaned = False
+    fcntl.flock(lock_file, fcntl.LOCK_SH)
+    return orphaned
+
+
+def recover():
+    """
+    Fail the jobs a previous server run left queued or running, and delete
+    their spooled files. Call once in the server process at startup, before
+    any job is submitted (gunicorn.conf.py and run_prod.py do). Does nothing
+    while another server using the same spool directory is still running
+    (a new gunicorn master started with USR2 next to the old one): its jobs
+    are not interrupted. Returns the number of jobs failed.
+    """
+    spool_dir = settings.EQUIPMENT_JOB_SPOOL_DIR
+    os.makedirs(spool_dir, exist_ok=True)
+    if not _claim_jobs(spool_dir):
+        logger.info("Another server owns the unfinished upload jobs; not recovering them")
+        return 0
+    with serialized_writes(), transaction.atomic():
+        unfinished = UploadJob.objects.filter(state__in=[UploadJob.QUEUED, UploadJob.RUNNING])
+        job_ids = list(unfinished.values_list('id', flat=True))
+        failed = UploadJob.objects.filter(pk__in=job_ids).update(
+            state=UploadJob.FAILED, error='Interrupted by a server restart', finished_at=timezone.now())
+    # Uploads, progress snapshots and row spools of a job are all named <job id>.upload*
+    prefixes = tuple(f"{job_id}.upload" for job_id in job_ids)
+    for name in os.listdir(spool_dir):
+        if prefixes and name.startswith(prefixes):
+            try:
+                os.remove(os.path.join(spool_dir, name))
+            except OSError:
+                pass
+    if failed:
+        logger.warning("Marked %d interrupted upload jobs as failed", failed)
+    return failed
+
+
+def submit(job):
+    """Queue `job` on the process pool, or run it here if EQUIPMENT_JOB_WORKERS is 0."""
+    if not settings.EQUIPMENT_JOB_WORKERS:
+        run_job(str(job.pk))
+        return
+
+    global _executor
+    try:
+        future = get_executor().submit(workers.run_upload_job, str(job.pk))
+    except Exception:
+        # A broken pool (e.g. a worker was killed) cannot be reused
+        with _executor_lock:
+            _executor = None
+        future = get_executor().submit(workers.run_upload_job, str(job.pk))
+    future.add_done_callback(lambda f, job_id=job.pk: _check_future(job_id, f))
+
+
+def _check_future(job_id, future):
+    exc = future.exception()
+    if exc is None:
+        return
+    # run_job records its own failures; this only catches the worker dying
+    logger.error("Upload job %s crashed: %s", job_id, exc)
+    with serialized_writes():
+        UploadJob.objects.filter(pk=job_id).exclude(state__in=[UploadJob.SUCCEEDED, UploadJob.FAILED]).update(
+            state=UploadJob.FAILED, error=f'Worker crashed: {exc}', finished_at=timezone.now())
+
+
+def run_job(job_id):
+    """Ingest the spooled file of UploadJob `job_id` and record the outcome."""
+    job = UploadJob.objects.get(pk=job_id)
+    progress_file = progress_path(job)
+    rows_file = f"{job.file_path}.rows"
+    try:
+        job.state = UploadJob.RUNNING
+        job.started_at = timezone.now()
+        with serialized_writes():
+            job.save(update_fields=['state', 'started_at'])
+        with open(job.file_path, 'rb') as f:
+            file_obj = File(f, name=job.file_name)
+            summary = ingest_upload(
+                file_obj,
+                chunk_rows_for(file_obj),
+                content_sha256=job.content_sha256,
+                on_progress=lambda progress: _write_progress(progress_file, progress),
+                spool_path=rows_file,
+            )
+    except IngestError as e:
+        job.state = UploadJob.FAILED
+        job.error = str(e)
+    except Exception as e:
+        logger.exception("Upload job %s failed", job_id)
+        job.state = UploadJob.FAILED
+        job.error = f'Unexpected error: {e}'
+    else:
+        job.state = UploadJob.SUCCEEDED
+        job.summary = summary
+        job.result = summary.as_payload()
+        job.rows_processed = summary.total_equipment
+    finally:
+        for path in (job.file_path, progress_file, rows_file):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    job.finished_at = timezone.now()
+    with serialized_writes():
+        job.save(update_fields=['state', 'error', 'summary', 'result', 'rows_processed', 'finished_at'])
+    return job.state
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from equipment.retention import policy_from_settings, sweep
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored uploads (and their readings) that the retention policy rejects. "
+        "The policy comes from the EQUIPMENT_RETENTION_* settings; the options override single values."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+        parser.add_argument('--keep-last', type=int, help="Keep the newest N uploads (0: no limit).")
+        parser.add_argument('--max-age-days', type=float, help="Delete uploads older than this (0: no limit).")
+        parser.add_argument('--max-rows', type=int, help="Keep at most this many stored readings (0: no limit).")
+        parser.add_argument('--max-bytes', type=int, help="Keep at most about this many bytes of readings (0: no limit).")
+        parser.add_argument('--batch-size', type=int, help="Readings deleted per transaction.")
+
+    def handle(self, *args, **options):
+        policy = policy_from_settings(
+            keep_last=options['keep_last'],
+            max_age_days=options['max_age_days'],
+            max_rows=options['max_rows'],
+            max_bytes=options['max_bytes'],
+        )
+        report = sweep(dry_run=options['dry_run'], policy=policy, batch_size=options['batch_size'])
+        for candidate in report['candidates']:
+            self.stdout.write(
+                f"{'Would delete' if report['dry_run'] else 'Deleted'} upload {candidate['id']} "
+                f"{candidate['file_name']!r} ({candidate['uploaded_at']:%Y-%m-%d %H:%M}, {candidate['rows']} rows, "
+                f"~{candidate['bytes'] / 2**20:.1f} MiB): {candidate['reason']}"
+            )
+        verb = 'Would reclaim' if report['dry_run'] else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['uploads']} uploads, {report['rows']} rows, ~{report['bytes'] / 2**20:.1f} MiB"
+        ))
@@ -0,0 +1,156 @@
+"""
+Lightweight in-process metrics, exposed at /api/metrics in the Prometheus
+text format.
+
+Code marks the phases it wants measured with timed(), as a context manager
+or a decorator:
+
+    with timed('read'):
+        chunk = next(reader)
+
+During a request (see equipment.middleware.MetricsMiddleware) the phase
+times are summed per request and observed once the response is ready, so a
+phase run once per chunk still yields one observation per request. Outside
+a request each timed() block is observed on its own.
+
+Histograms live in process memory: under a multi-worker server every
+worker reports its own, and they reset on restart.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ROWS_PER_SECOND_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+BYTES_PER_SECOND_BUCKETS = (1e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8, 1e9)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    """A Prometheus histogram with optional labels; observe() is thread-safe."""
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        # Label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self, **labels):
+        """(cumulative bucket counts, sum, count) for one label set, or None."""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                return None
+            counts, total = list(series[0]), series[1]
+        cumulative = [sum(counts[:i + 1]) for i in range(len(counts))]
+        return cumulative, total, cumulative[-1]
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        for key, counts, total in series:
+            pairs = list(zip(self.labelnames, key))
+            running = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                running += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{self.name}_bucket{_labels(pairs + [("le", le)])} {running}')
+            lines.append(f'{self.name}_sum{_labels(pairs)} {total!r}')
+            lines.append(f'{self.name}_count{_labels(pairs)} {running}')
+        return '\n'.join(lines)
+
+
+REGISTRY = []
+
+
+def histogram(name, documentation, buckets=LATENCY_BUCKETS, labelnames=()):
+    metric = Histogram(name, documentation, buckets, labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+
+REQUEST_SECONDS = histogram('equipment_request_duration_seconds', 'Total time to produce a response.',
+                            labelnames=('view', 'method', 'status'))
+REQUEST_QUERIES = histogram('equipment_request_db_queries', 'Database queries run per request.',
+                            QUERY_BUCKETS, labelnames=('view',))
+REQUEST_DB_SECONDS = histogram('equipment_request_db_seconds', 'Time spent in database queries per request.',
+                               labelnames=('view',))
+PHASE_SECONDS = histogram('equipment_phase_duration_seconds', 'Time spent in one phase of a request.',
+                          labelnames=('phase',))
+UPLOAD_ROWS_PER_SECOND = histogram('equipment_upload_rows_per_second', 'Ingest throughput of uploads in rows.',
+                                   ROWS_PER_SECOND_BUCKETS)
+UPLOAD_BYTES_PER_SECOND = histogram('equipment_upload_bytes_per_second', 'Ingest throughput of uploads in bytes.',
+                                    BYTES_PER_SECOND_BUCKETS)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+# Phase name -> seconds, for the request being handled in this context
+_request_timings = ContextVar('equipment_request_timings', default=None)
+
+
+class Timer:
+    seconds = None
+
+
+@contextmanager
+def timed(phase):
+    """Time the block (or, as a decorator, each call) as `phase`; yields a Timer."""
+    timer = Timer()
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        timer.seconds = time.perf_counter() - start
+        timings = _request_timings.get()
+        if timings is None:
+            PHASE_SECONDS.observe(timer.seconds, phase=phase)
+        else:
+            timings[phase] = timings.get(phase, 0.0) + timer.seconds
+
+
+@contextmanager
+def collect_timings():
+    """Sum timed() phases into the yielded dict instead of observing them one by one."""
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
@@ -0,0 +1,79 @@
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+
+from .metrics import PHASE_SECONDS, REQUEST_DB_SECONDS, REQUEST_QUERIES, REQUEST_SECONDS, collect_timings
+
+
+class QueryCounter:
+    """connection.execute_wrapper() hook counting queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+def server_timing(timings, queries, total):
+    entries = [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in timings.items()]
+    entries.append(f'db;desc="{queries.count} queries";dur={queries.seconds * 1000:.1f}')
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+class MetricsMiddleware:
+    """
+    Record every request's total time, database queries and timed() phases
+    in equipment.metrics. With EQUIPMENT_SERVER_TIMING on, the same numbers
+    are sent back in a Server-Timing header (shown by browser dev tools).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with collect_timings() as timings, connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        REQUEST_SECONDS.observe(total, view=view, method=request.method, status=f'{response.status_code // 100}xx')
+        REQUEST_QUERIES.observe(queries.count, view=view)
+        REQUEST_DB_SECONDS.observe(queries.seconds, view=view)
+        for phase, seconds in timings.items():
+            PHASE_SECONDS.observe(seconds, phase=phase)
+        if settings.EQUIPMENT_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(timings, queries, total)
+        return response
+
+
+class RequestSizeLimitMiddleware:
+    """
+    Refuse request bodies larger than EQUIPMENT_MAX_UPLOAD_BYTES with 413,
+    going by Content-Length before any of the body is read.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        limit = settings.EQUIPMENT_MAX_UPLOAD_BYTES
+        if limit and length > limit:
+            return JsonResponse({'error': f'Request body exceeds the {limit} byte limit'}, status=413)
+        return self.get_response(request)
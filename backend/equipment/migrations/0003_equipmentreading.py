@@ -0,0 +1,54 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipment", "0002_uploadsummary_type_distribution"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EquipmentReading",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("equipment_name", models.CharField(max_length=255)),
+                ("equipment_type", models.CharField(max_length=100)),
+                ("flowrate", models.FloatField(null=True)),
+                ("pressure", models.FloatField(null=True)),
+                ("temperature", models.FloatField(null=True)),
+                (
+                    "upload",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="readings",
+                        to="equipment.uploadsummary",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["upload", "equipment_type"],
+                        name="reading_upload_type_idx",
+                    ),
+                    models.Index(
+                        fields=["upload", "equipment_name"],
+                        name="reading_upload_name_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
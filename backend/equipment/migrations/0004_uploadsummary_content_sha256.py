@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipment", "0003_equipmentreading"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsummary",
+            name="content_sha256",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipment", "0005_uploadjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsummary",
+            name="statistics",
+            field=models.JSONField(default=dict),
+        ),
+    ]
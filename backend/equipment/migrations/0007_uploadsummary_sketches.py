@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipment", "0006_uploadsummary_statistics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsummary",
+            name="sketches",
+            field=models.JSONField(default=dict),
+        ),
+    ]
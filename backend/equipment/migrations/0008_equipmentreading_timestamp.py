@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipment", "0007_uploadsummary_sketches"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="equipmentreading",
+            name="timestamp",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="equipmentreading",
+            index=models.Index(
+                fields=["upload", "timestamp"], name="reading_upload_time_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipment", "0008_equipmentreading_timestamp"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsummary",
+            name="anomalies",
+            field=models.JSONField(default=dict),
+        ),
+    ]
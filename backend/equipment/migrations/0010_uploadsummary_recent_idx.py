@@ -0,0 +1,19 @@
+# Generated by Django 6.0.2 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipment", "0009_uploadsummary_anomalies"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="uploadsummary",
+            index=models.Index(
+                fields=["-uploaded_at", "-id"], name="uploadsummary_recent_idx"
+            ),
+        ),
+    ]
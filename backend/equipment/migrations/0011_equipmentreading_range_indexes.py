@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("equipment", "0010_uploadsummary_recent_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="equipmentreading",
+            index=models.Index(
+                fields=["upload", "flowrate"], name="reading_upload_flowrate_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="equipmentreading",
+            index=models.Index(
+                fields=["upload", "pressure"], name="reading_upload_pressure_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="equipmentreading",
+            index=models.Index(
+                fields=["upload", "temperature"], name="reading_upload_temp_idx"
+            ),
+        ),
+    ]
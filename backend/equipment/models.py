@@ -1,4 +1,18 @@
-from django.db import models
+import uuid
+from itertools import islice, repeat
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections, models
+
+REQUIRED_COLUMNS = {'Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature'}
+NUMERIC_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+# Optional column; when present readings can be charted as a time series
+TIMESTAMP_COLUMN = 'Timestamp'
+# EquipmentReading field holding each numeric CSV column
+READING_FIELDS = {'Flowrate': 'flowrate', 'Pressure': 'pressure', 'Temperature': 'temperature'}
+
 
 class UploadSummary(models.Model):
     file_name = models.CharField(max_length=255)
@@ -8,15 +22,184 @@ class UploadSummary(models.Model):
     avg_pressure = models.FloatField()
     avg_temperature = models.FloatField()
     type_distribution = models.JSONField(default=dict)
+    # Per-column and per-Type descriptive statistics, see equipment.statistics
+    statistics = models.JSONField(default=dict)
+    # Mergeable moments and quantile sketches for cross-upload rollups, see equipment.sketches
+    sketches = models.JSONField(default=dict)
+    # Out-of-family readings per Type, see equipment.anomalies
+    anomalies = models.JSONField(default=dict)
+    # SHA-256 of the uploaded bytes, used to answer repeat uploads from the stored summary
+    content_sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Newest-first listing and its keyset pagination (history, retention, latest report)
+            models.Index(fields=['-uploaded_at', '-id'], name='uploadsummary_recent_idx'),
+        ]
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Keep only last 5 uploads
-        # We fetch the IDs of the newest 5 records
-        keep_ids = list(UploadSummary.objects.order_by('-uploaded_at').values_list('id', flat=True)[:5])
-        # Delete any records that are not in the top 5
-        if keep_ids:
-            UploadSummary.objects.exclude(id__in=keep_ids).delete()
+    def as_payload(self):
+        """JSON body describing this summary, as returned by the upload endpoint."""
+        return {
+            "id": self.pk,
+            "total_count": int(self.total_equipment),
+            "avg_flowrate": round(float(self.avg_flowrate), 2),
+            "avg_pressure": round(float(self.avg_pressure), 2),
+            "avg_temperature": round(float(self.avg_temperature), 2),
+            "type_distribution": self.type_distribution
+        }
 
     def __str__(self):
         return f"{self.file_name} ({self.uploaded_at})"
+
+
+class EquipmentReadingManager(models.Manager):
+    def bulk_insert_frame(self, upload, df, batch_size=None):
+        """
+        Insert one EquipmentReading per row of a validated upload frame.
+
+        Rows go straight from the frame's columns to batched executemany()
+        INSERTs. bulk_create() builds a model instance per row and SQLite
+        caps it at 999 parameters per statement, which puts 1M rows at close
+        to a minute; this path does the same in a few seconds. Call inside
+        a transaction. Returns the number of rows inserted.
+        """
+        batch_size = batch_size or settings.EQUIPMENT_READING_BATCH_SIZE
+        names = df['Equipment Name'].fillna('').astype(str).tolist()
+        types = df['Type'].astype(object).fillna('').astype(str).tolist()
+        numeric = []
+        for col in NUMERIC_COLUMNS:
+            values = df[col].to_numpy(dtype=float)
+            column = values.astype(object)
+            column[np.isnan(values)] = None  # NaN is stored as NULL
+            numeric.append(column.tolist())
+        if TIMESTAMP_COLUMN in df.columns:
+            # Naive UTC text, the same form Django itself writes (and SQLite compares)
+            timestamps = df[TIMESTAMP_COLUMN].dt.tz_convert(None).dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+            timestamps = timestamps.astype(object).where(timestamps.notna(), None).tolist()
+        else:
+            timestamps = repeat(None)
+
+        meta = self.model._meta
+        fields = [meta.get_field(name) for name in
+                  ('upload', 'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature', 'timestamp')]
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            qn(meta.db_table),
+            ', '.join(qn(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+
+        rows = zip(repeat(upload.pk), names, types, *numeric, timestamps)
+        with connection.cursor() as cursor:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                cursor.executemany(sql, batch)
+        return len(names)
+
+    def series(self, upload_id, column, type_name=None, fetch_size=50000):
+        """
+        Load one numeric column of an upload as arrays, without model instances.
+
+        Returns `(timestamps, values)`. Rows are in time order when the upload
+        has timestamps (then `timestamps` is a UTC DatetimeIndex) and in file
+        order otherwise (then `timestamps` is None). NULL values are skipped.
+        """
+        field = READING_FIELDS[column]
+        readings = self.filter(upload_id=upload_id, **{f'{field}__isnull': False})
+        if type_name:
+            readings = readings.filter(equipment_type=type_name)
+        has_time = readings.filter(timestamp__isnull=False).exists()
+        if has_time:
+            readings = readings.filter(timestamp__isnull=False).order_by('timestamp', 'id')
+        else:
+            readings = readings.order_by('id')
+
+        # Raw cursor: values come back unconverted and go straight into arrays
+        sql, params = readings.values_list('timestamp', field).query.sql_with_params()
+        times = []
+        values = []
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                if has_time:
+                    times.extend(row[0] for row in rows)
+                values.append(np.fromiter((row[1] for row in rows), dtype=float, count=len(rows)))
+
+        values = np.concatenate(values) if values else np.empty(0)
+        timestamps = pd.to_datetime(times, utc=True) if has_time else None
+        return timestamps, values
+
+
+class EquipmentReading(models.Model):
+    """
+    One row of an uploaded CSV.
+
+    Narrow, fixed-width columns only (no per-row JSON) so rows stay small and
+    map directly onto the five required CSV columns.
+    """
+    # The composite indexes below lead with upload, so the FK needs no index of its own
+    upload = models.ForeignKey(UploadSummary, on_delete=models.CASCADE, related_name='readings', db_index=False)
+    equipment_name = models.CharField(max_length=255)
+    equipment_type = models.CharField(max_length=100)
+    flowrate = models.FloatField(null=True)
+    pressure = models.FloatField(null=True)
+    temperature = models.FloatField(null=True)
+    timestamp = models.DateTimeField(null=True, blank=True)
+
+    objects = EquipmentReadingManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['upload', 'equipment_type'], name='reading_upload_type_idx'),
+            models.Index(fields=['upload', 'equipment_name'], name='reading_upload_name_idx'),
+            models.Index(fields=['upload', 'timestamp'], name='reading_upload_time_idx'),
+            # Range filters of /api/readings/ (see equipment.query)
+            models.Index(fields=['upload', 'flowrate'], name='reading_upload_flowrate_idx'),
+            models.Index(fields=['upload', 'pressure'], name='reading_upload_pressure_idx'),
+            models.Index(fields=['upload', 'temperature'], name='reading_upload_temp_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.equipment_name} ({self.equipment_type})"
+
+
+class UploadJob(models.Model):
+    """An upload accepted with ?mode=async and processed by equipment.jobs."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATE_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    # Spooled copy of the upload; removed once the job finishes
+    file_path = models.CharField(max_length=1024)
+    content_sha256 = models.CharField(max_length=64, blank=True)
+    state = models.CharField(max_length=16, choices=STATE_CHOICES, default=QUEUED)
+    rows_processed = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    summary = models.ForeignKey(UploadSummary, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    # Snapshot of the summary payload, kept after the summary itself is pruned
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_finished(self):
+        return self.state in (self.SUCCEEDED, self.FAILED)
+
+    def __str__(self):
+        return f"{self.file_name} [{self.state}]"
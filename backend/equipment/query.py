@@ -0,0 +1,136 @@
+"""
+Filtered queries over the stored readings of an upload (/api/readings/).
+
+Filters: Type (exact), an Equipment Name prefix and ranges on the numeric
+columns (?temperature_gt=110, ?flowrate_lte=80, ...). Every query is
+answered from one composite index that leads with the upload:
+
+    a numeric range    (upload, <column>), rows in (<column>, id) order
+    a name prefix      (upload, equipment_name), rows in (name, id) order
+    otherwise          (upload, equipment_type) for a Type, rows in id order
+
+so the index delivers the rows already in page order and a page reads
+about as many index entries as it returns, whatever the size of the upload
+(the remaining filters are checked on those rows). The first ranged column
+wins when several are given. The name prefix is a range rather than LIKE,
+which SQLite cannot serve from an index, so it is case-sensitive.
+
+Pages are keyset-paginated: the cursor holds the sort value and id of the
+last row, and the next page starts right after it in the same index.
+"""
+import base64
+import json
+import math
+
+from django.db.models import Q
+
+from .models import READING_FIELDS, EquipmentReading
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+RANGE_LOOKUPS = ('gt', 'gte', 'lt', 'lte')
+RESULT_FIELDS = ('id', 'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature', 'timestamp')
+
+
+class QueryError(Exception):
+    pass
+
+
+def parse_filters(params):
+    """The filters in query parameters `params`, as a dict; raises QueryError."""
+    ranges = {}
+    for field in READING_FIELDS.values():
+        for lookup in RANGE_LOOKUPS:
+            value = params.get(f'{field}_{lookup}')
+            if value is None or value == '':
+                continue
+            try:
+                bound = float(value)
+            except ValueError:
+                bound = math.nan
+            if not math.isfinite(bound):
+                raise QueryError(f'{field}_{lookup} must be a finite number')
+            ranges[f'{field}__{lookup}'] = bound
+    return {
+        'type': params.get('type') or None,
+        'name_prefix': params.get('name_prefix') or None,
+        'ranges': ranges,
+    }
+
+
+def sort_field(filters):
+    """The column whose index serves the query (rows are in (column, id) order), or 'id'."""
+    for field in READING_FIELDS.values():
+        if any(key.startswith(f'{field}__') for key in filters['ranges']):
+            return field
+    if filters['name_prefix']:
+        return 'equipment_name'
+    return 'id'
+
+
+def _prefix_end(prefix):
+    """The smallest string greater than every string starting with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1) if ord(prefix[-1]) < 0x10FFFF else None
+
+
+def encode_cursor(field, row):
+    data = {'f': field, 'id': row['id']}
+    if field != 'id':
+        data['v'] = row[field]
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """(sort value, id) from a cursor made for sort `field`; raises QueryError."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if data['f'] != field:
+            raise ValueError
+        return data.get('v'), int(data['id'])
+    except (ValueError, KeyError, TypeError):
+        raise QueryError('Invalid cursor (cursors only work with the filters they were issued for)')
+
+
+def build(upload_id, filters, cursor=None):
+    """(queryset, sort field) for one page of readings matching `filters` after `cursor`."""
+    field = sort_field(filters)
+    readings = EquipmentReading.objects.filter(upload_id=upload_id)
+    if filters['type']:
+        readings = readings.filter(equipment_type=filters['type'])
+
+    lower_bounds = {}
+    if filters['name_prefix']:
+        prefix = filters['name_prefix']
+        lower_bounds['equipment_name__gte'] = prefix
+        end = _prefix_end(prefix)
+        if end is not None:
+            readings = readings.filter(equipment_name__lt=end)
+    for key, value in filters['ranges'].items():
+        if key.endswith(('__gt', '__gte')):
+            lower_bounds[key] = value
+        else:
+            readings = readings.filter(**{key: value})
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, field)
+        if field == 'id':
+            readings = readings.filter(id__gt=last_id)
+        else:
+            # The cursor row met the lower bounds on the sort field, so the cursor
+            # replaces them; a single lower bound lets the index seek straight to it
+            lower_bounds = {key: bound for key, bound in lower_bounds.items() if not key.startswith(f'{field}__')}
+            readings = readings.filter(**{f'{field}__gte': value}).filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, 'id__gt': last_id}))
+    readings = readings.filter(**lower_bounds)
+
+    order = ('id',) if field == 'id' else (field, 'id')
+    return readings.order_by(*order), field
+
+
+def page(upload_id, filters, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """(rows, next cursor or None)."""
+    readings, field = build(upload_id, filters, cursor)
+    # One extra row tells whether there is a next page
+    rows = list(readings.values(*RESULT_FIELDS)[:limit + 1])
+    next_cursor = encode_cursor(field, rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
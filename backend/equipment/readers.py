@@ -0,0 +1,204 @@
+"""
+Parsing of equipment uploads: CSV, Parquet, Feather and Arrow IPC.
+
+The format is detected from the file's magic bytes, not its name.
+
+The header line is read on its own first, so missing columns are reported
+before any data is parsed, and only the columns the app uses are loaded:
+the required five plus Timestamp when present. Every loaded column has a
+declared dtype. The numeric columns are parsed straight to float64, which
+validates and converts them in the same pass, and Type is categorical.
+
+Whole files go through pyarrow's multithreaded CSV engine when pyarrow is
+installed. Chunked reads, and installs without pyarrow, use pandas' C
+engine. Plant exports are often a hundred columns wide, so pruning
+columns matters more than the engine.
+
+Columnar files need pyarrow. They are read memory-mapped from disk, which
+means a file Django kept in memory is spooled to a temporary file first,
+and only the used columns are projected. The resulting frames look exactly
+like the CSV ones, so validation and aggregation are shared.
+"""
+import csv
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
+
+from .models import NUMERIC_COLUMNS, REQUIRED_COLUMNS, TIMESTAMP_COLUMN
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+CSV = 'csv'
+PARQUET = 'parquet'
+FEATHER = 'feather'
+ARROW_FILE = 'arrow'
+ARROW_STREAM = 'arrow-stream'
+# Leading bytes of each columnar format. Feather v2 is the Arrow IPC file format.
+MAGIC_BYTES = [
+    (b'PAR1', PARQUET),
+    (b'ARROW1', ARROW_FILE),
+    (b'FEA1', FEATHER),
+    (b'\xff\xff\xff\xff', ARROW_STREAM),
+]
+
+
+def detect_format(file_obj):
+    """One of CSV, PARQUET, FEATHER, ARROW_FILE or ARROW_STREAM; the file is rewound."""
+    file_obj.seek(0)
+    head = file_obj.read(8)
+    file_obj.seek(0)
+    for magic, fmt in MAGIC_BYTES:
+        if head.startswith(magic):
+            return fmt
+    return CSV
+
+
+def read_header(file_obj):
+    """Column names from the first line of `file_obj`; the file is rewound."""
+    file_obj.seek(0)
+    line = file_obj.readline()
+    file_obj.seek(0)
+    if isinstance(line, bytes):
+        line = line.decode('utf-8-sig', errors='replace')
+    if not line.strip():
+        return []
+    return next(csv.reader([line]))
+
+
+def column_dtypes(columns):
+    """Declared dtypes for the columns of `columns` the app loads."""
+    dtypes = {'Equipment Name': str, 'Type': 'category'}
+    dtypes.update(dict.fromkeys(NUMERIC_COLUMNS, 'float64'))
+    if TIMESTAMP_COLUMN in columns:
+        # Parsed by ingest.validate_timestamps, which reports bad values by name
+        dtypes[TIMESTAMP_COLUMN] = str
+    return dtypes
+
+
+def engine_for(chunk_rows):
+    """pyarrow cannot read in chunks, so it is only used for whole files."""
+    return 'pyarrow' if HAS_PYARROW and not chunk_rows else 'c'
+
+
+def read_csv(file_obj, columns, chunk_rows=None, engine=None):
+    """
+    Yield DataFrames of the used columns of a CSV upload.
+
+    `columns` is the header from read_header(). With `chunk_rows=None` the
+    whole file is yielded as one frame. Non-numeric values in a numeric
+    column raise ValueError; see non_numeric_column() to find which.
+    """
+    dtypes = column_dtypes(columns)
+    engine = engine or engine_for(chunk_rows)
+    file_obj.seek(0)
+    if chunk_rows:
+        yield from pd.read_csv(file_obj, usecols=list(dtypes), dtype=dtypes, engine=engine, chunksize=chunk_rows)
+    else:
+        yield pd.read_csv(file_obj, usecols=list(dtypes), dtype=dtypes, engine=engine)
+
+
+def non_numeric_column(file_obj, chunk_rows=100_000):
+    """
+    Name of the first numeric column holding a value that is not a number, or None.
+
+    Only used to word the error after read_csv() failed, so it favours
+    matching the old per-column messages over speed.
+    """
+    file_obj.seek(0)
+    for chunk in pd.read_csv(file_obj, usecols=NUMERIC_COLUMNS, dtype=str, chunksize=chunk_rows):
+        for col in NUMERIC_COLUMNS:
+            if pd.to_numeric(chunk[col], errors='coerce').isna().sum() > chunk[col].isna().sum():
+                return col
+    return None
+
+
+def missing_columns(columns):
+    return REQUIRED_COLUMNS - set(columns)
+
+
+@contextmanager
+def local_path(file_obj):
+    """
+    A filesystem path holding the upload's bytes, for memory mapping.
+
+    Django's TemporaryUploadedFile and spooled job files already live on
+    disk; anything else is copied to a temporary file for the duration.
+    """
+    if hasattr(file_obj, 'temporary_file_path'):
+        yield file_obj.temporary_file_path()
+        return
+    path = getattr(getattr(file_obj, 'file', None), 'name', None)
+    if isinstance(path, str) and os.path.isfile(path):
+        yield path
+        return
+
+    fd, path = tempfile.mkstemp(prefix='upload-')
+    try:
+        with os.fdopen(fd, 'wb') as spool:
+            file_obj.seek(0)
+            shutil.copyfileobj(file_obj, spool, 1024 * 1024)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+def columnar_columns(path, fmt):
+    """Column names from the schema of a columnar file, without reading its data."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if fmt == PARQUET:
+        return pq.read_schema(path, memory_map=True).names
+    if fmt == ARROW_STREAM:
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_stream(source).schema.names
+    if fmt == ARROW_FILE:
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema.names
+    # Feather v1 has no separate schema reader
+    import pyarrow.feather as feather
+    return feather.read_table(path, memory_map=True).schema.names
+
+
+def _batches(path, fmt, columns, chunk_rows):
+    """Record batches (or one table) of the projected columns."""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    if fmt == PARQUET:
+        if chunk_rows:
+            yield from pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_rows, columns=columns)
+        else:
+            yield pq.read_table(path, columns=columns, memory_map=True)
+        return
+    if fmt == ARROW_STREAM:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_stream(source).read_all().select(columns)
+    else:
+        table = feather.read_table(path, columns=columns, memory_map=True)
+    if chunk_rows:
+        yield from table.to_batches(max_chunksize=chunk_rows)
+    else:
+        yield table
+
+
+def read_columnar(path, fmt, columns, chunk_rows=None):
+    """
+    Yield DataFrames of the used columns of a Parquet, Feather or Arrow file.
+
+    Same contract as read_csv(); numeric columns keep their stored type and
+    are checked by the caller.
+    """
+    used = [name for name in column_dtypes(columns) if name in columns]
+    for batch in _batches(path, fmt, used, chunk_rows):
+        df = batch.to_pandas()
+        df['Type'] = df['Type'].astype('category')
+        yield df
@@ -0,0 +1,167 @@
+"""
+PDF report rendering and the in-process cache of rendered reports.
+
+A report depends only on its UploadSummary, which does not change after the
+upload, so each one is rendered once (on first request) and the bytes are
+kept in a size-bounded LRU cache. The ETag is derived from the summary and
+REPORT_VERSION, so conditional requests can be answered without rendering.
+"""
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from .metrics import timed
+
+# Bump when the layout changes so clients and the cache drop old renders
+REPORT_VERSION = 3
+# Anomalies listed in the PDF; the full list is served by /api/anomalies/<id>/
+REPORT_MAX_ANOMALIES = 100
+
+
+@timed('render')
+def render_report(summary):
+    """Render the PDF report for `summary` and return its bytes."""
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer, pagesize=letter)
+    p.setTitle(f"Report - {summary.file_name}")
+
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(100, 750, "Chemical Equipment Parameter Report")
+
+    p.setFont("Helvetica", 12)
+    p.drawString(100, 730, f"File: {summary.file_name}")
+    p.drawString(100, 715, f"Date: {summary.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')}")
+
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(100, 680, "Summary Statistics")
+
+    p.setFont("Helvetica", 12)
+    p.drawString(120, 660, f"Total Equipment: {summary.total_equipment}")
+    p.drawString(120, 645, f"Avg Flowrate: {summary.avg_flowrate}")
+    p.drawString(120, 630, f"Avg Pressure: {summary.avg_pressure}")
+    p.drawString(120, 615, f"Avg Temperature: {summary.avg_temperature}")
+
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(100, 580, "Type Distribution")
+
+    p.setFont("Helvetica", 12)
+    y = 560
+    # Check if type_distribution is dict (it should be)
+    if isinstance(summary.type_distribution, dict):
+        for type_name, count in summary.type_distribution.items():
+            p.drawString(120, y, f"{type_name}: {count}")
+            y -= 20
+    else:
+        p.drawString(120, y, "No distribution data available")
+
+    y = _draw_anomalies(p, summary.anomalies, y - 20)
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def _draw_anomalies(p, anomalies, y):
+    """List the stored anomalies from `y` down, continuing on new pages."""
+    # Start on a new page unless the header and a first line fit above the bottom margin
+    if y - 35 < 50:
+        p.showPage()
+        y = 750
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(100, y, "Anomalies")
+    p.setFont("Helvetica", 10)
+    y -= 20
+    if not anomalies:
+        p.drawString(120, y, "Not computed for this upload")
+        return y - 15
+
+    items = anomalies['items'][:REPORT_MAX_ANOMALIES]
+    if not items:
+        p.drawString(120, y, "No out-of-family readings")
+        return y - 15
+    for item in items:
+        if y < 50:
+            p.showPage()
+            p.setFont("Helvetica", 10)
+            y = 750
+        z = 'n/a' if item['robust_z'] is None else f"{item['robust_z']:.2f}"
+        p.drawString(120, y, f"{item['equipment_name']} ({item['type']}) {item['column']} = {item['value']:g}"
+                             f"  median {item['median']:g}, robust z {z}, fences "
+                             f"[{item['lower_fence']:g}, {item['upper_fence']:g}]")
+        y -= 15
+    if anomalies['total'] > len(items):
+        if y < 50:
+            p.showPage()
+            p.setFont("Helvetica", 10)
+            y = 750
+        p.drawString(120, y, f"... and {anomalies['total'] - len(items)} more")
+        y -= 15
+    return y
+
+
+def report_etag(summary):
+    return f'"report-{summary.pk}-{int(summary.uploaded_at.timestamp())}-v{REPORT_VERSION}"'
+
+
+class ReportCache:
+    """Thread-safe LRU cache of rendered reports, bounded by total bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+report_cache = ReportCache(settings.EQUIPMENT_REPORT_CACHE_BYTES)
+
+
+def get_report(summary):
+    """Return the PDF bytes for `summary`, rendering them on a cache miss."""
+    key = report_etag(summary)
+    data = report_cache.get(key)
+    if data is None:
+        data = render_report(summary)
+        report_cache.put(key, data)
+    return data
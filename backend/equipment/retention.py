@@ -0,0 +1,168 @@
+"""
+Upload retention: which stored uploads to delete, and deleting them.
+
+The policies come from settings (EQUIPMENT_RETENTION_*), each off when 0:
+
+    keep_last     keep the newest N uploads
+    max_age_days  delete uploads older than this
+    max_rows      keep the newest uploads whose readings add up to at most this many rows
+    max_bytes     the same for the estimated stored size (rows x EQUIPMENT_RETENTION_ROW_BYTES)
+
+An upload is deleted when any policy rejects it; the newest upload is
+always kept. plan() lists the uploads to delete and why, without writing
+anything (the dry run). prune() deletes them: the readings of an upload go
+in batches of EQUIPMENT_RETENTION_BATCH_SIZE rows, each in its own short
+transaction, so uploads arriving meanwhile wait for one batch at most
+rather than for the whole delete.
+
+Nothing is pruned on the request path. `manage.py prune_uploads` runs a
+sweep on demand, and server processes run one every
+EQUIPMENT_RETENTION_SWEEP_SECONDS in a background thread (start_sweeper(),
+called by gunicorn.conf.py and run_prod.py); when several processes share
+the database, one sweep runs at a time.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .db import exclusive_task, serialized_writes
+from .metrics import timed
+from .models import EquipmentReading, UploadSummary
+
+logger = logging.getLogger(__name__)
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def policy_from_settings(**overrides):
+    """The retention policy from settings; keyword arguments that are not None replace single values."""
+    policy = {
+        'keep_last': settings.EQUIPMENT_RETENTION_KEEP_LAST,
+        'max_age_days': settings.EQUIPMENT_RETENTION_MAX_AGE_DAYS,
+        'max_rows': settings.EQUIPMENT_RETENTION_MAX_ROWS,
+        'max_bytes': settings.EQUIPMENT_RETENTION_MAX_BYTES,
+    }
+    policy.update({name: value for name, value in overrides.items() if value is not None})
+    return policy
+
+
+def plan(policy=None, now=None):
+    """
+    The uploads `policy` (default: settings) would delete, oldest first, as
+    dicts of id, file_name, uploaded_at, rows, bytes and reason.
+    """
+    policy = policy or policy_from_settings()
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=policy['max_age_days']) if policy['max_age_days'] else None
+    uploads = UploadSummary.objects.order_by('-uploaded_at', '-id').values(
+        'id', 'file_name', 'uploaded_at', 'total_equipment')
+
+    doomed = []
+    kept_rows = 0
+    for position, upload in enumerate(uploads):
+        rows = upload['total_equipment']
+        size = rows * settings.EQUIPMENT_RETENTION_ROW_BYTES
+        reason = None
+        if position == 0:
+            pass  # the newest upload is always kept
+        elif policy['keep_last'] and position >= policy['keep_last']:
+            reason = f"beyond the newest {policy['keep_last']}"
+        elif cutoff and upload['uploaded_at'] < cutoff:
+            reason = f"older than {policy['max_age_days']:g} days"
+        elif policy['max_rows'] and kept_rows + rows > policy['max_rows']:
+            reason = f"over {policy['max_rows']} stored rows"
+        elif policy['max_bytes'] and (kept_rows + rows) * settings.EQUIPMENT_RETENTION_ROW_BYTES > policy['max_bytes']:
+            reason = f"over {policy['max_bytes']} stored bytes"
+        if reason is None:
+            kept_rows += rows
+        else:
+            doomed.append({
+                'id': upload['id'],
+                'file_name': upload['file_name'],
+                'uploaded_at': upload['uploaded_at'],
+                'rows': rows,
+                'bytes': size,
+                'reason': reason,
+            })
+    doomed.reverse()
+    return doomed
+
+
+def prune(candidates, batch_size=None):
+    """Delete the uploads in `candidates` (from plan()) and their readings; returns the rows deleted."""
+    batch_size = batch_size or settings.EQUIPMENT_RETENTION_BATCH_SIZE
+    deleted_rows = 0
+    for candidate in candidates:
+        readings = EquipmentReading.objects.filter(upload_id=candidate['id'])
+        while True:
+            with serialized_writes(), transaction.atomic():
+                deleted, _ = EquipmentReading.objects.filter(
+                    pk__in=readings.values('pk')[:batch_size]).delete()
+            deleted_rows += deleted
+            if deleted < batch_size:
+                break
+        with serialized_writes(), transaction.atomic():
+            UploadSummary.objects.filter(pk=candidate['id']).delete()
+    return deleted_rows
+
+
+def sweep(dry_run=False, policy=None, batch_size=None):
+    """
+    Apply `policy` (default: settings) once. Returns a report: uploads,
+    rows and bytes reclaimed (or reclaimable, for a dry run) and the
+    candidates themselves.
+    """
+    with timed('retention'):
+        candidates = plan(policy)
+        report = {
+            'dry_run': dry_run,
+            'uploads': len(candidates),
+            'rows': sum(c['rows'] for c in candidates),
+            'bytes': sum(c['bytes'] for c in candidates),
+            'candidates': candidates,
+        }
+        if candidates and not dry_run:
+            report['rows'] = prune(candidates, batch_size)
+    return report
+
+
+def _run_sweeper(interval):
+    while not _stop.wait(interval):
+        try:
+            with exclusive_task('retention') as acquired:
+                if acquired:
+                    report = sweep()
+                    if report['uploads']:
+                        logger.info("Retention removed %d uploads (%d rows)", report['uploads'], report['rows'])
+        except Exception:
+            logger.exception("Retention sweep failed")
+        finally:
+            # Connections of this thread are not closed by the request cycle
+            connection.close()
+
+
+def start_sweeper():
+    """Start the background sweep thread of this process, unless disabled or already running."""
+    global _sweeper
+    interval = settings.EQUIPMENT_RETENTION_SWEEP_SECONDS
+    with _sweeper_lock:
+        if interval <= 0 or (_sweeper is not None and _sweeper.is_alive()):
+            return
+        _stop.clear()
+        _sweeper = threading.Thread(target=_run_sweeper, args=(interval,), name='retention-sweeper', daemon=True)
+        _sweeper.start()
+
+
+def stop_sweeper():
+    global _sweeper
+    with _sweeper_lock:
+        sweeper, _sweeper = _sweeper, None
+        _stop.set()
+    if sweeper is not None:
+        sweeper.join()
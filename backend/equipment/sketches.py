@@ -0,0 +1,245 @@
+"""
+Compact, mergeable summaries of an upload's numeric columns.
+
+Each column, overall and per Type, gets a MomentSketch (count, sum, sum of
+squares, min, max) and a KLLSketch for approximate quantiles. Both merge
+associatively, so statistics across any set of uploads are computed from
+the stored sketches alone, in time proportional to the number of uploads.
+
+Stored on UploadSummary.sketches as::
+
+    {
+        "k": 128,
+        "overall": {"Flowrate": {"moments": {...}, "kll": {...}}, ...},
+        "by_type": {"Pump": {"Flowrate": {...}, ...}, ...},
+    }
+"""
+import math
+
+import numpy as np
+from django.conf import settings
+
+from .models import NUMERIC_COLUMNS
+from .statistics import PERCENTILES, column_stats
+
+
+class MomentSketch:
+    def __init__(self, count=0, total=0.0, total_sq=0.0, minimum=math.inf, maximum=-math.inf):
+        self.count = count
+        self.total = total
+        self.total_sq = total_sq
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_values(cls, values):
+        """Sketch of a float array; NaNs are ignored."""
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return cls()
+        return cls(len(values), float(values.sum()), float(np.dot(values, values)),
+                   float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else float('nan')
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1), like pandas."""
+        if self.count < 2:
+            return float('nan')
+        variance = (self.total_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def to_dict(self):
+        if not self.count:
+            return {'count': 0, 'sum': 0.0, 'sum_sq': 0.0, 'min': None, 'max': None}
+        return {'count': self.count, 'sum': self.total, 'sum_sq': self.total_sq,
+                'min': self.minimum, 'max': self.maximum}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data['count']:
+            return cls()
+        return cls(data['count'], data['sum'], data['sum_sq'], data['min'], data['max'])
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Level h holds items of weight 2**h. A level that outgrows its capacity
+    is sorted and every other item (random offset) is promoted to the next
+    level, so the sketch keeps O(k) items with rank error around 1/k. Bulk
+    updates and compactions operate on whole numpy arrays.
+    """
+
+    C = 2.0 / 3.0
+
+    def __init__(self, k=None, seed=0):
+        self.k = k or settings.EQUIPMENT_SKETCH_K
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * self.C ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind so total weight is preserved
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                paired = items[:len(items) - len(keep)]
+                promoted = paired[self._rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                # Capacities depend on the height, so recheck from the bottom
+                level = 0
+                continue
+            level += 1
+
+    def quantiles(self, qs):
+        """Approximate values at the given quantiles (0..1); NaN when empty."""
+        if not self.n:
+            return [float('nan')] * len(qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items_), 2.0 ** level) for level, items_ in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+        targets = np.asarray(qs, dtype=float) * cumulative[-1]
+        positions = np.searchsorted(cumulative, targets, side='left')
+        return [float(items[min(p, len(items) - 1)]) for p in positions]
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'levels': [items.tolist() for items in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(k=data['k'])
+        sketch.n = data['n']
+        sketch.levels = [np.asarray(items, dtype=float) for items in data['levels']] or [np.empty(0)]
+        return sketch
+
+
+class ColumnSketch:
+    """Moments plus quantile sketch for one column of one group."""
+
+    def __init__(self, moments=None, kll=None):
+        self.moments = moments or MomentSketch()
+        self.kll = kll or KLLSketch()
+
+    def update(self, values):
+        self.moments.merge(MomentSketch.from_values(values))
+        self.kll.update(values)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.kll.merge(other.kll)
+        return self
+
+    def stats(self):
+        """Same shape as equipment.statistics results, percentiles approximate."""
+        m = self.moments
+        quantiles = dict(zip(PERCENTILES, self.kll.quantiles(list(PERCENTILES.values()))))
+        return column_stats(m.count, m.mean, m.std,
+                            m.minimum if m.count else float('nan'),
+                            m.maximum if m.count else float('nan'), quantiles)
+
+    def to_dict(self):
+        return {'moments': self.moments.to_dict(), 'kll': self.kll.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(MomentSketch.from_dict(data['moments']), KLLSketch.from_dict(data['kll']))
+
+
+class UploadSketch:
+    """Column sketches for a whole upload, overall and per Type."""
+
+    def __init__(self):
+        self.overall = {col: ColumnSketch() for col in NUMERIC_COLUMNS}
+        self.by_type = {}
+
+    def update(self, chunk):
+        for col in NUMERIC_COLUMNS:
+            self.overall[col].update(chunk[col].to_numpy(dtype=float))
+        for type_name, positions in chunk.groupby('Type', sort=False, observed=True).indices.items():
+            group = self.by_type.setdefault(str(type_name), {col: ColumnSketch() for col in NUMERIC_COLUMNS})
+            for col in NUMERIC_COLUMNS:
+                group[col].update(chunk[col].to_numpy(dtype=float)[positions])
+
+    def merge(self, other):
+        for col in NUMERIC_COLUMNS:
+            self.overall[col].merge(other.overall[col])
+        for type_name, columns in other.by_type.items():
+            group = self.by_type.setdefault(type_name, {col: ColumnSketch() for col in NUMERIC_COLUMNS})
+            for col in NUMERIC_COLUMNS:
+                group[col].merge(columns[col])
+        return self
+
+    def statistics(self):
+        """Statistics in the equipment.statistics result format."""
+        return {
+            'columns': list(NUMERIC_COLUMNS),
+            'overall': {col: sketch.stats() for col, sketch in self.overall.items()},
+            'by_type': {
+                type_name: {col: sketch.stats() for col, sketch in columns.items()}
+                for type_name, columns in self.by_type.items()
+            },
+        }
+
+    def to_dict(self):
+        return {
+            'k': settings.EQUIPMENT_SKETCH_K,
+            'overall': {col: sketch.to_dict() for col, sketch in self.overall.items()},
+            'by_type': {
+                type_name: {col: sketch.to_dict() for col, sketch in columns.items()}
+                for type_name, columns in self.by_type.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls()
+        sketch.overall = {col: ColumnSketch.from_dict(data['overall'][col]) for col in NUMERIC_COLUMNS}
+        sketch.by_type = {
+            type_name: {col: ColumnSketch.from_dict(columns[col]) for col in NUMERIC_COLUMNS}
+            for type_name, columns in data['by_type'].items()
+        }
+        return sketch
@@ -0,0 +1,268 @@
+"""
+Descriptive statistics for uploaded equipment data.
+
+`describe` computes count, mean, standard deviation, min, max and
+percentiles for every numeric column, overall and per equipment Type, from
+one sort per column: rows are grouped by Type code and each Type's values
+sorted, which yields its moments and percentiles together. `RunningStatistics` produces the
+same structure for streamed uploads by merging per-chunk moments; exact
+percentiles need the whole column, so there they come from the upload's
+quantile sketches instead (see `fill_percentiles`).
+
+Results look like::
+
+    {
+        "columns": ["Flowrate", "Pressure", "Temperature"],
+        "overall": {"Flowrate": {"count": 5, "mean": 123.0, ...}, ...},
+        "by_type": {"Pump": {"Flowrate": {...}, ...}, ...},
+    }
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from .models import NUMERIC_COLUMNS
+
+PERCENTILES = {'p25': 0.25, 'p50': 0.5, 'p75': 0.75, 'p95': 0.95}
+MOMENTS = ['count', 'mean', 'var', 'min', 'max']
+# Group key used for the whole-upload moments in RunningStatistics
+_ALL = '__all__'
+
+
+def _number(value):
+    """JSON-safe float: NaN (e.g. the std of a single value) becomes None."""
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def column_stats(count, mean, std, minimum, maximum, quantiles=None):
+    stats = {
+        'count': int(count),
+        'mean': _number(mean),
+        'std': _number(std),
+        'min': _number(minimum),
+        'max': _number(maximum),
+    }
+    for name in PERCENTILES:
+        stats[name] = _number(quantiles[name]) if quantiles is not None else None
+    return stats
+
+
+def _to_result(overall, by_type):
+    """Assemble the result dict from {key: {col: stats}} mappings."""
+    return {
+        'columns': list(NUMERIC_COLUMNS),
+        'overall': overall,
+        'by_type': by_type,
+    }
+
+
+def describe(df):
+    """
+    Exact statistics for a whole upload frame.
+
+    A stable sort of the Type codes groups the rows once; each column is
+    taken in that order and every Type's slice sorted in place (NaNs go
+    last), so count, min, max and percentiles are read off the ends and
+    positions of the slice. The overall moments are merged from the
+    per-Type ones and the overall percentiles selected from the sorted
+    slices (see _select), so no column is sorted twice.
+    """
+    codes, names = _type_codes(df['Type'])
+    # Blank Types (code -1) come first; they only count towards the overall statistics
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes + 1, minlength=len(names) + 1))])
+    groups = [(position, start, end) for position, (start, end) in enumerate(zip(bounds[1:-1], bounds[2:]))
+              if end > start]
+    # Types in order of first appearance, like groupby(sort=False)
+    groups.sort(key=lambda group: order[group[1]])
+
+    overall = {}
+    by_type = {str(names[position]): {} for position, _, _ in groups}
+    for col in NUMERIC_COLUMNS:
+        grouped = df[col].to_numpy(dtype=float)[order]
+        slices = [grouped[:bounds[1]]] + [grouped[start:end] for _, start, end in groups]
+        valid = []
+        moments = []
+        for values in slices:
+            values.sort()
+            values = values[:np.searchsorted(values, np.nan)]
+            valid.append(values)
+            moments.append(_sorted_moments(values))
+        for (position, _, _), values, m in zip(groups, valid[1:], moments[1:]):
+            by_type[str(names[position])][col] = _sorted_stats(values, *m)
+        overall[col] = _merged_stats([values for values in valid if len(values)], moments)
+    return _to_result(overall, by_type)
+
+
+def _type_codes(types):
+    """Integer codes of a Type column (-1 for blank) and the names they stand for."""
+    if isinstance(types.dtype, pd.CategoricalDtype):
+        # What the readers produce: the codes are already there
+        return types.cat.codes.to_numpy(), types.cat.categories
+    return pd.factorize(types)
+
+
+def _sorted_moments(values):
+    """(count, mean, sum of squared deviations) of sorted, NaN-free `values`."""
+    count = len(values)
+    if not count:
+        return 0, math.nan, 0.0
+    mean = values.mean()
+    deviation = values - mean
+    return count, mean, float(np.dot(deviation, deviation))
+
+
+def _std(count, m2):
+    return math.sqrt(m2 / (count - 1)) if count > 1 else math.nan
+
+
+def _percentile_ranks(count):
+    """Lower and upper ranks and weights for linear interpolation, as in Series.quantile()."""
+    positions = np.array(list(PERCENTILES.values())) * (count - 1)
+    lower = np.floor(positions).astype(np.int64)
+    return lower, np.minimum(lower + 1, count - 1), positions - lower
+
+
+def _interpolate(lower_values, upper_values, weights):
+    # numpy's lerp, which interpolates from the nearer end
+    difference = upper_values - lower_values
+    values = np.where(weights >= 0.5, upper_values - difference * (1 - weights), lower_values + difference * weights)
+    return dict(zip(PERCENTILES, values))
+
+
+def _sorted_stats(values, count, mean, m2):
+    if not count:
+        return column_stats(0, math.nan, math.nan, math.nan, math.nan, dict.fromkeys(PERCENTILES, math.nan))
+    lower, upper, weights = _percentile_ranks(count)
+    quantiles = _interpolate(values[lower], values[upper], weights)
+    return column_stats(count, mean, _std(count, m2), values[0], values[-1], quantiles)
+
+
+def _merged_stats(valid, moments):
+    """Overall stats from the sorted slices of every Type and their moments."""
+    moments = [m for m in moments if m[0]]
+    count = sum(n for n, _, _ in moments)
+    if not count:
+        return _sorted_stats(None, 0, math.nan, 0.0)
+    mean = sum(n * slice_mean for n, slice_mean, _ in moments) / count
+    # Parallel variance: each slice's own deviations plus its mean's deviation from the overall one
+    m2 = sum(slice_m2 + n * (slice_mean - mean) ** 2 for n, slice_mean, slice_m2 in moments)
+    lower, upper, weights = _percentile_ranks(count)
+    ranks = np.union1d(lower, upper)
+    selected = dict(zip(ranks.tolist(), _select(valid, ranks)))
+    quantiles = _interpolate(np.array([selected[r] for r in lower.tolist()]),
+                             np.array([selected[r] for r in upper.tolist()]), weights)
+    return column_stats(count, mean, _std(count, m2), min(values[0] for values in valid),
+                        max(values[-1] for values in valid), quantiles)
+
+
+def _select(valid, ranks):
+    """
+    The values at 0-based `ranks` of the sorted, NaN-free arrays in `valid`
+    taken together, without merging them. The value at rank r lies between
+    the lowest and the highest of the arrays' values at their share of r
+    (r * n_i / n, rounded down and up), so only the values in that window
+    are partitioned.
+    """
+    sizes = [len(values) for values in valid]
+    total = sum(sizes)
+    lows, highs = [], []
+    for values, size in zip(valid, sizes):
+        lows.append(values[ranks * size // total])
+        upper = -(-ranks * size // total)
+        highs.append(np.where(upper < size, values[np.minimum(upper, size - 1)], np.inf))
+    selected = []
+    for rank, low, high in zip(ranks.tolist(), np.min(lows, axis=0), np.max(highs, axis=0)):
+        below = 0
+        window = []
+        for values in valid:
+            start = np.searchsorted(values, low, side='left')
+            below += start
+            window.append(values[start:np.searchsorted(values, high, side='right')])
+        window = np.concatenate(window)
+        selected.append(np.partition(window, rank - below)[rank - below])
+    return selected
+
+
+def _chunk_moments(values, keys):
+    """count/mean/m2/min/max per key and column, as a frame indexed by key."""
+    moments = values.groupby(keys, sort=False, observed=True).agg(MOMENTS)
+    for col in NUMERIC_COLUMNS:
+        count = moments[(col, 'count')]
+        # Sum of squared deviations; var is NaN for a single value, where m2 is 0
+        moments[(col, 'var')] = (moments[(col, 'var')] * (count - 1)).fillna(0.0)
+    return moments.rename(columns={'var': 'm2'}, level=1)
+
+
+def _merge_moments(a, b):
+    """Combine two moment frames (Chan et al. parallel variance update)."""
+    if a is None:
+        return b
+    index = a.index.union(b.index, sort=False)
+    a = a.reindex(index)
+    b = b.reindex(index)
+    merged = {}
+    for col in NUMERIC_COLUMNS:
+        na = a[(col, 'count')].fillna(0)
+        nb = b[(col, 'count')].fillna(0)
+        n = na + nb
+        mean_a = a[(col, 'mean')]
+        mean_b = b[(col, 'mean')]
+        delta = mean_b - mean_a
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (mean_a + delta * nb / n).where((na > 0) & (nb > 0), mean_a.fillna(mean_b))
+            correction = (delta ** 2 * na * nb / n).fillna(0.0)
+        merged[(col, 'count')] = n
+        merged[(col, 'mean')] = mean
+        merged[(col, 'm2')] = a[(col, 'm2')].fillna(0.0) + b[(col, 'm2')].fillna(0.0) + correction
+        merged[(col, 'min')] = np.fmin(a[(col, 'min')], b[(col, 'min')])
+        merged[(col, 'max')] = np.fmax(a[(col, 'max')], b[(col, 'max')])
+    return pd.DataFrame(merged, index=index)
+
+
+def _moments_to_stats(moments):
+    result = {}
+    for position, key in enumerate(moments.index):
+        entry = {}
+        for col in NUMERIC_COLUMNS:
+            count = moments[(col, 'count')].iloc[position]
+            m2 = moments[(col, 'm2')].iloc[position]
+            std = math.sqrt(m2 / (count - 1)) if count > 1 else float('nan')
+            entry[col] = column_stats(count, moments[(col, 'mean')].iloc[position], std,
+                                      moments[(col, 'min')].iloc[position], moments[(col, 'max')].iloc[position])
+        result[str(key)] = entry
+    return result
+
+
+class RunningStatistics:
+    """Mergeable moments for streamed uploads; see the module docstring."""
+
+    def __init__(self):
+        self._overall = None
+        self._by_type = None
+
+    def update(self, chunk):
+        values = chunk[NUMERIC_COLUMNS]
+        overall_keys = pd.Series(_ALL, index=chunk.index)
+        self._overall = _merge_moments(self._overall, _chunk_moments(values, overall_keys))
+        self._by_type = _merge_moments(self._by_type, _chunk_moments(values, chunk['Type']))
+
+    def result(self):
+        if self._overall is None:
+            return _to_result({}, {})
+        overall = _moments_to_stats(self._overall)
+        return _to_result(overall[_ALL], _moments_to_stats(self._by_type))
+
+
+def fill_percentiles(result, approximate):
+    """Copy percentiles missing from `result` out of another result, e.g. UploadSketch.statistics()."""
+    groups = [(result['overall'], approximate['overall'])]
+    groups += [(columns, approximate['by_type'].get(type_name, {})) for type_name, columns in result['by_type'].items()]
+    for columns, source in groups:
+        for col, stats in columns.items():
+            for name in PERCENTILES:
+                if stats[name] is None and col in source:
+                    stats[name] = source[col][name]
+    return result
@@ -1,3 +1,1004 @@
-from django.test import TestCase
+import bz2
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import batch, db, events, export, history, ingest, query, retention, statistics, workers
+from .compression import zstandard
+from .jobs import create_job, progress_path, recover, run_job
+from .metrics import PHASE_SECONDS, Histogram
+from .models import EquipmentReading, UploadJob, UploadSummary
+from .readers import HAS_PYARROW, detect_format, local_path
+from .reports import report_cache
+from .sketches import KLLSketch
+
+SAMPLE_CSV = (
+    b"Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+    b"Pump-1,Pump,120,15,60\n"
+    b"Pump-2,Pump,130,16,62\n"
+    b"Valve-1,Valve,80,10,45\n"
+    b"Reactor-1,Reactor,200,25,120\n"
+    b"Valve-2,Valve,85,,47\n"
+)
+
+
+def csv_upload(content=SAMPLE_CSV, name='equipment.csv'):
+    return SimpleUploadedFile(name, content, content_type='text/csv')
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # A private cache, so cached history pages never leak between tests or into the dev cache dir
+        settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': self.id()}})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        user = get_user_model().objects.create_user('tester', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def upload(self, content=SAMPLE_CSV, name='equipment.csv', **extra):
+        return self.client.post('/api/upload/', {'file': csv_upload(content, name)}, format='multipart', **extra)
+
+
+class UploadCSVViewTests(APITestCase):
+    def test_upload_returns_summary(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_count'], 5)
+        self.assertEqual(response.data['avg_flowrate'], 123.0)
+        self.assertEqual(response.data['avg_pressure'], 16.5)
+        self.assertEqual(response.data['type_distribution'], {'Pump': 2, 'Valve': 2, 'Reactor': 1})
+        self.assertFalse(response.data['cached'])
+        self.assertEqual(UploadSummary.objects.count(), 1)
+
+    @override_settings(EQUIPMENT_MAX_UPLOAD_BYTES=100)
+    def test_oversized_body_is_rejected(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('100 byte limit', response.json()['error'])
+        self.assertEqual(UploadSummary.objects.count(), 0)
+
+    @override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+    def test_streaming_matches_whole_file(self):
+        whole = self.upload().data
+        with override_settings(EQUIPMENT_STREAM_THRESHOLD=0, EQUIPMENT_INGEST_CHUNK_ROWS=2):
+            streamed = self.upload().data
+        self.assertEqual({**streamed, 'id': None}, {**whole, 'id': None})
+        first, second = UploadSummary.objects.order_by('id')
+        self.assertEqual(first.avg_pressure, second.avg_pressure)
+        self.assertEqual(first.type_distribution, second.type_distribution)
+
+    @override_settings(EQUIPMENT_STREAM_THRESHOLD=0, EQUIPMENT_INGEST_CHUNK_ROWS=2)
+    def test_streaming_rejects_bad_value_in_later_chunk(self):
+        response = self.upload(SAMPLE_CSV + b"Pump-3,Pump,abc,15,60\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Column Flowrate must be numeric')
+        self.assertFalse(UploadSummary.objects.exists())
+
+    def test_missing_columns(self):
+        response = self.upload(b"Equipment Name,Type,Flowrate\nPump-1,Pump,1\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Missing columns', response.data['error'])
+
+    def test_unused_columns_are_not_parsed(self):
+        # Extra columns are skipped by the reader, so junk in them is not an error
+        content = b"Site,Equipment Name,Type,Flowrate,Pressure,Temperature,Notes\n"
+        content += b"A,Pump-1,Pump,120,15,60,not a number\nB,Valve-1,Valve,80,,45,\n"
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['type_distribution'], {'Pump': 1, 'Valve': 1})
+        self.assertEqual(response.data['avg_pressure'], 15.0)
+
+    def test_header_only_file_is_empty(self):
+        response = self.upload(SAMPLE_CSV.splitlines(keepends=True)[0])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'File is empty')
+
+
+class EquipmentReadingTests(APITestCase):
+    def test_rows_are_stored_with_summary(self):
+        self.upload()
+        summary = UploadSummary.objects.get()
+        readings = list(summary.readings.order_by('id').values_list(
+            'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature'))
+        self.assertEqual(len(readings), 5)
+        self.assertEqual(readings[0], ('Pump-1', 'Pump', 120.0, 15.0, 60.0))
+        self.assertEqual(readings[4], ('Valve-2', 'Valve', 85.0, None, 47.0))
+
+    @override_settings(EQUIPMENT_STREAM_THRESHOLD=0, EQUIPMENT_INGEST_CHUNK_ROWS=2, EQUIPMENT_READING_BATCH_SIZE=3)
+    def test_streamed_rows_are_all_stored(self):
+        self.upload()
+        self.assertEqual(EquipmentReading.objects.count(), 5)
+
+    def test_rows_are_parsed_outside_the_write_lock(self):
+        phases = []
+
+        def progress(snapshot):
+            phases.append((snapshot['phase'], getattr(db._held, 'depth', 0)))
+
+        upload = ingest.ingest_upload(csv_upload(), chunk_rows=2, on_progress=progress)
+        self.assertEqual(upload.readings.count(), 5)
+        self.assertEqual({phase for phase, _ in phases}, {'parsing', 'anomalies', 'saving'})
+        self.assertEqual({depth for _, depth in phases}, {0})
+
+    def test_failed_upload_stores_no_rows(self):
+        self.upload(SAMPLE_CSV + b"Pump-3,Pump,abc,15,60\n")
+        self.assertFalse(EquipmentReading.objects.exists())
+
+    @override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+    def test_pruned_summaries_take_their_rows(self):
+        for _ in range(6):
+            self.upload()
+        # Retention runs in the background, not on the request path
+        self.assertEqual(UploadSummary.objects.count(), 6)
+        retention.sweep(batch_size=2)
+        self.assertEqual(UploadSummary.objects.count(), 5)
+        self.assertEqual(EquipmentReading.objects.count(), 25)
+        self.assertEqual(set(EquipmentReading.objects.values_list('upload_id', flat=True).distinct()),
+                         set(UploadSummary.objects.values_list('id', flat=True)))
+
+
+@override_settings(EQUIPMENT_UPLOAD_DEDUP=False, EQUIPMENT_RETENTION_KEEP_LAST=0)
+class RetentionTests(APITestCase):
+    def make_uploads(self, *ages_days):
+        """One upload per age (in days), oldest first."""
+        now = timezone.now()
+        for age in sorted(ages_days, reverse=True):
+            upload_id = self.upload().data['id']
+            UploadSummary.objects.filter(pk=upload_id).update(uploaded_at=now - timedelta(days=age))
+
+    def test_dry_run_reports_without_deleting(self):
+        self.make_uploads(3, 2, 1)
+        report = retention.sweep(dry_run=True, policy=retention.policy_from_settings(keep_last=1))
+        self.assertEqual((report['uploads'], report['rows']), (2, 10))
+        self.assertEqual(report['bytes'], 10 * settings.EQUIPMENT_RETENTION_ROW_BYTES)
+        self.assertEqual(report['candidates'][0]['reason'], 'beyond the newest 1')
+        self.assertEqual(UploadSummary.objects.count(), 3)
+        self.assertEqual(EquipmentReading.objects.count(), 15)
+
+    def test_age_and_row_policies(self):
+        self.make_uploads(10, 5, 1, 0)
+        with override_settings(EQUIPMENT_RETENTION_MAX_AGE_DAYS=7):
+            self.assertEqual(retention.sweep()['uploads'], 1)
+        with override_settings(EQUIPMENT_RETENTION_MAX_ROWS=12):
+            self.assertEqual(retention.sweep(batch_size=2)['rows'], 5)
+        self.assertEqual(UploadSummary.objects.count(), 2)
+        self.assertEqual(EquipmentReading.objects.count(), 10)
+
+    def test_newest_upload_is_always_kept(self):
+        self.make_uploads(2, 1)
+        retention.sweep(policy=retention.policy_from_settings(max_rows=1))
+        self.assertEqual(list(UploadSummary.objects.values_list('total_equipment', flat=True)), [5])
+
+    def test_command(self):
+        self.make_uploads(2, 1)
+        out = io.StringIO()
+        call_command('prune_uploads', '--dry-run', '--keep-last', '1', stdout=out)
+        self.assertIn('Would reclaim 1 uploads, 5 rows', out.getvalue())
+        call_command('prune_uploads', '--keep-last', '1', stdout=out)
+        self.assertEqual(UploadSummary.objects.count(), 1)
+
+
+class UploadDedupTests(APITestCase):
+    def test_identical_upload_is_served_from_cache(self):
+        first = self.upload()
+        second = self.upload(name='station-2.csv')
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(second.data['cached'])
+        self.assertEqual({**second.data, 'cached': False}, first.data)
+        self.assertEqual(UploadSummary.objects.count(), 1)
+
+    def test_digest_is_stored(self):
+        self.upload()
+        self.assertEqual(UploadSummary.objects.get().content_sha256, hashlib.sha256(SAMPLE_CSV).hexdigest())
+
+    def test_different_content_is_parsed(self):
+        self.upload()
+        response = self.upload(SAMPLE_CSV + b"Pump-3,Pump,140,17,61\n")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(UploadSummary.objects.count(), 2)
+
+    @override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+    def test_dedup_can_be_disabled(self):
+        self.upload()
+        response = self.upload()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(UploadSummary.objects.count(), 2)
+
+
+class AsyncUploadTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        self.spool_dir = spool.name
+        settings_override = override_settings(EQUIPMENT_JOB_WORKERS=0, EQUIPMENT_JOB_SPOOL_DIR=spool.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload_async(self, content=SAMPLE_CSV):
+        return self.client.post('/api/upload/?mode=async', {'file': csv_upload(content)}, format='multipart')
+
+    def test_async_upload_returns_job(self):
+        response = self.upload_async()
+        self.assertEqual(response.status_code, 202)
+        job = self.client.get(response.data['status_url']).data
+        self.assertEqual(job['state'], UploadJob.SUCCEEDED)
+        self.assertEqual(job['rows_processed'], 5)
+        self.assertEqual(job['summary']['total_count'], 5)
+        self.assertIsNotNone(job['run_seconds'])
+        self.assertEqual(UploadSummary.objects.count(), 1)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_failed_job_reports_error(self):
+        response = self.upload_async(SAMPLE_CSV + b"Pump-3,Pump,abc,15,60\n")
+        job = self.client.get(response.data['status_url']).data
+        self.assertEqual(job['state'], UploadJob.FAILED)
+        self.assertEqual(job['error'], 'Column Flowrate must be numeric')
+        self.assertIsNone(job['summary'])
+
+    def test_failure_to_start_is_recorded(self):
+        job = create_job(csv_upload())
+        with mock.patch.object(UploadJob, 'save', side_effect=[RuntimeError('disk full'), None]), \
+                self.assertLogs('equipment.jobs', 'ERROR'):
+            self.assertEqual(run_job(job.pk), UploadJob.FAILED)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_recover_fails_interrupted_jobs(self):
+        queued = create_job(csv_upload())
+        running = create_job(csv_upload())
+        UploadJob.objects.filter(pk=running.pk).update(state=UploadJob.RUNNING)
+        open(progress_path(running), 'w').close()
+        open(f'{running.file_path}.rows', 'w').close()
+        unrelated = os.path.join(self.spool_dir, 'notes.upload.txt')
+        open(unrelated, 'w').close()
+        self.upload_async()
+
+        with self.assertLogs('equipment.jobs', 'WARNING'):
+            self.assertEqual(recover(), 2)
+        self.assertEqual(sorted(os.listdir(self.spool_dir)), ['jobs.lock', 'notes.upload.txt'])
+        for job in (queued, running):
+            job.refresh_from_db()
+            self.assertEqual((job.state, job.error), (UploadJob.FAILED, 'Interrupted by a server restart'))
+        self.assertEqual(UploadJob.objects.filter(state=UploadJob.SUCCEEDED).count(), 1)
+
+    @skipIf(os.name == 'nt', 'fcntl is not available')
+    def test_recover_leaves_jobs_of_running_server(self):
+        import fcntl
+        job = create_job(csv_upload())
+        # Another server (the old gunicorn master during a USR2 restart) holds the claim
+        with open(os.path.join(self.spool_dir, 'jobs.lock'), 'a') as other:
+            fcntl.flock(other, fcntl.LOCK_SH)
+            self.assertEqual(recover(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.state, UploadJob.QUEUED)
+        self.assertTrue(os.path.exists(job.file_path))
+
+    def test_unknown_job(self):
+        response = self.client.get('/api/jobs/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(response.status_code, 404)
+
+    def read_events(self, response):
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        received = []
+        for block in body.split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+            if 'event' in fields:
+                received.append((fields['event'], json.loads(fields['data'])))
+        return received
+
+    def test_events_for_finished_job(self):
+        job_url = self.upload_async().data['status_url']
+        received = self.read_events(self.client.get(job_url + 'events/', HTTP_ACCEPT='text/event-stream'))
+        self.assertEqual([name for name, _ in received], ['done'])
+        self.assertEqual(received[0][1]['phase'], UploadJob.SUCCEEDED)
+        self.assertEqual(received[0][1]['summary']['total_count'], 5)
+
+    def test_events_report_progress_of_running_job(self):
+        job = create_job(csv_upload())
+        job.state = UploadJob.RUNNING
+        job.save()
+        progress = {'phase': 'parsing', 'rows_processed': 3, 'bytes_processed': 80, 'bytes_total': 160,
+                    'running': {'total_count': 3}}
+        with open(progress_path(job), 'w') as f:
+            json.dump(progress, f)
+        stream = events.job_events(job.pk, poll_interval=0, max_seconds=0)
+        self.assertTrue(next(stream).startswith('retry: '))
+        self.assertIn('event: progress', next(stream))
+        self.assertEqual(list(stream), [])
+
+        # A reconnecting client gets the current progress, numbered after the last event it saw
+        with override_settings(EQUIPMENT_EVENTS_MAX_SECONDS=0):
+            response = self.client.get(f'/api/jobs/{job.pk}/events/', HTTP_LAST_EVENT_ID='7')
+            body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: progress\nid: 8\n', body)
+        self.assertEqual(events.parse_last_event_id('\u00b2'), 0)
+
+        job.state = UploadJob.SUCCEEDED
+        job.result = {'total_count': 5}
+        job.save()
+        name, data = self.read_events(self.client.get(f'/api/jobs/{job.pk}/events/'))[0]
+        self.assertEqual((name, data['summary']), ('done', {'total_count': 5}))
+
+
+class ReportViewTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        report_cache.clear()
+
+    def test_report_is_rendered_once(self):
+        self.upload()
+        first = self.client.get('/api/report/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+        self.assertTrue(first.content.startswith(b'%PDF'))
+        second = self.client.get('/api/report/')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(report_cache), 1)
+        self.assertEqual(report_cache.hits, 1)
+
+    def test_conditional_get_returns_304(self):
+        self.upload()
+        first = self.client.get('/api/report/')
+        response = self.client.get('/api/report/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/report/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+    def test_report_for_specific_upload(self):
+        self.upload()
+        self.upload()
+        older, newer = UploadSummary.objects.order_by('id')
+        response = self.client.get(f'/api/report/?id={older.id}')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="report_{older.id}.pdf"')
+        self.assertNotEqual(response['ETag'], self.client.get('/api/report/')['ETag'])
+        self.assertEqual(self.client.get('/api/report/?id=999').status_code, 404)
+        self.assertEqual(self.client.get('/api/report/?id=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/report/?id=²').status_code, 400)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = type(report_cache)(max_bytes=10)
+        cache.put('a', b'12345')
+        cache.put('b', b'12345')
+        cache.get('a')
+        cache.put('c', b'12345')
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.size, 10)
+
+
+class HistoryViewTests(APITestCase):
+    def upload_committed(self, name):
+        # History is invalidated on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(SAMPLE_CSV + f"{name},Pump,100,5,50\n".encode(), name=f'{name}.csv')
+
+    def test_lists_newest_first(self):
+        self.upload_committed('a')
+        self.upload_committed('b')
+        response = self.client.get('/api/history/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['file_name'] for item in response.json()], ['b.csv', 'a.csv'])
+        self.assertEqual(set(response.json()[0]), set(history.HISTORY_FIELDS))
+
+    def test_unchanged_poll_returns_304_without_query(self):
+        self.upload_committed('a')
+        etag = self.client.get('/api/history/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/history/').status_code, 200)
+
+        self.upload_committed('b')
+        response = self.client.get('/api/history/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    @override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+    def test_keyset_pages(self):
+        for name in 'abc':
+            self.upload_committed(name)
+        # Same timestamp for all three: the id breaks the tie
+        UploadSummary.objects.update(uploaded_at=UploadSummary.objects.first().uploaded_at)
+        history.invalidate()
+        names, url = [], '/api/history/?limit=2'
+        while url:
+            response = self.client.get(url)
+            names += [item['file_name'] for item in response.json()]
+            url = response.get('Link', '').partition('>')[0].lstrip('<')
+        self.assertEqual(names, ['c.csv', 'b.csv', 'a.csv'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/history/?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/history/?cursor=!!').status_code, 400)
+
+
+@override_settings(EQUIPMENT_UPLOAD_DEDUP=False, EQUIPMENT_EXPORT_CHUNK_ROWS=2)
+class ExportTests(APITestCase):
+    def export(self, **params):
+        response = self.client.get('/api/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_readings_ndjson(self):
+        first = self.upload().data['id']
+        self.upload()
+        lines = self.export().decode().splitlines()
+        self.assertEqual(len(lines), 10)
+        row = json.loads(lines[0])
+        self.assertEqual(row['upload_id'], first)
+        self.assertEqual(list(row), list(export.DATASETS['readings']['default']))
+
+    def test_column_selection_and_upload_filter(self):
+        self.upload()
+        second = self.upload().data['id']
+        body = self.export(format='csv', columns='equipment_name,flowrate', upload=str(second))
+        frame = pd.read_csv(io.BytesIO(body))
+        self.assertEqual(list(frame.columns), ['equipment_name', 'flowrate'])
+        self.assertEqual(len(frame), 5)
+        self.assertEqual(frame['flowrate'].sum(), 615)
+
+    def test_summaries_keep_json_columns(self):
+        upload_id = self.upload().data['id']
+        row = json.loads(self.export(dataset='summaries'))
+        self.assertEqual(row['id'], upload_id)
+        self.assertEqual(row['type_distribution'], UploadSummary.objects.get().type_distribution)
+
+    @skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_columnar_formats(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.upload()
+        table = pq.read_table(io.BytesIO(self.export(format='parquet')))
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(pq.ParquetFile(io.BytesIO(self.export(format='parquet'))).num_row_groups, 3)
+        self.assertEqual(sum(table.column('flowrate').to_pylist()), 615)
+        stream = pa.ipc.open_stream(self.export(format='arrow', dataset='summaries'))
+        self.assertEqual(stream.read_all().column('total_equipment').to_pylist(), [5])
+
+    def test_invalid_parameters(self):
+        for params in ({'format': 'xml'}, {'dataset': 'users'}, {'columns': 'password'}, {'upload': 'x'}):
+            response = self.client.get('/api/export/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.data)
+
+
+@override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+class ReadingsQueryTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = self.upload().data['id']
+        self.latest = self.upload(SAMPLE_CSV + b"Reactor-2,Reactor,210,26,120\nReactor-3,Reactor,190,24,118\n").data['id']
+
+    def names(self, response):
+        self.assertEqual(response.status_code, 200, response.data)
+        return [row['equipment_name'] for row in response.data['results']]
+
+    def test_filters_on_latest_upload(self):
+        response = self.client.get('/api/readings/', {'type': 'Reactor', 'temperature_gt': 118})
+        self.assertEqual(response.data['upload'], self.latest)
+        self.assertEqual(self.names(response), ['Reactor-1', 'Reactor-2'])
+        self.assertEqual(self.names(self.client.get('/api/readings/', {'name_prefix': 'Valve'})),
+                         ['Valve-1', 'Valve-2'])
+        response = self.client.get('/api/readings/', {'upload': self.first, 'pressure_gte': 15, 'pressure_lt': 25})
+        self.assertEqual(self.names(response), ['Pump-1', 'Pump-2'])
+
+    def test_keyset_pages_cover_every_row_once(self):
+        for params in ({}, {'temperature_gte': 45}, {'name_prefix': 'Reactor-'}, {'type': 'Reactor', 'flowrate_gt': 0}):
+            expected = self.names(self.client.get('/api/readings/', params))
+            names, url, data = [], '/api/readings/', {**params, 'limit': 1}
+            while url:
+                response = self.client.get(url, data)
+                names += self.names(response)
+                url, data = response.data['next'], None
+            self.assertEqual(names, expected, params)
+        # Equal temperatures (120) are ordered by id
+        self.assertEqual(self.names(self.client.get('/api/readings/', {'temperature_gt': 100})),
+                         ['Reactor-3', 'Reactor-1', 'Reactor-2'])
+
+    def test_queries_use_composite_indexes(self):
+        cases = [
+            ({'type': 'Reactor'}, 'reading_upload_type_idx'),
+            ({'name_prefix': 'Pump'}, 'reading_upload_name_idx'),
+            ({'type': 'Reactor', 'temperature_gt': 110.0}, 'reading_upload_temp_idx'),
+            ({'flowrate_gte': 100.0, 'flowrate_lte': 150.0}, 'reading_upload_flowrate_idx'),
+            ({'pressure_lt': 20.0, 'name_prefix': 'P'}, 'reading_upload_pressure_idx'),
+        ]
+        for params, index in cases:
+            filters = query.parse_filters(params)
+            rows, cursor = query.page(self.latest, filters, limit=1)
+            for page_cursor in (None, cursor):
+                plan = query.build(self.latest, filters, page_cursor)[0].explain()
+                self.assertIn(f'USING INDEX {index}', plan, params)
+                # The index delivers page order: no sort of the matching rows
+                self.assertNotIn('TEMP B-TREE', plan, params)
+
+    def test_invalid_parameters(self):
+        for params in ({'temperature_gt': 'hot'}, {'temperature_gt': 'nan'}, {'flowrate_lte': 'inf'},
+                       {'pressure_gte': '1e999'}, {'limit': 0}, {'cursor': 'x'}, {'upload': 'a'},
+                       {'upload': '\u00b2'}):
+            self.assertEqual(self.client.get('/api/readings/', params).status_code, 400, params)
+        cursor = query.encode_cursor('id', {'id': 1})
+        response = self.client.get('/api/readings/', {'cursor': cursor, 'temperature_gt': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/readings/', {'upload': 999}).status_code, 404)
+
+
+class StatisticsTests(APITestCase):
+    def test_stats_endpoint(self):
+        upload_id = self.upload().data['id']
+        data = self.client.get(f'/api/stats/{upload_id}/').data
+        self.assertEqual(data['columns'], ['Flowrate', 'Pressure', 'Temperature'])
+        flowrate = data['overall']['Flowrate']
+        self.assertEqual(flowrate['count'], 5)
+        self.assertEqual(flowrate['min'], 80.0)
+        self.assertEqual(flowrate['max'], 200.0)
+        self.assertEqual(flowrate['p50'], 120.0)
+        self.assertEqual(data['overall']['Pressure']['count'], 4)
+        pump = data['by_type']['Pump']['Pressure']
+        self.assertEqual((pump['count'], pump['mean'], pump['min'], pump['max']), (2, 15.5, 15.0, 16.0))
+        self.assertAlmostEqual(pump['std'], 0.7071067811865476)
+        self.assertIsNone(data['by_type']['Reactor']['Flowrate']['std'])
+        self.assertEqual(self.client.get('/api/stats/999/').status_code, 404)
+
+    def test_describe_matches_pandas(self):
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            'Type': pd.Categorical(rng.choice(['Pump', 'Valve', 'Reactor', None], 3000)),
+            'Flowrate': rng.normal(100, 20, 3000),
+            'Pressure': rng.integers(0, 5, 3000).astype(float),
+            'Temperature': np.nan,
+        })
+        df.loc[df['Type'] == 'Reactor', 'Flowrate'] += 1000
+        df.loc[::7, 'Pressure'] = np.nan
+        result = statistics.describe(df)
+        self.assertEqual(list(result['by_type']), list(df['Type'].dropna().unique()))
+        quantiles = list(statistics.PERCENTILES.values())
+        groups = [('overall', df)] + [(name, group) for name, group in df.groupby('Type', observed=True)]
+        for name, group in groups:
+            stats = result['overall'] if name == 'overall' else result['by_type'][name]
+            for col in ('Flowrate', 'Pressure'):
+                values = group[col]
+                expected = [values.count(), values.mean(), values.std(), values.min(), values.max(),
+                            *values.quantile(quantiles)]
+                actual = [stats[col][key] for key in ('count', 'mean', 'std', 'min', 'max', *statistics.PERCENTILES)]
+                np.testing.assert_allclose(actual, expected, rtol=1e-12, err_msg=f'{name} {col}')
+            self.assertEqual(stats['Temperature']['count'], 0)
+
+    @override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+    def test_streamed_moments_match_exact(self):
+        exact = self.client.get(f"/api/stats/{self.upload().data['id']}/").data
+        with override_settings(EQUIPMENT_STREAM_THRESHOLD=0, EQUIPMENT_INGEST_CHUNK_ROWS=2):
+            streamed = self.client.get(f"/api/stats/{self.upload().data['id']}/").data
+        self.assertEqual(set(streamed['by_type']), set(exact['by_type']))
+        for key in ('count', 'mean', 'std', 'min', 'max'):
+            self.assertAlmostEqual(streamed['overall']['Flowrate'][key], exact['overall']['Flowrate'][key])
+            self.assertEqual(streamed['by_type']['Valve']['Pressure'][key], exact['by_type']['Valve']['Pressure'][key])
+        # Percentiles come from the quantile sketch, exact for a file this small
+        self.assertEqual(streamed['overall']['Flowrate']['p50'], exact['overall']['Flowrate']['p50'])
+
+
+class RollupTests(APITestCase):
+    OTHER_CSV = (
+        b"Equipment Name,Type,Flowrate,Pressure,Temperature\n"
+        b"Pump-9,Pump,100,20,70\n"
+        b"Mixer-1,Mixer,50,5,30\n"
+    )
+
+    def test_rollup_merges_uploads(self):
+        self.upload()
+        self.upload(self.OTHER_CSV)
+        data = self.client.get('/api/rollup/').data
+        self.assertEqual(len(data['upload_ids']), 2)
+        pump = data['by_type']['Pump']['Flowrate']
+        self.assertEqual((pump['count'], pump['min'], pump['max']), (3, 100.0, 130.0))
+        self.assertAlmostEqual(pump['mean'], 350 / 3)
+        self.assertAlmostEqual(pump['std'], 15.275252316519467)
+        self.assertEqual(data['overall']['Pressure']['count'], 6)
+        self.assertIn('Mixer', data['by_type'])
+
+        latest = self.client.get('/api/rollup/?last=1').data
+        self.assertEqual(latest['overall']['Flowrate']['count'], 2)
+        self.assertEqual(self.client.get('/api/rollup/?last=x').status_code, 400)
+        self.assertEqual(self.client.get('/api/rollup/?last=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/rollup/?last=²').status_code, 400)
+
+    def test_rollup_without_uploads(self):
+        self.assertEqual(self.client.get('/api/rollup/').status_code, 404)
+
+    def test_kll_quantiles_after_merge(self):
+        values = np.arange(100_000, dtype=float)
+        merged = KLLSketch(k=200).update(values[::2]).merge(KLLSketch(k=200, seed=1).update(values[1::2]))
+        self.assertEqual(merged.n, 100_000)
+        for q, estimate in zip([0.25, 0.5, 0.95], merged.quantiles([0.25, 0.5, 0.95])):
+            self.assertLess(abs(estimate / 100_000 - q), 0.02)
+
+
+class SeriesTests(APITestCase):
+    def timestamped_csv(self, rows):
+        lines = [b"Timestamp,Equipment Name,Type,Flowrate,Pressure,Temperature"]
+        for i in range(rows):
+            # Written out of order to check the series is sorted by time
+            minute = (i * 7) % rows
+            lines.append(f"2026-01-01T00:{minute // 60:02d}:{minute % 60:02d}Z,P-{minute},Pump,{minute},{minute * 2},50".encode())
+        return b"\n".join(lines) + b"\n"
+
+    def test_series_is_downsampled_in_time_order(self):
+        upload_id = self.upload(self.timestamped_csv(500)).data['id']
+        data = self.client.get(f'/api/series/{upload_id}/?column=Pressure&points=50').data
+        self.assertEqual(data['x_kind'], 'timestamp')
+        self.assertEqual((data['total_points'], data['points']), (500, 50))
+        self.assertEqual(data['x'][0], '2026-01-01T00:00:00+00:00')
+        self.assertEqual(data['x'][-1], '2026-01-01T00:08:19+00:00')
+        self.assertEqual(data['y'], sorted(data['y']))
+        self.assertEqual(EquipmentReading.objects.filter(timestamp__isnull=False).count(), 500)
+
+    def test_series_without_timestamps_uses_row_order(self):
+        upload_id = self.upload().data['id']
+        data = self.client.get(f'/api/series/{upload_id}/?column=Pressure').data
+        self.assertEqual(data['x_kind'], 'row')
+        # The row with no Pressure value is skipped
+        self.assertEqual(data['x'], [0, 1, 2, 3])
+        self.assertEqual(data['y'], [15.0, 16.0, 10.0, 25.0])
+
+    def test_series_validation(self):
+        upload_id = self.upload().data['id']
+        self.assertEqual(self.client.get(f'/api/series/{upload_id}/?column=Name').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/series/{upload_id}/?points=2').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/series/{upload_id}/?points=²').status_code, 400)
+        self.assertEqual(self.client.get('/api/series/999/').status_code, 404)
+
+    def test_invalid_timestamp_is_rejected(self):
+        response = self.upload(b"Timestamp,Equipment Name,Type,Flowrate,Pressure,Temperature\nyesterday,P-1,Pump,1,2,3\n")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Timestamp', response.data['error'])
+
+
+class AnomalyTests(APITestCase):
+    def fleet_csv(self):
+        lines = [b"Equipment Name,Type,Flowrate,Pressure,Temperature"]
+        for i in range(40):
+            pressure = 95 if i == 7 else 15 + (i % 5) * 0.5
+            lines.append(f"Pump-{i},Pump,{100 + i % 10},{pressure},{60 + i % 3}".encode())
+        for i in range(20):
+            lines.append(f"Valve-{i},Valve,{80 + i % 4},{10 + i % 2},45".encode())
+        return b"\n".join(lines) + b"\n"
+
+    def test_outlier_is_flagged_per_type(self):
+        upload_id = self.upload(self.fleet_csv()).data['id']
+        data = self.client.get(f'/api/anomalies/{upload_id}/').data
+        self.assertFalse(data['method']['approximate'])
+        self.assertEqual(data['total'], 1)
+        item = data['items'][0]
+        self.assertEqual((item['equipment_name'], item['type'], item['column']), ('Pump-7', 'Pump', 'Pressure'))
+        self.assertEqual((item['value'], item['median']), (95.0, 16.0))
+        self.assertEqual(item['rules'], ['robust_z', 'iqr'])
+
+        self.assertEqual(self.client.get(f'/api/anomalies/{upload_id}/?type=Valve').data['items'], [])
+        self.assertEqual(self.client.get('/api/anomalies/999/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/report/?id={upload_id}').status_code, 200)
+
+    @override_settings(EQUIPMENT_STREAM_THRESHOLD=0, EQUIPMENT_INGEST_CHUNK_ROWS=16)
+    def test_streamed_upload_is_flagged_from_sketches(self):
+        upload_id = self.upload(self.fleet_csv()).data['id']
+        data = self.client.get(f'/api/anomalies/{upload_id}/').data
+        self.assertTrue(data['method']['approximate'])
+        self.assertEqual([item['equipment_name'] for item in data['items']], ['Pump-7'])
+
+    @override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+    def test_blank_type_is_not_compared(self):
+        for streamed in (False, True):
+            with self.subTest(streamed=streamed), override_settings(
+                    EQUIPMENT_STREAM_THRESHOLD=0 if streamed else settings.EQUIPMENT_STREAM_THRESHOLD, EQUIPMENT_INGEST_CHUNK_ROWS=16):
+                response = self.upload(self.fleet_csv() + b"X-1,,900,90,600\n")
+                self.assertEqual(response.status_code, 201)
+                data = self.client.get(f"/api/anomalies/{response.data['id']}/").data
+                self.assertEqual([item['equipment_name'] for item in data['items']], ['Pump-7'])
+
+    def test_report_section_header_is_not_split_from_its_rows(self):
+        from .reports import _draw_anomalies
+        canvas = mock.Mock()
+        _draw_anomalies(canvas, {'total': 0, 'items': []}, 70)
+        # Too close to the bottom margin for the header and a line: both go to the next page
+        canvas.showPage.assert_called_once()
+        self.assertEqual(canvas.drawString.call_args_list[0], mock.call(100, 750, 'Anomalies'))
+
+    @override_settings(EQUIPMENT_ANOMALY_LIMIT=2)
+    def test_stored_items_are_capped(self):
+        upload = UploadSummary.objects.get(pk=self.upload(self.fleet_csv() + b"Pump-x,Pump,900,90,600\n").data['id'])
+        self.assertEqual(upload.anomalies['total'], 4)
+        self.assertEqual(len(upload.anomalies['items']), 2)
+        self.assertEqual(upload.anomalies['items'][0]['equipment_name'], 'Pump-x')
+
+
+class ColumnarUploadTests(APITestCase):
+    def sample_frame(self):
+        return pd.read_csv(io.BytesIO(SAMPLE_CSV)).assign(Site='A')
+
+    def test_format_is_detected_from_magic_bytes(self):
+        self.assertEqual(detect_format(io.BytesIO(b'PAR1\x15\x04')), 'parquet')
+        self.assertEqual(detect_format(io.BytesIO(b'ARROW1\x00\x00')), 'arrow')
+        self.assertEqual(detect_format(io.BytesIO(b'\xff\xff\xff\xff\x10\x00')), 'arrow-stream')
+        self.assertEqual(detect_format(io.BytesIO(SAMPLE_CSV)), 'csv')
+
+    def test_in_memory_upload_is_spooled_for_mapping(self):
+        with local_path(csv_upload()) as path:
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), SAMPLE_CSV)
+        self.assertFalse(os.path.exists(path))
+
+    @skipIf(HAS_PYARROW, 'pyarrow is installed')
+    def test_columnar_upload_without_pyarrow(self):
+        response = self.upload(b'PAR1' + b'\x00' * 16 + b'PAR1', name='equipment.parquet')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pyarrow', response.data['error'])
+
+    @skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    @override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+    def test_columnar_formats_match_csv(self):
+        import pyarrow as pa
+
+        expected = {**self.upload().data, 'id': None}
+        df = self.sample_frame()
+        buffers = {}
+        for name, write in [('parquet', lambda f: df.to_parquet(f)), ('feather', lambda f: df.to_feather(f))]:
+            buffer = io.BytesIO()
+            write(buffer)
+            buffers[name] = buffer.getvalue()
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(df)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        buffers['arrows'] = sink.getvalue().to_pybytes()
+
+        for name, content in buffers.items():
+            with self.subTest(name):
+                # The name is deliberately wrong: detection uses the content
+                response = self.upload(content, name='equipment.csv')
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual({**response.data, 'id': None}, expected)
+
+    @skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    @override_settings(EQUIPMENT_STREAM_THRESHOLD=0, EQUIPMENT_INGEST_CHUNK_ROWS=2)
+    def test_streamed_parquet_is_validated(self):
+        buffer = io.BytesIO()
+        self.sample_frame().astype({'Flowrate': str}).assign(Flowrate='abc').to_parquet(buffer)
+        response = self.upload(buffer.getvalue(), name='equipment.parquet')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Column Flowrate must be numeric')
+
+        buffer = io.BytesIO()
+        self.sample_frame().drop(columns=['Pressure']).to_parquet(buffer)
+        response = self.upload(buffer.getvalue(), name='equipment.parquet')
+        self.assertEqual(response.data['error'], 'Missing columns: Pressure')
+
+
+@override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+class CompressedUploadTests(APITestCase):
+    CODECS = {'gzip': gzip.compress, 'bz2': bz2.compress, 'xz': lzma.compress}
+
+    def setUp(self):
+        super().setUp()
+        self.expected = {**self.upload().data, 'id': None}
+
+    def assertMatchesPlainUpload(self, content):
+        # Named .csv on purpose: detection uses the content, not the name
+        response = self.upload(content, name='equipment.csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({**response.data, 'id': None}, self.expected)
+
+    def test_codecs(self):
+        for codec, compress in self.CODECS.items():
+            with self.subTest(codec):
+                self.assertMatchesPlainUpload(compress(SAMPLE_CSV))
+
+    @skipUnless(zstandard, 'zstandard is not installed')
+    def test_zstd(self):
+        self.assertMatchesPlainUpload(zstandard.ZstdCompressor().compress(SAMPLE_CSV))
+
+    @override_settings(EQUIPMENT_STREAM_THRESHOLD=0, EQUIPMENT_INGEST_CHUNK_ROWS=2)
+    def test_streamed_decompression_is_validated(self):
+        self.assertEqual(self.upload(gzip.compress(SAMPLE_CSV)).data['total_count'], 5)
+        response = self.upload(gzip.compress(SAMPLE_CSV + b"Pump-3,Pump,abc,15,60\n"))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Column Flowrate must be numeric')
+
+    def test_corrupt_archive(self):
+        response = self.upload(gzip.compress(SAMPLE_CSV)[:30])
+        self.assertEqual(response.status_code, 400)
+
+    def test_compressed_upload_is_streamed(self):
+        self.assertIsNotNone(ingest.chunk_rows_for(csv_upload(gzip.compress(SAMPLE_CSV))))
+        self.assertIsNone(ingest.chunk_rows_for(csv_upload()))
+
+    @override_settings(EQUIPMENT_MAX_UPLOAD_BYTES=2000)
+    def test_decompressed_size_is_limited(self):
+        bomb = gzip.compress(SAMPLE_CSV + b"Pump-3,Pump,100,5,50\n" * 500)
+        self.assertLess(len(bomb), 500)
+        response = self.upload(bomb)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Upload expands to more than 2000 bytes when decompressed')
+        self.assertFalse(UploadSummary.objects.filter(total_equipment__gt=5).exists())
+
+
+class MetricsTests(APITestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram('test_seconds', 'Test.', buckets=(0.01, 1), labelnames=('phase',))
+        for value in (0.003, 0.2, 100):
+            histogram.observe(value, phase='read')
+        self.assertEqual(histogram.render().splitlines(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{phase="read",le="0.01"} 1',
+            'test_seconds_bucket{phase="read",le="1.0"} 2',
+            'test_seconds_bucket{phase="read",le="+Inf"} 3',
+            'test_seconds_sum{phase="read"} 100.203',
+            'test_seconds_count{phase="read"} 3',
+        ])
+
+    def test_upload_phases_are_exposed(self):
+        before = PHASE_SECONDS.samples(phase='read')
+        self.assertEqual(self.upload().status_code, 201)
+        after = PHASE_SECONDS.samples(phase='read')
+        # One observation per request, however many chunks were read
+        self.assertEqual(after[2], (before[2] if before else 0) + 1)
+
+        response = APIClient().get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        for phase in ('multipart', 'read', 'validate', 'aggregate', 'insert'):
+            self.assertIn(f'equipment_phase_duration_seconds_count{{phase="{phase}"}}', body)
+        self.assertIn('equipment_request_duration_seconds_count{view="upload",method="POST",status="2xx"}', body)
+        self.assertIn('equipment_request_db_queries_count{view="upload"}', body)
+        self.assertIn('equipment_upload_rows_per_second_count', body)
+
+    def test_server_timing_is_opt_in(self):
+        self.assertNotIn('Server-Timing', self.upload())
+        with override_settings(EQUIPMENT_SERVER_TIMING=True, EQUIPMENT_UPLOAD_DEDUP=False):
+            header = self.upload()['Server-Timing']
+        self.assertIn('read;dur=', header)
+        self.assertRegex(header, r'db;desc="\d+ queries";dur=')
+        self.assertIn('total;dur=', header)
+
+    @override_settings(EQUIPMENT_METRICS_TOKEN='scrape-me')
+    def test_metrics_token(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/metrics').status_code, 401)
+        self.assertEqual(client.get('/api/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+
+
+@override_settings(EQUIPMENT_UPLOAD_DEDUP=False)
+class ConcurrentUploadTests(TransactionTestCase):
+    def test_parallel_uploads_are_all_stored(self):
+        user = get_user_model().objects.create_user('tester', password='secret')
+
+        def upload(i):
+            client = APIClient()
+            client.force_authenticate(user)
+            content = SAMPLE_CSV + f"Extra-{i},Pump,{100 + i},10,50\n".encode()
+            try:
+                return client.post('/api/upload/', {'file': csv_upload(content)}, format='multipart').status_code
+            finally:
+                connection.close()
+
+        # At most five uploads are retained, so five parallel ones must all survive
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            statuses = list(pool.map(upload, range(5)))
+        self.assertEqual(statuses, [201] * 5)
+        self.assertEqual(UploadSummary.objects.count(), 5)
+        self.assertEqual(EquipmentReading.objects.count(), 5 * 6)
+        self.assertEqual(sorted(round(v, 2) for v in UploadSummary.objects.values_list('avg_flowrate', flat=True)),
+                         [round((615 + 100 + i) / 6, 2) for i in range(5)])
+
+
+class BatchUploadTests(APITestCase):
+    def station_csv(self, i):
+        return SAMPLE_CSV + f"Station-{i},Pump,{100 + i},10,50\n".encode()
+
+    def batch(self, *files):
+        return self.client.post('/api/upload/batch/', {'files': list(files)}, format='multipart')
+
+    def test_files_are_stored_together(self):
+        response = self.batch(csv_upload(self.station_csv(1), 'a.csv'), csv_upload(self.station_csv(2), 'b.csv'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['files'], response.data['succeeded'], response.data['failed']), (2, 2, 0))
+        self.assertEqual([r['file_name'] for r in response.data['results']], ['a.csv', 'b.csv'])
+        self.assertEqual(response.data['summary']['total_count'], 12)
+        self.assertEqual(response.data['summary']['avg_flowrate'], round((615 * 2 + 101 + 102) / 12, 2))
+        # Valve-2 has no pressure: the combined mean skips it like the per-file ones
+        self.assertEqual(response.data['summary']['avg_pressure'], round((66 * 2 + 20) / 10, 2))
+        self.assertEqual(response.data['summary']['type_distribution'], {'Pump': 6, 'Valve': 4, 'Reactor': 2})
+        self.assertEqual(EquipmentReading.objects.count(), 12)
+
+    def test_zip_archive(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('shift/north.csv', self.station_csv(1))
+            archive.writestr('shift/south.csv.gz', gzip.compress(self.station_csv(2)))
+            archive.writestr('__MACOSX/shift/._north.csv', b'junk')
+        response = self.batch(SimpleUploadedFile('shift.zip', buffer.getvalue()))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r['file_name'] for r in response.data['results']], ['north.csv', 'south.csv.gz'])
+        self.assertEqual(UploadSummary.objects.count(), 2)
+
+    def test_failed_file_is_reported(self):
+        bad = b"Equipment Name,Type,Flowrate\nPump-1,Pump,1\n"
+        response = self.batch(csv_upload(self.station_csv(1), 'good.csv'), csv_upload(bad, 'bad.csv'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(response.data['results'][1]['file_name'], 'bad.csv')
+        self.assertTrue(response.data['results'][1]['error'].startswith('Missing columns: '))
+        self.assertEqual(UploadSummary.objects.count(), 1)
+
+        response = self.batch(csv_upload(bad, 'bad.csv'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(response.data['summary'])
+
+    def test_repeated_file_is_stored_once(self):
+        response = self.batch(csv_upload(self.station_csv(1), 'a.csv'), csv_upload(self.station_csv(2), 'b.csv'),
+                              csv_upload(self.station_csv(1), 'a-copy.csv'))
+        self.assertEqual(response.status_code, 201)
+        first, _, repeat = response.data['results']
+        self.assertEqual((repeat['file_name'], repeat['id'], repeat['cached']), ('a-copy.csv', first['id'], True))
+        self.assertFalse(first['cached'])
+        self.assertEqual(UploadSummary.objects.count(), 2)
+        self.assertEqual(EquipmentReading.objects.count(), 12)
+
+    def test_batch_is_not_pruned_on_request(self):
+        for i in range(3):
+            self.upload(self.station_csv(100 + i))
+        response = self.batch(*[csv_upload(self.station_csv(i), f'{i}.csv') for i in range(7)])
+        self.assertEqual(response.data['succeeded'], 7)
+        self.assertEqual(UploadSummary.objects.count(), 10)
+
+    def test_workers_return_summaries_and_spool_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            good, bad = os.path.join(directory, 'good.upload'), os.path.join(directory, 'bad.upload')
+            with open(good, 'wb') as f:
+                f.write(SAMPLE_CSV)
+            with open(bad, 'wb') as f:
+                f.write(b"Equipment Name,Type,Flowrate\nPump-1,Pump,1\n")
+            outcome = workers.summarize_file(good, 'good.csv')
+            self.assertEqual(set(outcome), {'fields', 'rows_path'})
+            self.assertEqual(sum(len(chunk) for chunk in ingest.spooled_chunks(outcome['rows_path'])), 5)
+            self.assertIn('error', workers.summarize_file(bad, 'bad.csv'))
+            self.assertEqual(sorted(os.listdir(directory)), ['bad.upload', 'good.upload', 'good.upload.rows'])
+
+    @override_settings(EQUIPMENT_BATCH_WORKERS=2)
+    def test_parallel_parse_matches_inline(self):
+        files = [csv_upload(self.station_csv(i), f'{i}.csv') for i in range(3)]
+        with mock.patch.object(batch, 'PARALLEL_MIN_BYTES', 0):
+            parallel = self.batch(*files)
+        self.assertEqual(parallel.status_code, 201)
+        UploadSummary.objects.all().delete()
+        inline = self.batch(*[csv_upload(self.station_csv(i), f'{i}.csv') for i in range(3)])
+        strip = lambda results: [{k: v for k, v in r.items() if k != 'id'} for r in results]
+        self.assertEqual(strip(parallel.data['results']), strip(inline.data['results']))
+        self.assertEqual(parallel.data['summary'], inline.data['summary'])
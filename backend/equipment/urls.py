@@ -1,8 +1,19 @@
 from django.urls import path
-from .views import UploadCSVView, HistoryView, ReportView
+from .views import UploadCSVView, BatchUploadView, HistoryView, ReportView, JobStatusView, JobEventsView, ExportView, StatsView, RollupView, SeriesView, AnomaliesView, ReadingsView, MetricsView
 
 urlpatterns = [
     path('upload/', UploadCSVView.as_view(), name='upload'),
+    path('upload/batch/', BatchUploadView.as_view(), name='upload-batch'),
     path('history/', HistoryView.as_view(), name='history'),
     path('report/', ReportView.as_view(), name='report'),
+    path('jobs/<uuid:pk>/', JobStatusView.as_view(), name='job-status'),
+    path('jobs/<uuid:pk>/events/', JobEventsView.as_view(), name='job-events'),
+    path('export/', ExportView.as_view(), name='export'),
+    path('stats/<int:pk>/', StatsView.as_view(), name='stats'),
+    path('rollup/', RollupView.as_view(), name='rollup'),
+    path('series/<int:pk>/', SeriesView.as_view(), name='series'),
+    path('anomalies/<int:pk>/', AnomaliesView.as_view(), name='anomalies'),
+    path('readings/', ReadingsView.as_view(), name='readings'),
+    # No trailing slash: the path Prometheus scrapers expect
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -1,62 +1,60 @@
-from django.http import HttpResponse
-from io import BytesIO
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
+import hmac
+
+import numpy as np
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
 from rest_framework import status
-import pandas as pd
-from .models import UploadSummary
+from . import history, query
+from .batch import combine, ingest_batch
+from .events import EventStreamRenderer, job_events, parse_last_event_id
+from .export import FORMATS, ExportError, parse_request, stream
+from .ingest import IngestError, chunk_rows_for, find_duplicate, ingest_upload
+from .jobs import create_job, job_progress, submit
+from .metrics import CONTENT_TYPE, UPLOAD_BYTES_PER_SECOND, UPLOAD_ROWS_PER_SECOND, render, timed
+from .downsample import lttb
+from .models import READING_FIELDS, EquipmentReading, UploadJob, UploadSummary
+from .reports import get_report, report_etag
+from .sketches import UploadSketch
+from .uploadhandlers import SHA256UploadHandler
 
 # ... (Previous code)
 
 class ReportView(APIView):
     def get(self, request):
         try:
-            summary = UploadSummary.objects.order_by('-uploaded_at').first()
+            summary_id = request.query_params.get('id')
+            if summary_id:
+                try:
+                    summary_id = int(summary_id)
+                except ValueError:
+                    return Response({'error': 'id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+                summary = UploadSummary.objects.filter(pk=summary_id).first()
+            else:
+                summary = UploadSummary.objects.order_by('-uploaded_at').first()
             if not summary:
                 return Response({'error': 'No data available'}, status=status.HTTP_404_NOT_FOUND)
 
-            buffer = BytesIO()
-            p = canvas.Canvas(buffer, pagesize=letter)
-            p.setTitle(f"Report - {summary.file_name}")
-
-            p.setFont("Helvetica-Bold", 16)
-            p.drawString(100, 750, "Chemical Equipment Parameter Report")
-            
-            p.setFont("Helvetica", 12)
-            p.drawString(100, 730, f"File: {summary.file_name}")
-            p.drawString(100, 715, f"Date: {summary.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')}")
-
-            p.setFont("Helvetica-Bold", 14)
-            p.drawString(100, 680, "Summary Statistics")
-            
-            p.setFont("Helvetica", 12)
-            p.drawString(120, 660, f"Total Equipment: {summary.total_equipment}")
-            p.drawString(120, 645, f"Avg Flowrate: {summary.avg_flowrate}")
-            p.drawString(120, 630, f"Avg Pressure: {summary.avg_pressure}")
-            p.drawString(120, 615, f"Avg Temperature: {summary.avg_temperature}")
-
-            p.setFont("Helvetica-Bold", 14)
-            p.drawString(100, 580, "Type Distribution")
-            
-            p.setFont("Helvetica", 12)
-            y = 560
-            # Check if type_distribution is dict (it should be)
-            if isinstance(summary.type_distribution, dict):
-                for type_name, count in summary.type_distribution.items():
-                    p.drawString(120, y, f"{type_name}: {count}")
-                    y -= 20
-            else:
-                 p.drawString(120, y, "No distribution data available")
-
-            p.showPage()
-            p.save()
+            # Reports never change once rendered: answer revalidations with 304
+            etag = report_etag(summary)
+            last_modified = int(summary.uploaded_at.timestamp())
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                return not_modified
 
-            buffer.seek(0)
-            response = HttpResponse(buffer, content_type='application/pdf')
+            response = HttpResponse(get_report(summary), content_type='application/pdf')
             response['Content-Disposition'] = f'attachment; filename="report_{summary.id}.pdf"'
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = 'private, no-cache'
             return response
         except Exception as e:
             import traceback
@@ -66,79 +64,332 @@ class ReportView(APIView):
 class UploadCSVView(APIView):
     parser_classes = [MultiPartParser]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Must be installed before the multipart body is parsed
+        self.hash_handler = SHA256UploadHandler(request)
+        request.upload_handlers.insert(0, self.hash_handler)
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request, format=None):
-        if 'file' not in request.FILES:
+        with timed('multipart'):
+            files = request.FILES
+        if 'file' not in files:
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
 
-        file_obj = request.FILES['file']
+        file_obj = files['file']
+        digest = self.hash_handler.digests.get('file', '')
+
+        # Same bytes as a retained upload: answer from the stored summary without parsing
+        if settings.EQUIPMENT_UPLOAD_DEDUP:
+            cached = find_duplicate(digest)
+            if cached:
+                return Response({**cached.as_payload(), "cached": True}, status=status.HTTP_200_OK)
+
+        # ?mode=async: spool the file and return at once; a worker process ingests it
+        if request.query_params.get('mode') == 'async':
+            job = create_job(file_obj, content_sha256=digest)
+            submit(job)
+            return Response({
+                "job_id": str(job.pk),
+                "state": job.state,
+                "status_url": reverse('job-status', args=[job.pk]),
+                "events_url": reverse('job-events', args=[job.pk])
+            }, status=status.HTTP_202_ACCEPTED)
+
         try:
-            # Read CSV
-            df = pd.read_csv(file_obj)
-        except Exception as e:
-            return Response({'error': f'Invalid CSV file: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+            # Large files are streamed in chunks so memory stays flat.
+            # The summary and raw rows are saved together (old uploads are pruned by equipment.retention).
+            with timed('ingest') as timer:
+                summary = ingest_upload(file_obj, chunk_rows_for(file_obj), content_sha256=digest)
+        except IngestError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if timer.seconds:
+            UPLOAD_ROWS_PER_SECOND.observe(summary.total_equipment / timer.seconds)
+            UPLOAD_BYTES_PER_SECOND.observe(file_obj.size / timer.seconds)
+
+        # Return JSON response
+        return Response({**summary.as_payload(), "cached": False}, status=status.HTTP_201_CREATED)
 
-        # Validate Columns
-        required_columns = {'Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature'}
-        if not required_columns.issubset(df.columns):
-            missing = ", ".join(required_columns - set(df.columns))
-            return Response({'error': f'Missing columns: {missing}'}, status=status.HTTP_400_BAD_REQUEST)
+class BatchUploadView(APIView):
+    """Many files (repeated 'files' fields, or zip archives of them) in one request, stored together."""
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, format=None):
+        with timed('multipart'):
+            uploaded = request.FILES.getlist('files') + request.FILES.getlist('file')
+        if not uploaded:
+            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            results, summaries = ingest_batch(uploaded)
+        except IngestError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validate Numeric Types
-        for col in ['Flowrate', 'Pressure', 'Temperature']:
+        failed = sum(1 for result in results if 'error' in result)
+        body = {
+            "files": len(results),
+            "succeeded": len(results) - failed,
+            "failed": failed,
+            "results": results,
+            "summary": combine(summaries) if summaries else None,
+        }
+        return Response(body, status=status.HTTP_201_CREATED if summaries else status.HTTP_400_BAD_REQUEST)
+
+class HistoryView(APIView):
+    """Uploads, newest first, in keyset pages (see equipment.history); ?limit=, ?cursor= from the Link header."""
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', history.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= history.MAX_PAGE_SIZE:
+            return Response({'error': f'limit must be between 1 and {history.MAX_PAGE_SIZE}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        cursor = request.query_params.get('cursor') or None
+        if cursor:
             try:
-                # Attempt to convert to numeric, raising error if fails on any value
-                # Note: 'coerce' produces NaNs, 'raise' raises error. 
-                # If we want to catch non-numeric strings, 'raise' is good.
-                pd.to_numeric(df[col], errors='raise') 
-                # Ensure it's used as numeric in calculation
-                df[col] = pd.to_numeric(df[col])
+                history.decode_cursor(cursor)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Unchanged since the client's copy: answered from the cache alone
+        key = history.page_key(cursor, limit)
+        etag = history.etag_for(key)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        body, next_cursor = history.get_page(key, cursor, limit)
+        response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        if next_cursor:
+            next_url = request.build_absolute_uri(f"{reverse('history')}?limit={limit}&cursor={next_cursor}")
+            response['Link'] = f'<{next_url}>; rel="next"'
+        return response
+
+class JobStatusView(APIView):
+    def get(self, request, pk):
+        job = UploadJob.objects.filter(pk=pk).first()
+        if not job:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Live progress from the worker until the ingest transaction commits
+        progress = job_progress(job)
+        end = job.finished_at or timezone.now()
+        return Response({
+            "job_id": str(job.pk),
+            "state": job.state,
+            "phase": progress['phase'],
+            "file_name": job.file_name,
+            "rows_processed": progress['rows_processed'],
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "queued_seconds": ((job.started_at or end) - job.created_at).total_seconds(),
+            "run_seconds": (end - job.started_at).total_seconds() if job.started_at else None,
+            "error": job.error or None,
+            "summary": job.result
+        })
+
+class JobEventsView(APIView):
+    """Progress of an async upload job as Server-Sent Events (see equipment.events)."""
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, pk):
+        if not UploadJob.objects.filter(pk=pk).exists():
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        # A reconnecting client continues the stream it lost
+        last_event_id = parse_last_event_id(request.headers.get('Last-Event-ID'))
+        response = StreamingHttpResponse(job_events(pk, last_event_id=last_event_id),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class IgnoreFormatParameter(DefaultContentNegotiation):
+    """Content negotiation that leaves ?format= to the view (the output format, not a DRF renderer)."""
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+class ExportView(APIView):
+    """
+    Stream stored uploads for downstream systems (see equipment.export).
+    ?dataset=readings|summaries, ?format=ndjson|csv|parquet|arrow,
+    ?columns=a,b to select columns, ?upload=1,2 to restrict to uploads.
+    """
+    content_negotiation_class = IgnoreFormatParameter
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            dataset, fmt, columns, uploads = parse_request(
+                params.get('dataset'), params.get('format'), params.get('columns'), params.get('upload'))
+        except ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type, extension = FORMATS[fmt]
+        response = StreamingHttpResponse(stream(dataset, fmt, columns, uploads), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{extension}"'
+        response['Cache-Control'] = 'no-store'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+class StatsView(APIView):
+    def get(self, request, pk):
+        summary = UploadSummary.objects.filter(pk=pk).values('id', 'file_name', 'uploaded_at', 'statistics').first()
+        if not summary:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        statistics = summary.pop('statistics')
+        if not statistics:
+            return Response({'error': 'No statistics stored for this upload'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({**summary, **statistics})
+
+class AnomaliesView(APIView):
+    """Out-of-family readings flagged at upload time, optionally filtered by ?type= and ?column=."""
+    def get(self, request, pk):
+        summary = UploadSummary.objects.filter(pk=pk).values('id', 'file_name', 'uploaded_at', 'anomalies').first()
+        if not summary:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        anomalies = summary.pop('anomalies')
+        if not anomalies:
+            return Response({'error': 'No anomalies computed for this upload'}, status=status.HTTP_404_NOT_FOUND)
+
+        items = anomalies['items']
+        type_name = request.query_params.get('type')
+        column = request.query_params.get('column')
+        if type_name:
+            items = [item for item in items if item['type'] == type_name]
+        if column:
+            items = [item for item in items if item['column'] == column]
+        return Response({**summary, **anomalies, 'items': items})
+
+class RollupView(APIView):
+    """Statistics across retained uploads, merged from their stored sketches (no row data)."""
+    def get(self, request):
+        last = request.query_params.get('last', '')
+        if last:
+            try:
+                last = int(last)
             except ValueError:
-                 return Response({'error': f'Column {col} must be numeric'}, status=status.HTTP_400_BAD_REQUEST)
-            except Exception as e:
-                 return Response({'error': f'Error processing column {col}: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
-
-        if df.empty:
-             return Response({'error': 'File is empty'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Compute Statistics
-        total_count = len(df)
-        avg_flowrate = df['Flowrate'].mean()
-        avg_pressure = df['Pressure'].mean()
-        avg_temperature = df['Temperature'].mean()
-
-        type_distribution = df['Type'].value_counts().to_dict()
-
-        # Save summary to DB (logic in model handles keeping last 5)
-        UploadSummary.objects.create(
-            file_name=file_obj.name,
-            total_equipment=total_count,
-            avg_flowrate=avg_flowrate,
-            avg_pressure=avg_pressure,
-            avg_temperature=avg_temperature,
-            type_distribution=type_distribution
-        )
+                last = 0
+            if last < 1:
+                return Response({'error': 'last must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Return JSON response
+        summaries = UploadSummary.objects.order_by('-uploaded_at').values_list('id', 'sketches')
+        if last:
+            summaries = summaries[:last]
+
+        rollup = UploadSketch()
+        upload_ids = []
+        skipped_ids = []
+        for pk, sketches in summaries:
+            if not sketches:
+                # Uploaded before sketches were stored
+                skipped_ids.append(pk)
+                continue
+            rollup.merge(UploadSketch.from_dict(sketches))
+            upload_ids.append(pk)
+
+        if not upload_ids:
+            return Response({'error': 'No data available'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"upload_ids": upload_ids, "skipped_ids": skipped_ids, **rollup.statistics()})
+
+class SeriesView(APIView):
+    """A numeric column of one upload, downsampled with LTTB for trend charts."""
+    def get(self, request, pk):
+        column = request.query_params.get('column', 'Pressure')
+        if column not in READING_FIELDS:
+            return Response({'error': f'column must be one of: {", ".join(READING_FIELDS)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            points = int(request.query_params.get('points', 1000))
+        except ValueError:
+            points = 0
+        if not 3 <= points <= settings.EQUIPMENT_SERIES_MAX_POINTS:
+            return Response({'error': f'points must be between 3 and {settings.EQUIPMENT_SERIES_MAX_POINTS}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not UploadSummary.objects.filter(pk=pk).exists():
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        type_name = request.query_params.get('type') or None
+        timestamps, values = EquipmentReading.objects.series(pk, column, type_name)
+        if timestamps is not None:
+            x = timestamps.asi8 / 1e9
+        else:
+            x = np.arange(len(values), dtype=float)
+        keep = lttb(x, values, points)
+
+        if timestamps is not None:
+            x_values = [t.isoformat() for t in timestamps[keep]]
+        else:
+            x_values = keep.tolist()
         return Response({
-            "total_count": int(total_count),
-            "avg_flowrate": round(float(avg_flowrate), 2),
-            "avg_pressure": round(float(avg_pressure), 2),
-            "avg_temperature": round(float(avg_temperature), 2),
-            "type_distribution": type_distribution
-        }, status=status.HTTP_201_CREATED)
+            "id": int(pk),
+            "column": column,
+            "type": type_name,
+            "x_kind": "timestamp" if timestamps is not None else "row",
+            "total_points": len(values),
+            "points": len(keep),
+            "x": x_values,
+            "y": values[keep].tolist()
+        })
+
+class ReadingsView(APIView):
+    """
+    Stored readings of one upload (?upload=, default the latest) matching
+    ?type=, ?name_prefix= and ranges such as ?temperature_gt=110, in keyset
+    pages (?limit=, ?cursor=); see equipment.query.
+    """
+    def get(self, request):
+        params = request.query_params
+        try:
+            limit = int(params.get('limit', query.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= query.MAX_PAGE_SIZE:
+            return Response({'error': f'limit must be between 1 and {query.MAX_PAGE_SIZE}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        upload_id = params.get('upload')
+        if upload_id:
+            try:
+                upload_id = int(upload_id)
+            except ValueError:
+                return Response({'error': 'upload must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            upload_id = UploadSummary.objects.filter(pk=upload_id).values_list('id', flat=True).first()
+        else:
+            upload_id = UploadSummary.objects.order_by('-uploaded_at', '-id').values_list('id', flat=True).first()
+        if upload_id is None:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        cursor = params.get('cursor') or None
+        try:
+            filters = query.parse_filters(params)
+            rows, next_cursor = query.page(upload_id, filters, cursor, limit)
+        except query.QueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_url = None
+        if next_cursor:
+            next_params = params.copy()
+            next_params['upload'] = upload_id
+            next_params['cursor'] = next_cursor
+            next_url = request.build_absolute_uri(f"{reverse('readings')}?{next_params.urlencode()}")
+        return Response({
+            "upload": upload_id,
+            "count": len(rows),
+            "results": rows,
+            "next": next_url
+        })
+
+class MetricsView(APIView):
+    # Scraped by Prometheus, which has no session; EQUIPMENT_METRICS_TOKEN, if set, is required as a bearer token
+    authentication_classes = []
+    permission_classes = []
 
-class HistoryView(APIView):
     def get(self, request):
-        # Model logic ensures only last 5 exist, but we order by uploaded_at desc
-        summaries = UploadSummary.objects.order_by('-uploaded_at')
-        data = []
-        for s in summaries:
-            data.append({
-                "file_name": s.file_name,
-                "uploaded_at": s.uploaded_at,
-                "total_equipment": s.total_equipment,
-                "avg_flowrate": s.avg_flowrate,
-                "avg_pressure": s.avg_pressure,
-                "avg_temperature": s.avg_temperature
-            })
-        return Response(data)
+        token = settings.EQUIPMENT_METRICS_TOKEN
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return Response({'error': 'Invalid metrics token'}, status=status.HTTP_401_UNAUTHORIZED)
+        return HttpResponse(render(), content_type=CONTENT_TYPE)
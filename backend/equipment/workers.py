@@ -0,0 +1,43 @@
+"""
+Entry points for process pool workers.
+
+Spawned workers unpickle these functions before the pool initializer has
+run, so this module must not import models (or anything that does) at
+import time.
+"""
+
+
+def setup():
+    """Pool initializer: configure Django in a freshly spawned interpreter."""
+    import django
+    django.setup()
+
+
+def run_upload_job(job_id):
+    from .jobs import run_job
+    return run_job(job_id)
+
+
+def summarize_file(path, file_name):
+    """
+    Parse one file of a batch upload: {'fields': ..., 'rows_path': ...} with
+    the UploadSummary values and the path of a RowSpool file holding the
+    validated rows (next to the upload), or {'error': message}. Only the
+    small summary goes back to the parent process.
+    """
+    from django.core.files import File
+    from .ingest import IngestError, RowSpool, chunk_rows_for, summarize
+
+    rows = RowSpool(f'{path}.rows')
+    try:
+        with open(path, 'rb') as f:
+            file_obj = File(f, name=file_name)
+            fields = summarize(file_obj, chunk_rows_for(file_obj), on_chunk=rows.append)
+    except IngestError as e:
+        rows.remove()
+        return {'error': str(e)}
+    except BaseException:
+        rows.remove()
+        raise
+    rows.close()
+    return {'fields': fields, 'rows_path': rows.path}
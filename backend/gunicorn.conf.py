@@ -0,0 +1,96 @@
+"""
+Gunicorn configuration for production, read from the environment.
+
+Run from backend/ with ``python run_prod.py`` (or ``gunicorn backend.wsgi``;
+gunicorn picks this file up from the working directory).
+
+Uploads and reports are CPU-bound pandas/ReportLab work, so the defaults
+run one worker process per CPU, each with a few threads for the cheap
+requests (history, job status) that would otherwise queue behind an
+upload. The app is imported once in the master and forked, and workers are
+recycled after a number of requests, because pandas' memory seldom goes
+back to the OS.
+
+    BIND / PORT                      address, default 0.0.0.0:$PORT (8080)
+    WEB_CONCURRENCY                  worker processes, default CPU count
+    EQUIPMENT_THREADS                threads per worker, default 4
+    EQUIPMENT_MAX_REQUESTS           recycle a worker after this many requests (0: never), default 500
+    EQUIPMENT_MAX_REQUESTS_JITTER    random extra requests, so workers do not restart together
+    EQUIPMENT_WORKER_TIMEOUT         seconds a request may take before its worker is killed, default 300
+    EQUIPMENT_GRACEFUL_TIMEOUT       seconds running requests get on reload/shutdown, default 60
+    EQUIPMENT_PRELOAD                'False' to import the app in each worker instead
+
+The request body limit is EQUIPMENT_MAX_UPLOAD_BYTES, enforced by Django
+(see equipment.middleware.RequestSizeLimitMiddleware). Each worker runs the
+retention sweeper thread (see equipment.retention); one sweep runs at a time.
+Async upload jobs interrupted by the previous run are marked failed when
+the master starts (see equipment.jobs.recover); a master started with USR2
+leaves the jobs of the old one, still running, alone.
+
+Thread budget: every open job event stream (/api/jobs/<id>/events/) holds
+one worker thread, mostly asleep between polls, for at most
+EQUIPMENT_EVENTS_MAX_SECONDS before its client reconnects. Streams and
+requests share WEB_CONCURRENCY x EQUIPMENT_THREADS threads, so when many
+uploads are followed at once raise EQUIPMENT_THREADS (idle threads are
+cheap) rather than the stream lifetime.
+
+Signals to the master: TERM stops gracefully (running requests get the
+graceful timeout), HUP starts fresh workers and retires the old ones once
+they are idle. With preload on, HUP keeps the code loaded in the master;
+to deploy new code send USR2 (start a new master) and then TERM to the
+old one, or restart the service.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '8080')}")
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+threads = int(os.getenv('EQUIPMENT_THREADS', '4'))
+worker_class = 'gthread'
+
+preload_app = os.getenv('EQUIPMENT_PRELOAD', 'True') == 'True'
+max_requests = int(os.getenv('EQUIPMENT_MAX_REQUESTS', '500'))
+max_requests_jitter = int(os.getenv('EQUIPMENT_MAX_REQUESTS_JITTER', str(max_requests // 10)))
+
+timeout = int(os.getenv('EQUIPMENT_WORKER_TIMEOUT', '300'))
+graceful_timeout = int(os.getenv('EQUIPMENT_GRACEFUL_TIMEOUT', '60'))
+keepalive = 5
+
+# Header limits; the body limit is Django's (see above)
+limit_request_line = 8190
+limit_request_fields = 100
+
+accesslog = '-'
+errorlog = '-'
+
+# Every worker gets its own async-upload pool; one process each keeps the total at one per CPU
+os.environ.setdefault('EQUIPMENT_JOB_WORKERS', '1')
+
+
+def when_ready(server):
+    # In the master before any worker starts; the workers inherit its claim on the jobs
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    import django
+    django.setup()
+    from equipment.jobs import recover
+    recover()
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading must not be shared between processes
+    from django.db import connections
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    # Started per worker, not in the master: a thread there would not survive the fork
+    from equipment.retention import start_sweeper
+    start_sweeper()
+
+
+def worker_exit(server, worker):
+    # Let async upload jobs this worker started finish (or fail) before it goes
+    from equipment.jobs import shutdown
+    from equipment.retention import stop_sweeper
+    stop_sweeper()
+    shutdown()
@@ -1,16 +1,52 @@
+"""
+Start the production server.
+
+On Linux and macOS this runs gunicorn with gunicorn.conf.py: several
+worker processes (one per CPU by default) with a few threads each, the app
+preloaded before forking and workers recycled after EQUIPMENT_MAX_REQUESTS.
+Windows cannot fork, so there it falls back to a single waitress process
+with the same address, thread count and body size limit.
+
+All settings come from the environment; see gunicorn.conf.py.
+"""
 import os
 import sys
-from waitress import serve
-# Add current directory to sys.path so we can import 'backend'
-# Add current directory to sys.path so we can import 'backend'
-# sys.path.insert(0, os.getcwd()) 
+from pathlib import Path
 
-from backend.wsgi import application
+BASE_DIR = Path(__file__).resolve().parent
+CONFIG = BASE_DIR / 'gunicorn.conf.py'
+
+os.chdir(BASE_DIR)
+sys.path.insert(0, str(BASE_DIR))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
 
+def run_gunicorn():
+    from gunicorn.app.wsgiapp import run
+    sys.argv = ['gunicorn', '--config', str(CONFIG), 'backend.wsgi:application']
+    run()
+
+
+def run_waitress():
+    # Same variables as gunicorn.conf.py (not loaded here: it tunes the job pool for several workers)
+    from waitress import serve
+    from django.conf import settings
+    from backend.wsgi import application
+    from equipment.jobs import recover
+    from equipment.retention import start_sweeper
+
+    bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '8080')}")
+    threads = int(os.getenv('EQUIPMENT_THREADS', '4'))
+    host, _, port = bind.rpartition(':')
+    print(f"Starting waitress on http://{host}:{port} with {threads} threads. Press Ctrl+C to stop.")
+    recover()
+    start_sweeper()
+    serve(application, host=host, port=int(port), threads=threads,
+          max_request_body_size=settings.EQUIPMENT_MAX_UPLOAD_BYTES or sys.maxsize)
+
 
 if __name__ == "__main__":
-    print("🚀 Starting Production Server on http://0.0.0.0:8080")
-    print("Press Ctrl+C to stop.")
-    serve(application, host='0.0.0.0', port=8080)
+    if os.name == 'nt':
+        run_waitress()
+    else:
+        run_gunicorn()
@@ -1,13 +1,29 @@
+import time
+
+_STARTED = time.perf_counter()
+
+import os
 import sys
-import requests
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QPushButton, QLabel, QFileDialog, QMessageBox, QHBoxLayout,
-                             QGroupBox, QGridLayout, QFrame, QTableWidget, QTableWidgetItem, QHeaderView)
-from PyQt5.QtCore import Qt
+                             QGroupBox, QGridLayout, QFrame, QTableWidget, QTableWidgetItem, QHeaderView,
+                             QCheckBox, QProgressBar)
+from PyQt5.QtCore import Qt, QThreadPool, QTimer
 from PyQt5.QtGui import QFont
 
+from cache import LocalStore
+from charts import ChartPanel
+from client import ApiClient, ApiError, BackendUnavailable
+from local_engine import LocalEngine
+from workers import Worker
+
+# How often to look for the backend again while offline
+RECONNECT_INTERVAL_MS = 30_000
+# Queued offline uploads the server rejects are dropped after this many tries
+MAX_SYNC_ATTEMPTS = 3
+# --measure-startup: print the startup timings to stderr, then quit
+MEASURE_STARTUP = '--measure-startup' in sys.argv
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -72,12 +88,37 @@ class MainWindow(QMainWindow):
         self.create_history_section()
         
         self.file_path = None
-        self.base_url = "http://127.0.0.1:8080" # Default Production
-        self.auth = ('admin', 'admin123')
+        # All network I/O goes through one keep-alive session, on pool threads
+        self.api = ApiClient()
+        self.pool = QThreadPool.globalInstance()
+        self._workers = set() # Keeps running workers (and their signals) alive
+        self.upload_worker = None
+        self.sync_worker = None
+        self.report_cache = None # (ETag, PDF bytes) of the last downloaded report
+
+        # Offline mode: local analysis in a background process, state in a local SQLite file
+        self.store = LocalStore()
+        self.engine = LocalEngine()
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setInterval(RECONNECT_INTERVAL_MS)
+        self.reconnect_timer.timeout.connect(self.fetch_history)
 
-        # Initial fetch
+        # Paint from the cache right after the window is shown, then refresh in the background
+        self.statusBar().showMessage("Connecting to backend...")
+        QTimer.singleShot(0, self.on_first_frame)
         self.fetch_history()
 
+    def on_first_frame(self):
+        # First turn of the event loop: the window is on screen
+        if MEASURE_STARTUP:
+            print(f"Time to first window: {time.perf_counter() - _STARTED:.3f}s", file=sys.stderr)
+        self.show_history(self.store.history())
+        last = self.store.last_summary()
+        if last:
+            self.update_ui(*last)
+            if MEASURE_STARTUP:
+                print(f"Time to cached chart: {time.perf_counter() - _STARTED:.3f}s", file=sys.stderr)
+
     def create_upload_section(self):
         self.upload_group = QGroupBox("Data Source")
         layout = QHBoxLayout()
@@ -89,6 +130,10 @@ class MainWindow(QMainWindow):
         self.select_btn.setCursor(Qt.PointingHandCursor)
         self.select_btn.clicked.connect(self.select_file)
         
+        # gzip before sending; the server detects the compression itself
+        self.compress_check = QCheckBox("Compress")
+        self.compress_check.setToolTip("gzip the file before uploading (much less to send over slow links)")
+
         self.upload_btn = QPushButton("Upload & Analyze")
         self.upload_btn.setCursor(Qt.PointingHandCursor)
         self.upload_btn.clicked.connect(self.upload_file)
@@ -99,9 +144,22 @@ class MainWindow(QMainWindow):
             QPushButton:disabled { background-color: #cccccc; }
         """)
         
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFixedWidth(160)
+        self.progress_bar.setVisible(False)
+
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setCursor(Qt.PointingHandCursor)
+        self.cancel_btn.clicked.connect(self.cancel_upload)
+        self.cancel_btn.setVisible(False)
+        self.cancel_btn.setStyleSheet("background-color: #dc3545;")
+
         layout.addWidget(self.select_btn)
         layout.addWidget(self.file_label, 1) 
+        layout.addWidget(self.compress_check)
+        layout.addWidget(self.progress_bar)
         layout.addWidget(self.upload_btn)
+        layout.addWidget(self.cancel_btn)
         
         self.upload_group.setLayout(layout)
         self.main_layout.addWidget(self.upload_group)
@@ -145,11 +203,10 @@ class MainWindow(QMainWindow):
         self.chart_group = QGroupBox("Visualization")
         layout = QVBoxLayout()
         
-        # Chart
-        self.figure = plt.figure(figsize=(5, 3)) # Slightly smaller to fit History
-        self.figure.patch.set_facecolor('#ffffff')
-        self.canvas = FigureCanvas(self.figure)
-        layout.addWidget(self.canvas)
+        # Chart; matplotlib is only loaded once there is something to draw
+        self.chart = ChartPanel()
+        self.chart.setMinimumHeight(300)
+        layout.addWidget(self.chart)
 
         # PDF Button
         self.pdf_btn = QPushButton("Download PDF Report")
@@ -184,99 +241,207 @@ class MainWindow(QMainWindow):
 
     def select_file(self):
         options = QFileDialog.Options()
-        file_path, _ = QFileDialog.getOpenFileName(self, "Select CSV File", "", "CSV Files (*.csv);;All Files (*)", options=options)
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select CSV File", "", "Equipment Data (*.csv *.parquet *.feather *.arrow *.arrows);;CSV Files (*.csv);;All Files (*)", options=options)
         if file_path:
             self.file_path = file_path
             self.file_label.setText(file_path.split('/')[-1])
             self.file_label.setStyleSheet("color: #333333; font-weight: bold; border: 1px solid #28a745; padding: 5px; border-radius: 4px; background: #e8f5e9;")
             self.upload_btn.setEnabled(True)
 
+    def run_worker(self, worker, on_result=None, on_error=None):
+        """Start `worker` on the pool; its signals are handled on the GUI thread."""
+        if on_result:
+            worker.signals.result.connect(on_result)
+        if on_error:
+            worker.signals.error.connect(on_error)
+        worker.signals.status.connect(self.statusBar().showMessage)
+        self._workers.add(worker)
+        worker.signals.finished.connect(lambda: self._workers.discard(worker))
+        self.pool.start(worker)
+        return worker
+
     def upload_file(self):
-        if not self.file_path:
+        if not self.file_path or self.upload_worker:
             return
-            
-        urls_to_try = [f"{self.base_url}/api/upload/", "http://127.0.0.1:8000/api/upload/"]
-        
-        response = None
-        
+
+        worker = Worker(self.upload_and_fetch_series, self.file_path, self.compress_check.isChecked(),
+                        reports_progress=True)
+        worker.signals.progress.connect(self.on_upload_progress)
+        worker.signals.cancelled.connect(lambda: self.statusBar().showMessage("Upload cancelled", 5000))
+        worker.signals.finished.connect(self.on_upload_finished)
+
+        self.upload_btn.setEnabled(False)
+        self.select_btn.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.cancel_btn.setVisible(True)
+        self.upload_worker = self.run_worker(worker, self.on_upload_succeeded, self.on_upload_failed)
+
+    def upload_and_fetch_series(self, path, compress, **callbacks):
+        # Runs on a pool thread: network and local engine only, no widgets
         try:
-            with open(self.file_path, 'rb') as f:
-                file_content = f.read()
-            
-            for target_url in urls_to_try:
-                try:
-                    files = {'file': (self.file_path.split('/')[-1], file_content, 'text/csv')}
-                    print(f"Trying {target_url}...")
-                    response = requests.post(target_url, files=files, auth=self.auth, timeout=2)
-                    self.base_url = target_url.rsplit('/api', 1)[0] # Update base url if found
-                    break
-                except requests.exceptions.RequestException:
-                    continue
-            
-            if not response:
-                raise Exception("Could not connect to backend")
-
-            if response.status_code == 201:
-                data = response.json()
-                self.update_ui(data)
-                self.fetch_history() # Refresh history
-                QMessageBox.information(self, "Success", "Upload successful!")
-            else:
-                try:
-                    error_msg = response.json().get('error', response.text)
-                except:
-                    error_msg = response.text
-                QMessageBox.warning(self, "Upload Failed", f"Server returned error:\n{error_msg}")
-                
-        except Exception as e:
-            QMessageBox.critical(self, "System Error", f"An error occurred:\n{str(e)}")
+            data = self.api.upload(path, compress=compress, **callbacks)
+        except BackendUnavailable:
+            # Summarise locally and upload later, when a backend is reachable
+            callbacks['on_status']("Backend unreachable, analyzing locally...")
+            data = self.engine.analyze(path)
+            self.store.queue_upload(path, data, compress)
+            return data, None
+        series = None
+        if data.get('id') is not None:
+            try:
+                series = self.api.series(data['id'])
+            except Exception as e:
+                callbacks['on_status'](f"Failed to fetch series: {e}")
+        return data, series
+
+    def cancel_upload(self):
+        if self.upload_worker:
+            self.upload_worker.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.statusBar().showMessage("Cancelling...")
+
+    def on_upload_progress(self, sent, total):
+        self.progress_bar.setValue(int(sent * 100 / total) if total else 0)
+        if sent == total:
+            self.statusBar().showMessage("Processing on server...")
+
+    def on_upload_succeeded(self, result):
+        data, series = result
+        self.update_ui(data, series)
+        self.store.save_last_summary(data, series)
+        if data.get('offline'):
+            self.show_history(self.store.history())
+            self.reconnect_timer.start()
+            self.statusBar().showMessage("Analyzed offline; will sync when the backend is back", 5000)
+            QMessageBox.information(self, "Analyzed Offline",
+                                    "The backend is unreachable, so the file was analyzed locally.\n"
+                                    "It will be uploaded automatically once the backend is available.")
+            return
+        self.fetch_history() # Refresh history
+        if series is None:
+            self.statusBar().showMessage("Upload successful, but the trend chart could not be loaded", 5000)
+        else:
+            self.statusBar().showMessage("Upload successful", 5000)
+        QMessageBox.information(self, "Success", "Upload successful!")
+
+    def on_upload_failed(self, message):
+        self.statusBar().showMessage("Upload failed", 5000)
+        QMessageBox.warning(self, "Upload Failed", f"Server returned error:\n{message}")
+
+    def on_upload_finished(self):
+        self.upload_worker = None
+        self.upload_btn.setEnabled(bool(self.file_path))
+        self.select_btn.setEnabled(True)
+        self.progress_bar.setVisible(False)
+        self.cancel_btn.setVisible(False)
+        self.cancel_btn.setEnabled(True)
 
     def download_pdf(self):
-        try:
-            url = f"{self.base_url}/api/report/"
-            response = requests.get(url, auth=self.auth, stream=True)
-            
-            if response.status_code == 200:
-                options = QFileDialog.Options()
-                file_path, _ = QFileDialog.getSaveFileName(self, "Save PDF Report", "report.pdf", "PDF Files (*.pdf)", options=options)
-                
-                if file_path:
-                    with open(file_path, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                    QMessageBox.information(self, "Success", f"Report saved to:\n{file_path}")
-            else:
-                QMessageBox.warning(self, "Error", "Failed to generate report. Make sure data is uploaded.")
-                
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Could not download PDF:\n{str(e)}")
+        # Revalidate the last downloaded report; the server answers 304 if unchanged
+        etag = self.report_cache[0] if self.report_cache else None
+        self.pdf_btn.setEnabled(False)
+        worker = Worker(self.api.report, etag)
+        worker.signals.finished.connect(lambda: self.pdf_btn.setEnabled(True))
+        self.run_worker(worker, self.save_pdf,
+                        lambda message: QMessageBox.critical(self, "Error", f"Could not download PDF:\n{message}"))
+
+    def save_pdf(self, report):
+        if report is None: # 304: the cached copy is current
+            content = self.report_cache[1]
+        else:
+            etag, content = report
+            self.report_cache = (etag, content) if etag else None
+
+        options = QFileDialog.Options()
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save PDF Report", "report.pdf", "PDF Files (*.pdf)", options=options)
+
+        if file_path:
+            try:
+                with open(file_path, 'wb') as f:
+                    f.write(content)
+                QMessageBox.information(self, "Success", f"Report saved to:\n{file_path}")
+            except OSError as e:
+                QMessageBox.critical(self, "Error", f"Could not save PDF:\n{str(e)}")
 
     def fetch_history(self):
-        try:
-            url = f"{self.base_url}/api/history/"
-            # Try catch separate for history fetch to ensure main app logic continues
+        self.run_worker(Worker(self.api.history), self.on_history_fetched, self.on_history_failed)
+
+    def on_history_fetched(self, history):
+        self.reconnect_timer.stop()
+        self.statusBar().showMessage(f"Connected to {self.api.base_url}", 3000)
+        self.store.save_history(history)
+        self.show_history(history)
+        if self.store.pending_uploads():
+            self.sync_pending()
+
+    def on_history_failed(self, message):
+        self.statusBar().showMessage(f"Offline, showing cached history ({message})")
+        self.reconnect_timer.start()
+
+    def sync_pending(self):
+        if self.sync_worker:
+            return
+        worker = Worker(self.upload_pending)
+        worker.signals.finished.connect(lambda: setattr(self, 'sync_worker', None))
+        self.sync_worker = self.run_worker(worker, self.on_sync_done,
+                                           lambda message: self.statusBar().showMessage(f"Sync failed: {message}", 5000))
+
+    def upload_pending(self):
+        # Runs on a pool thread: upload files analysed offline, oldest first
+        synced = 0
+        for pending in self.store.pending_uploads():
+            if not os.path.exists(pending['file_path']):
+                self.store.remove_pending(pending['id'])
+                continue
             try:
-                response = requests.get(url, auth=self.auth, timeout=2)
-            except:
-                # Fallback check
-                url = "http://127.0.0.1:8000/api/history/"
-                response = requests.get(url, auth=self.auth, timeout=2)
-                self.base_url = "http://127.0.0.1:8000"
-
-            if response.status_code == 200:
-                history = response.json()
-                self.history_table.setRowCount(len(history))
-                for i, item in enumerate(history):
-                    self.history_table.setItem(i, 0, QTableWidgetItem(item['file_name']))
-                    self.history_table.setItem(i, 1, QTableWidgetItem(item['uploaded_at'].split('T')[1].split('.')[0])) # Simple time parse
-                    self.history_table.setItem(i, 2, QTableWidgetItem(str(item['total_equipment'])))
-                    self.history_table.setItem(i, 3, QTableWidgetItem(str(item.get('avg_flowrate', '-'))))
-                    self.history_table.setItem(i, 4, QTableWidgetItem(str(item.get('avg_pressure', '-'))))
-                    self.history_table.setItem(i, 5, QTableWidgetItem(str(item.get('avg_temperature', '-'))))
-        except Exception as e:
-            print(f"Failed to fetch history: {e}")
-
-    def update_ui(self, data):
+                self.api.upload(pending['file_path'], compress=bool(pending['compress']))
+            except BackendUnavailable:
+                break
+            except ApiError as e:
+                if pending['attempts'] + 1 >= MAX_SYNC_ATTEMPTS:
+                    self.store.remove_pending(pending['id'])
+                else:
+                    self.store.mark_failed(pending['id'], str(e))
+                continue
+            self.store.remove_pending(pending['id'])
+            synced += 1
+        return synced
+
+    def on_sync_done(self, synced):
+        if synced:
+            self.statusBar().showMessage(f"Synced {synced} offline upload(s)", 5000)
+            self.fetch_history()
+        elif self.store.pending_uploads():
+            self.reconnect_timer.start()
+
+    def show_history(self, history):
+        # Offline results waiting for sync are listed first
+        pending = [{**item['summary'], 'file_name': f"{item['summary']['file_name']} (pending sync)"}
+                   for item in reversed(self.store.pending_uploads())]
+        history = pending + list(history)
+        self.history_table.setRowCount(len(history))
+        for i, item in enumerate(history):
+            if 'total_equipment' not in item: # Offline entries use the upload payload keys
+                item = {**item, 'total_equipment': item['total_count']}
+            self.history_table.setItem(i, 0, QTableWidgetItem(item['file_name']))
+            self.history_table.setItem(i, 1, QTableWidgetItem(item['uploaded_at'].split('T')[1].split('.')[0])) # Simple time parse
+            self.history_table.setItem(i, 2, QTableWidgetItem(str(item['total_equipment'])))
+            self.history_table.setItem(i, 3, QTableWidgetItem(str(item.get('avg_flowrate', '-'))))
+            self.history_table.setItem(i, 4, QTableWidgetItem(str(item.get('avg_pressure', '-'))))
+            self.history_table.setItem(i, 5, QTableWidgetItem(str(item.get('avg_temperature', '-'))))
+
+    def closeEvent(self, event):
+        # Stop a running upload between chunks and let workers wind down
+        if self.upload_worker:
+            self.upload_worker.cancel()
+        self.reconnect_timer.stop()
+        self.pool.waitForDone(3000)
+        self.engine.shutdown()
+        self.api.session.close()
+        super().closeEvent(event)
+
+    def update_ui(self, data, series=None):
         # Update Stats
         self.stat_widgets["Total Equipment"].setText(str(data['total_count']))
         self.stat_widgets["Avg Flowrate"].setText(f"{data['avg_flowrate']} L/min")
@@ -284,23 +449,7 @@ class MainWindow(QMainWindow):
         self.stat_widgets["Avg Temperature"].setText(f"{data['avg_temperature']} °C")
         
         # Update Chart
-        self.figure.clear()
-        ax = self.figure.add_subplot(111)
-        
-        types = list(data['type_distribution'].keys())
-        counts = list(data['type_distribution'].values())
-        
-        bars = ax.bar(types, counts, color='#3498db', edgecolor='#2980b9')
-        
-        ax.set_title('Equipment Type Distribution', fontsize=10, fontweight='bold', pad=10)
-        ax.set_ylabel('Count', fontsize=9)
-        ax.tick_params(axis='both', which='major', labelsize=8)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.grid(axis='y', linestyle='--', alpha=0.7)
-        
-        self.canvas.draw()
-        self.figure.tight_layout()
+        self.chart.update_chart(data['type_distribution'], series)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -308,4 +457,6 @@ if __name__ == '__main__':
     app.setFont(font)
     window = MainWindow()
     window.show()
+    if MEASURE_STARTUP:
+        QTimer.singleShot(0, window.close)
     sys.exit(app.exec_())
@@ -0,0 +1,103 @@
+"""
+On-disk state of the desktop client, in a small SQLite file.
+
+- The last /api/history/ payload and the last shown summary, so the window
+  paints at once on startup and refreshes from the backend afterwards.
+- The queue of files analysed offline, uploaded once a backend is
+  reachable again.
+
+Every call opens its own short-lived connection, so the store can be used
+from the GUI thread and from worker threads alike.
+"""
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+DEFAULT_PATH = Path(os.getenv('EQUIPMENT_DESKTOP_CACHE', Path.home() / '.equipment-visualizer' / 'cache.sqlite3'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_upload (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_path TEXT NOT NULL,
+    compress INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class LocalStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn: # Commits, or rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def _get(self, key):
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else None
+
+    def _set(self, key, value):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO kv (key, value, updated_at) VALUES (?, ?, ?)',
+                         (key, json.dumps(value), _now()))
+
+    def history(self):
+        """The cached /api/history/ payload, or []."""
+        return self._get('history') or []
+
+    def save_history(self, history):
+        self._set('history', history)
+
+    def last_summary(self):
+        """(summary, series) last shown in the window, or None."""
+        value = self._get('last_summary')
+        return (value['summary'], value['series']) if value else None
+
+    def save_last_summary(self, summary, series=None):
+        self._set('last_summary', {'summary': summary, 'series': series})
+
+    def queue_upload(self, file_path, summary, compress=False):
+        with self._connect() as conn:
+            conn.execute('INSERT INTO pending_upload (file_path, compress, summary, created_at) VALUES (?, ?, ?, ?)',
+                         (file_path, int(compress), json.dumps(summary), _now()))
+
+    def pending_uploads(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT * FROM pending_upload ORDER BY id').fetchall()
+        return [{**dict(row), 'summary': json.loads(row['summary'])} for row in rows]
+
+    def remove_pending(self, pending_id):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM pending_upload WHERE id = ?', (pending_id,))
+
+    def mark_failed(self, pending_id, error):
+        with self._connect() as conn:
+            conn.execute('UPDATE pending_upload SET attempts = attempts + 1, last_error = ? WHERE id = ?',
+                         (error, pending_id))
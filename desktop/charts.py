@@ -0,0 +1,186 @@
+"""
+Chart rendering for the desktop client.
+
+ChartPanel owns the figure and keeps its artists between updates: a new
+summary changes bar heights, tick labels and the trend line's data in
+place instead of clearing and rebuilding the figure. When only bar
+heights change (same Types, same axis limits) the bars are redrawn with
+blitting, i.e. over a cached background of the static parts of the axes.
+
+matplotlib is imported when the chart is first drawn, not at startup; the
+panel shows an empty placeholder until then.
+
+Distributions with more than MAX_BARS Types keep the largest ones and
+collapse the rest into an "Other" bar, so hundreds of categories stay
+readable and cheap to draw.
+"""
+from PyQt5.QtWidgets import QVBoxLayout, QWidget
+
+MAX_BARS = 25
+OTHER = 'Other'
+BAR_COLOR = '#3498db'
+BAR_EDGE = '#2980b9'
+TREND_COLOR = '#e74c3c'
+# Axes boxes (left, bottom, width, height) in figure coordinates
+FULL_WIDTH = [0.08, 0.22, 0.9, 0.66]
+LEFT_HALF = [0.08, 0.22, 0.4, 0.66]
+RIGHT_HALF = [0.58, 0.22, 0.4, 0.66]
+
+
+def collapse_tail(distribution, max_bars=MAX_BARS):
+    """Largest `max_bars - 1` Types plus the rest summed as "Other", as (labels, counts)."""
+    items = sorted(distribution.items(), key=lambda item: -item[1])
+    if len(items) > max_bars:
+        head, tail = items[:max_bars - 1], items[max_bars - 1:]
+        items = head + [(OTHER, sum(count for _, count in tail))]
+    return [str(name) for name, _ in items], [count for _, count in items]
+
+
+class BlitManager:
+    """
+    Redraw animated artists over a cached background.
+
+    Artists marked animated are skipped by normal draws; after every full
+    draw the background is re-captured and the animated artists painted on
+    top of it.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.artists = []
+        self._background = None
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def set_artists(self, artists):
+        for artist in artists:
+            artist.set_animated(True)
+        self.artists = list(artists)
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        figure = self.canvas.figure
+        for artist in self.artists:
+            figure.draw_artist(artist)
+
+    def update(self):
+        """Repaint only the animated artists (falls back to a full draw before the first one)."""
+        if self._background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_artists()
+        self.canvas.blit(self.canvas.figure.bbox)
+        self.canvas.flush_events()
+
+
+class ChartPanel(QWidget):
+    """Type distribution bars and an optional trend line, updated in place."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._layout = QVBoxLayout(self)
+        self._layout.setContentsMargins(0, 0, 0, 0)
+        self.figure = None
+        self.canvas = None
+        self._bars = None
+        self._labels = []
+        self._line = None
+
+    def _ensure_figure(self):
+        if self.figure is not None:
+            return
+        # Deferred: importing matplotlib and its Qt backend dominates startup
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+        from matplotlib.figure import Figure
+
+        self.figure = Figure(figsize=(5, 3))
+        self.figure.patch.set_facecolor('#ffffff')
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self._layout.addWidget(self.canvas)
+        self.blit = BlitManager(self.canvas)
+
+        # Fixed positions instead of tight_layout(), which re-measures every text on each call
+        self.bar_ax = self.figure.add_axes(FULL_WIDTH)
+        self.trend_ax = self.figure.add_axes(RIGHT_HALF)
+        self.bar_ax.set_title('Equipment Type Distribution', fontsize=10, fontweight='bold', pad=10)
+        self.bar_ax.set_ylabel('Count', fontsize=9)
+        self._style(self.bar_ax)
+        (self._line,) = self.trend_ax.plot([], [], color=TREND_COLOR, linewidth=0.8)
+        self._style(self.trend_ax)
+        self.trend_ax.set_visible(False)
+
+    @staticmethod
+    def _style(ax):
+        ax.tick_params(axis='both', which='major', labelsize=8)
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+        ax.grid(axis='y', linestyle='--', alpha=0.7)
+
+    def update_chart(self, distribution, series=None):
+        self._ensure_figure()
+        labels, counts = collapse_tail(distribution)
+        layout_changed = self._update_bars(labels, counts)
+        layout_changed |= self._update_trend(series)
+        if layout_changed:
+            self.canvas.draw_idle()
+        else:
+            self.blit.update()
+
+    def _update_bars(self, labels, counts):
+        """Set bar heights; returns True when a full redraw is needed."""
+        ax = self.bar_ax
+        changed = False
+        if self._bars is None or len(labels) != len(self._bars):
+            if self._bars is not None:
+                self._bars.remove()
+            self._bars = ax.bar(range(len(labels)), counts, color=BAR_COLOR, edgecolor=BAR_EDGE)
+            self.blit.set_artists(self._bars.patches)
+            ax.set_xticks(range(len(labels)))
+            changed = True
+        else:
+            for bar, count in zip(self._bars.patches, counts):
+                bar.set_height(count)
+        if labels != self._labels:
+            rotate = len(labels) > 6
+            ax.set_xticklabels(labels, rotation=45 if rotate else 0, ha='right' if rotate else 'center')
+            self._labels = labels
+            changed = True
+        # Keep some headroom so similar uploads reuse the limits (and can be blitted)
+        needed = max(counts, default=0) * 1.1 or 1
+        top = ax.get_ylim()[1]
+        if changed or needed > top or needed < top / 2:
+            ax.set_ylim(0, needed)
+            changed = True
+        return changed
+
+    def _update_trend(self, series):
+        ax = self.trend_ax
+        if not series:
+            if not ax.get_visible():
+                return False
+            ax.set_visible(False)
+            self.bar_ax.set_position(FULL_WIDTH)
+            return True
+
+        from matplotlib.ticker import AutoLocator, ScalarFormatter
+
+        if not ax.get_visible():
+            ax.set_visible(True)
+            self.bar_ax.set_position(LEFT_HALF)
+        y = series['y']
+        self._line.set_data(range(len(y)), y)
+        ax.relim()
+        ax.autoscale_view()
+        ax.set_title(f"{series['column']} Trend", fontsize=10, fontweight='bold', pad=10)
+        ax.set_xlabel('Time' if series['x_kind'] == 'timestamp' else 'Row', fontsize=9)
+        if series['x_kind'] == 'timestamp' and series['x']:
+            # Label the ends with the actual times of the downsampled points
+            ax.set_xticks([0, len(series['x']) - 1])
+            ax.set_xticklabels([series['x'][0][:16], series['x'][-1][:16]])
+        else:
+            ax.xaxis.set_major_locator(AutoLocator())
+            ax.xaxis.set_major_formatter(ScalarFormatter())
+        return True
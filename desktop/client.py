@@ -0,0 +1,275 @@
+"""
+HTTP access to the backend API for the desktop client.
+
+One ApiClient owns one requests.Session, so every call reuses pooled
+keep-alive connections instead of opening a new one. The client has no Qt
+dependency; workers.py runs its methods on a thread pool.
+
+Uploads are streamed from disk as a multipart body (MultipartFile), so the
+file is never read into memory. It reports progress as bytes are sent and
+checks a cancel flag between chunks. The server processes the file as a
+background job; its progress (phase, rows, bytes) is then followed over the
+job's Server-Sent Events stream until the summary arrives.
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URLS = ["http://127.0.0.1:8080", "http://127.0.0.1:8000"]
+# Connect timeout, and read timeout (an upload is parsed before the server answers)
+TIMEOUT = (3, 300)
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadCancelled(Exception):
+    """Raised from inside the request body when the user cancels an upload."""
+
+
+class ApiError(Exception):
+    """The backend answered with an error; the message is the server's."""
+
+
+class BackendUnavailable(ApiError):
+    """None of the backend URLs accepted a connection."""
+
+
+class MultipartFile:
+    """
+    A multipart/form-data body with a single file field, read from disk.
+
+    requests sends any object with read() and a length as a streamed,
+    Content-Length delimited body, so the file goes out CHUNK_SIZE bytes
+    at a time.
+    """
+
+    def __init__(self, path, field='file', file_name=None, content_type='application/octet-stream',
+                 on_progress=None, is_cancelled=None):
+        self.boundary = uuid.uuid4().hex
+        file_name = file_name or os.path.basename(path)
+        self._head = (f'--{self.boundary}\r\n'
+                      f'Content-Disposition: form-data; name="{field}"; filename="{file_name}"\r\n'
+                      f'Content-Type: {content_type}\r\n\r\n').encode()
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode()
+        self._file = open(path, 'rb')
+        self._parts = [self._head, self._file, self._tail]
+        self.total = len(self._head) + os.path.getsize(path) + len(self._tail)
+        self.sent = 0
+        self._reported = 0
+        self.on_progress = on_progress
+        self.is_cancelled = is_cancelled
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self.total
+
+    def read(self, size=-1):
+        if self.is_cancelled and self.is_cancelled():
+            raise UploadCancelled()
+        wanted = CHUNK_SIZE if size is None or size < 0 else size
+        chunks = []
+        while self._parts and wanted > 0:
+            part = self._parts[0]
+            if isinstance(part, bytes):
+                chunk = part[:wanted]
+                if len(part) > wanted:
+                    self._parts[0] = part[wanted:]
+                else:
+                    self._parts.pop(0)
+            else:
+                chunk = part.read(wanted)
+                if not chunk:
+                    self._parts.pop(0)
+                    continue
+            chunks.append(chunk)
+            wanted -= len(chunk)
+        data = b''.join(chunks)
+        self.sent += len(data)
+        # At most ~200 progress callbacks per upload, whatever the read size
+        if self.on_progress and (self.sent - self._reported >= self.total / 200 or self.sent == self.total):
+            self._reported = self.sent
+            self.on_progress(self.sent, self.total)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def gzip_to_temp(path):
+    """Compress `path` into a temporary .gz file, streaming; the caller deletes it."""
+    fd, gz_path = tempfile.mkstemp(suffix='.gz')
+    with open(path, 'rb') as src, os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb',
+                                                                             compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+    return gz_path
+
+
+def _describe_progress(progress):
+    text = f"{progress['phase'].capitalize()}: {progress.get('rows_processed') or 0:,} rows"
+    if progress.get('bytes_total'):
+        text += f" ({(progress.get('bytes_processed') or 0) / 2**20:.1f} of {progress['bytes_total'] / 2**20:.1f} MB)"
+    return text
+
+
+def _error_message(response):
+    try:
+        return response.json().get('error', response.text)
+    except ValueError:
+        return response.text
+
+
+class ApiClient:
+    """Backend calls over one shared keep-alive session."""
+
+    def __init__(self, base_urls=DEFAULT_BASE_URLS, auth=('admin', 'admin123')):
+        self.base_urls = list(base_urls)
+        self.base_url = self.base_urls[0]
+        self.session = requests.Session()
+        self.session.auth = auth
+        # (ETag, body) of the last history response
+        self._history = (None, None)
+        # Enough pooled connections for every worker thread
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, path, body_factory=None, **kwargs):
+        """
+        Send a request to the first base URL that accepts the connection.
+
+        `body_factory`, if given, is called per attempt to build a fresh
+        streamed body, since a partly read body cannot be resent.
+        """
+        kwargs.setdefault('timeout', TIMEOUT)
+        candidates = [self.base_url] + [url for url in self.base_urls if url != self.base_url]
+        last_error = None
+        for base_url in candidates:
+            body = body_factory() if body_factory else None
+            try:
+                if body is not None:
+                    kwargs['data'] = body
+                    kwargs['headers'] = {**kwargs.get('headers', {}), 'Content-Type': body.content_type}
+                response = self.session.request(method, f"{base_url}{path}", **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                last_error = e
+                continue
+            finally:
+                if body is not None:
+                    body.close()
+            self.base_url = base_url
+            return response
+        raise BackendUnavailable(f"Could not connect to backend ({last_error})")
+
+    def get_json(self, path, **kwargs):
+        response = self.request('GET', path, **kwargs)
+        if response.status_code != 200:
+            raise ApiError(_error_message(response))
+        return response.json()
+
+    def history(self):
+        """The upload history; revalidated with its ETag, so an unchanged list is not resent."""
+        etag, cached = self._history
+        response = self.request('GET', '/api/history/', headers={'If-None-Match': etag} if etag else {})
+        if response.status_code == 304:
+            return cached
+        if response.status_code != 200:
+            raise ApiError(_error_message(response))
+        data = response.json()
+        self._history = (response.headers.get('ETag'), data)
+        return data
+
+    def series(self, upload_id, column='Pressure', points=1000):
+        return self.get_json(f'/api/series/{upload_id}/', params={'column': column, 'points': points})
+
+    def report(self, etag=None):
+        """(etag, pdf bytes) of the latest report, or None when `etag` is still current."""
+        headers = {'If-None-Match': etag} if etag else {}
+        response = self.request('GET', '/api/report/', headers=headers)
+        if response.status_code == 304:
+            return None
+        if response.status_code != 200:
+            raise ApiError("Failed to generate report. Make sure data is uploaded.")
+        return response.headers.get('ETag'), response.content
+
+    def upload(self, path, compress=False, on_progress=None, is_cancelled=None, on_status=None):
+        """Stream `path` to /api/upload/, follow the ingest job and return the summary JSON."""
+        file_name = os.path.basename(path)
+        content_type = 'text/csv'
+        send_path = path
+        if compress:
+            if on_status:
+                on_status("Compressing...")
+            send_path = gzip_to_temp(path)
+            file_name += '.gz'
+            content_type = 'application/gzip'
+        try:
+            if on_status:
+                on_status("Uploading...")
+            response = self.request('POST', '/api/upload/?mode=async', body_factory=lambda: MultipartFile(
+                send_path, file_name=file_name, content_type=content_type,
+                on_progress=on_progress, is_cancelled=is_cancelled))
+        finally:
+            if send_path != path:
+                os.unlink(send_path)
+        if is_cancelled and is_cancelled():
+            # The body was fully sent before the cancel; drop the server's answer
+            raise UploadCancelled()
+        if response.status_code not in (200, 201, 202):  # 200 = identical file already uploaded
+            raise ApiError(_error_message(response))
+        if response.status_code != 202:
+            return response.json()
+        return self.follow_job(response.json()['events_url'], on_status=on_status, is_cancelled=is_cancelled)
+
+    def follow_job(self, events_url, on_status=None, is_cancelled=None):
+        """
+        Read an upload job's event stream, reporting progress, until it returns the summary.
+
+        The server closes a stream after a while; it is then reopened with
+        Last-Event-ID, as a browser's EventSource would.
+        """
+        last_event_id = None
+        retry_seconds = 2.0
+        while True:
+            headers = {'Accept': 'text/event-stream'}
+            if last_event_id is not None:
+                headers['Last-Event-ID'] = last_event_id
+            response = self.session.get(f"{self.base_url}{events_url}", stream=True, timeout=TIMEOUT,
+                                        headers=headers)
+            with response:
+                if response.status_code != 200:
+                    raise ApiError(_error_message(response))
+                event, data = 'message', ''
+                for line in response.iter_lines(decode_unicode=True):
+                    if is_cancelled and is_cancelled():
+                        # The job keeps running on the server; only the wait is abandoned
+                        raise UploadCancelled()
+                    if line.startswith('event: '):
+                        event = line[len('event: '):]
+                    elif line.startswith('data: '):
+                        data += line[len('data: '):]
+                    elif line.startswith('id: '):
+                        last_event_id = line[len('id: '):]
+                    elif line.startswith('retry: ') and line[len('retry: '):].isdigit():
+                        retry_seconds = int(line[len('retry: '):]) / 1000
+                    elif not line and data:
+                        payload = json.loads(data)
+                        if event == 'done':
+                            return payload['summary']
+                        if event == 'failed':
+                            raise ApiError(payload.get('error') or "Upload failed.")
+                        if event == 'progress' and on_status:
+                            on_status(_describe_progress(payload))
+                        event, data = 'message', ''
+            # The stream ended with the job still running: reconnect
+            if is_cancelled and is_cancelled():
+                raise UploadCancelled()
+            time.sleep(retry_seconds)
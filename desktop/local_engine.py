@@ -0,0 +1,100 @@
+"""
+Offline analysis for the desktop client.
+
+When no backend is reachable, uploads are summarised locally with the same
+rules as the server's upload endpoint: required columns, numeric
+validation, count, NaN-skipping column means rounded to two decimals and
+the Type distribution (by count, ties in order of appearance). Only CSV
+is parsed here; columnar files (Parquet, Feather, Arrow) are rejected until
+the backend is reachable. The work runs in a separate process, so
+neither the GUI thread nor the worker threads hold the GIL for the pandas
+parse.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+REQUIRED_COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+NUMERIC_COLUMNS = ['Flowrate', 'Pressure', 'Temperature']
+CHUNK_ROWS = 100_000
+# Parquet, Arrow file, Feather v1 and Arrow stream, as the server's readers detect them
+COLUMNAR_MAGIC = (b'PAR1', b'ARROW1', b'FEA1', b'\xff\xff\xff\xff')
+
+
+class LocalAnalysisError(Exception):
+    """The file cannot be analysed; the message matches the server's."""
+
+
+def analyze(path, file_name=None):
+    """Summary payload for the CSV at `path`, in the upload endpoint's format."""
+    # Imported here: only the engine process needs pandas
+    import pandas as pd
+
+    total = 0
+    sums = dict.fromkeys(NUMERIC_COLUMNS, 0.0)
+    counts = dict.fromkeys(NUMERIC_COLUMNS, 0)
+    type_counts = {}
+    with open(path, 'rb') as f:
+        if f.read(8).startswith(COLUMNAR_MAGIC):
+            raise LocalAnalysisError('Columnar files need the server; only CSV files are analyzed offline')
+    try:
+        header = pd.read_csv(path, nrows=0, compression='infer').columns
+    except Exception as e:
+        raise LocalAnalysisError(f'Invalid CSV file: {str(e)}')
+    missing = [col for col in REQUIRED_COLUMNS if col not in header]
+    if missing:
+        raise LocalAnalysisError(f'Missing columns: {", ".join(missing)}')
+
+    dtypes = {'Type': 'category', **dict.fromkeys(NUMERIC_COLUMNS, 'float64')}
+    try:
+        for chunk in pd.read_csv(path, usecols=REQUIRED_COLUMNS, dtype=dtypes, chunksize=CHUNK_ROWS,
+                                 compression='infer'):
+            total += len(chunk)
+            for col in NUMERIC_COLUMNS:
+                sums[col] += float(chunk[col].sum())
+                counts[col] += int(chunk[col].count())
+            for type_name, count in chunk.groupby('Type', sort=False, observed=True).size().items():
+                type_counts[type_name] = type_counts.get(type_name, 0) + int(count)
+    except ValueError as e:
+        # Find which numeric column failed, for the same message as the server
+        for col in NUMERIC_COLUMNS:
+            for chunk in pd.read_csv(path, usecols=[col], dtype=str, chunksize=CHUNK_ROWS, compression='infer'):
+                if pd.to_numeric(chunk[col], errors='coerce').isna().sum() > chunk[col].isna().sum():
+                    raise LocalAnalysisError(f'Column {col} must be numeric')
+        raise LocalAnalysisError(f'Invalid CSV file: {str(e)}')
+
+    if not total:
+        raise LocalAnalysisError('File is empty')
+
+    def mean(col):
+        return round(sums[col] / counts[col], 2) if counts[col] else float('nan')
+
+    return {
+        "id": None,
+        "total_count": total,
+        "avg_flowrate": mean('Flowrate'),
+        "avg_pressure": mean('Pressure'),
+        "avg_temperature": mean('Temperature'),
+        "type_distribution": dict(sorted(type_counts.items(), key=lambda item: -item[1])),
+        "file_name": file_name or path.replace('\\', '/').split('/')[-1],
+        "uploaded_at": datetime.now(timezone.utc).isoformat(),
+        "offline": True,
+    }
+
+
+class LocalEngine:
+    """A single background process running analyze()."""
+
+    def __init__(self):
+        self._executor = None
+
+    def analyze(self, path):
+        """Blocking; call from a worker thread."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor.submit(analyze, path).result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,67 @@
+"""
+Background execution for the desktop client.
+
+Network calls run as Worker runnables on a QThreadPool so the GUI thread
+never blocks. A worker reports back only through its signals, which Qt
+delivers on the GUI thread, so slots may touch widgets freely.
+"""
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal, pyqtSlot
+
+from client import UploadCancelled
+
+
+class WorkerSignals(QObject):
+    status = pyqtSignal(str)
+    # Bytes done and total; qint64 because uploads may exceed 2 GiB
+    progress = pyqtSignal('qint64', 'qint64')
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    finished = pyqtSignal()
+
+
+class Worker(QRunnable):
+    """
+    Run `fn(*args, **kwargs)` on the pool and emit its outcome.
+
+    If `fn` accepts them, it is passed `on_progress`, `on_status` and
+    `is_cancelled` callables wired to this worker's signals and cancel flag.
+    """
+
+    def __init__(self, fn, *args, reports_progress=False, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self._cancel = threading.Event()
+        if reports_progress:
+            self.kwargs.update(on_progress=self.signals.progress.emit, on_status=self.signals.status.emit,
+                               is_cancelled=self._cancel.is_set)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    @pyqtSlot()
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except UploadCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.error.emit(str(e))
+        else:
+            if self.is_cancelled:
+                self.signals.cancelled.emit()
+            else:
+                self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
@@ -5,27 +5,110 @@ import {
   CategoryScale,
   LinearScale,
   BarElement,
+  LineElement,
+  PointElement,
   Title,
   Tooltip,
   Legend,
 } from 'chart.js';
-import { Bar } from 'react-chartjs-2';
+import { Bar, Line } from 'react-chartjs-2';
 import './App.css';
 
 ChartJS.register(
   CategoryScale,
   LinearScale,
   BarElement,
+  LineElement,
+  PointElement,
   Title,
   Tooltip,
   Legend
 );
 
+const TREND_COLUMNS = ['Flowrate', 'Pressure', 'Temperature'];
+// Server-side LTTB keeps the chart at this many points whatever the file size
+const TREND_POINTS = 1000;
+
 // Hardcoded credentials to match Desktop App (Basic Auth Only spec)
 const AUTH_CREDENTIALS = {
   username: 'admin',
   password: 'admin123'
 };
+const AUTH_HEADER = 'Basic ' + btoa(`${AUTH_CREDENTIALS.username}:${AUTH_CREDENTIALS.password}`);
+
+const formatBytes = (bytes) => {
+  if (bytes === null || bytes === undefined) return '?';
+  const units = ['B', 'KB', 'MB', 'GB'];
+  let value = bytes;
+  let unit = 0;
+  while (value >= 1024 && unit < units.length - 1) {
+    value /= 1024;
+    unit += 1;
+  }
+  return `${value.toFixed(unit ? 1 : 0)} ${units[unit]}`;
+};
+
+const describeProgress = (progress) => {
+  if (progress.phase === 'uploading') {
+    return `Uploading: ${formatBytes(progress.bytes_processed)} of ${formatBytes(progress.bytes_total)}`;
+  }
+  const rows = (progress.rows_processed || 0).toLocaleString();
+  const bytes = progress.bytes_total
+    ? ` (${formatBytes(progress.bytes_processed)} of ${formatBytes(progress.bytes_total)})`
+    : '';
+  return `${progress.phase.charAt(0).toUpperCase()}${progress.phase.slice(1)}: ${rows} rows${bytes}`;
+};
+
+// Follows /api/jobs/<id>/events/ (Server-Sent Events). EventSource cannot send
+// the Basic auth header, so the stream is read with fetch. The server closes a
+// stream after a while; it is then reopened with Last-Event-ID, as EventSource
+// would. Resolves with the upload summary once the job is done.
+const followJobEvents = async (eventsUrl, onProgress) => {
+  let lastEventId = null;
+  let retryMs = 2000;
+  for (;;) {
+    const headers = { Authorization: AUTH_HEADER, Accept: 'text/event-stream' };
+    if (lastEventId !== null) headers['Last-Event-ID'] = lastEventId;
+    const response = await fetch(eventsUrl, { headers });
+    if (!response.ok) {
+      throw new Error(`Progress stream failed (HTTP ${response.status})`);
+    }
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach((line) => {
+          if (line.startsWith('event: ')) event = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+          else if (line.startsWith('id: ')) lastEventId = line.slice(4);
+          else if (line.startsWith('retry: ')) retryMs = Number(line.slice(7)) || retryMs;
+        });
+        if (!data) continue; // retry: and keep-alive comments
+        const payload = JSON.parse(data);
+        if (event === 'progress') {
+          onProgress(payload);
+        } else if (event === 'done') {
+          reader.cancel();
+          return payload.summary;
+        } else if (event === 'failed') {
+          reader.cancel();
+          throw new Error(payload.error || 'Upload failed.');
+        }
+      }
+    }
+    // The stream ended with the job still running: reconnect
+    await new Promise((resolve) => setTimeout(resolve, retryMs));
+  }
+};
 
 function App() {
   const [file, setFile] = useState(null);
@@ -34,11 +117,34 @@ function App() {
   const [error, setError] = useState(null);
   const [message, setMessage] = useState(null);
   const [loading, setLoading] = useState(false);
+  const [progress, setProgress] = useState(null);
+  const [trendColumn, setTrendColumn] = useState('Pressure');
+  const [series, setSeries] = useState(null);
 
   useEffect(() => {
     fetchHistory();
   }, []);
 
+  useEffect(() => {
+    if (!summary || summary.id === undefined) {
+      setSeries(null);
+      return;
+    }
+    const fetchSeries = async () => {
+      try {
+        const response = await axios.get(`/api/series/${summary.id}/`, {
+          params: { column: trendColumn, points: TREND_POINTS },
+          auth: AUTH_CREDENTIALS
+        });
+        setSeries(response.data);
+      } catch (err) {
+        console.error("Failed to fetch series", err);
+        setSeries(null);
+      }
+    };
+    fetchSeries();
+  }, [summary, trendColumn]);
+
   const fetchHistory = async () => {
     try {
       const response = await axios.get('/api/history/', {
@@ -72,23 +178,34 @@ function App() {
     setSummary(null);
 
     try {
-      const response = await axios.post('/api/upload/', formData, {
+      // Processed in the background; progress comes from the job's event stream
+      const response = await axios.post('/api/upload/?mode=async', formData, {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
-        auth: AUTH_CREDENTIALS
+        auth: AUTH_CREDENTIALS,
+        onUploadProgress: (event) => setProgress({
+          phase: 'uploading', bytes_processed: event.loaded, bytes_total: event.total
+        })
       });
-      setSummary(response.data);
+      // 200: same file as a stored upload, answered at once
+      const result = response.status === 202
+        ? await followJobEvents(response.data.events_url, setProgress)
+        : response.data;
+      setSummary(result);
       setMessage("Upload successful!");
       fetchHistory(); // Refresh history
     } catch (err) {
       if (err.response && err.response.data && err.response.data.error) {
         setError(err.response.data.error);
+      } else if (!err.response && err.message) {
+        setError(err.message);
       } else {
         setError("An unexpected error occurred during upload.");
       }
     } finally {
       setLoading(false);
+      setProgress(null);
     }
   };
 
@@ -140,6 +257,22 @@ function App() {
     ],
   } : null;
 
+  const trendData = series ? {
+    labels: series.x_kind === 'timestamp'
+      ? series.x.map((t) => new Date(t).toLocaleString())
+      : series.x.map((row) => row + 1),
+    datasets: [
+      {
+        label: series.column,
+        data: series.y,
+        borderColor: 'rgba(255, 99, 132, 0.8)',
+        backgroundColor: 'rgba(255, 99, 132, 0.3)',
+        borderWidth: 1,
+        pointRadius: 0,
+      },
+    ],
+  } : null;
+
   return (
     <div className="dashboard-container">
       <nav className="dashboard-nav">
@@ -159,7 +292,7 @@ function App() {
             <h3>Data Upload</h3>
             <form onSubmit={handleUpload} className="upload-form">
               <label className="file-input-label">
-                <input type="file" accept=".csv" onChange={handleFileChange} />
+                <input type="file" accept=".csv,.parquet,.feather,.arrow,.arrows" onChange={handleFileChange} />
                 <span className="file-cta">
                   {file ? file.name : "Choose CSV File..."}
                 </span>
@@ -169,6 +302,7 @@ function App() {
               </button>
             </form>
           </div>
+          {progress && <div className="alert alert-info">{describeProgress(progress)}</div>}
           {error && <div className="alert alert-error">{error}</div>}
           {message && <div className="alert alert-success">{message}</div>}
         </section>
@@ -251,6 +385,39 @@ function App() {
                 </div>
               </section>
             </div>
+
+            {trendData && (
+              <section className="panel chart-panel">
+                <div className="panel-header">
+                  <h3>{series.column} Trend</h3>
+                  <select value={trendColumn} onChange={(e) => setTrendColumn(e.target.value)}>
+                    {TREND_COLUMNS.map((column) => (
+                      <option key={column} value={column}>{column}</option>
+                    ))}
+                  </select>
+                </div>
+                <div className="chart-container">
+                  <Line data={trendData} options={{
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    animation: false,
+                    plugins: {
+                      legend: { display: false },
+                      title: {
+                        display: series.points < series.total_points,
+                        text: `${series.points} of ${series.total_points} readings`
+                      }
+                    },
+                    scales: {
+                      x: {
+                        title: { display: true, text: series.x_kind === 'timestamp' ? 'Time' : 'Row' },
+                        ticks: { maxTicksLimit: 8 }
+                      }
+                    }
+                  }} />
+                </div>
+              </section>
+            )}
           </div>
         )}
       </main>